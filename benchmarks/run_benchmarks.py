@@ -0,0 +1,275 @@
+"""
+Benchmark the preprocessing, splitting, scoring and training paths
+on synthetic raw listings of increasing size.
+
+Usage (from the repository root):
+    python -m benchmarks.run_benchmarks --sizes 100000 1000000 10000000
+    python -m benchmarks.run_benchmarks --compare benchmarks/results/<run>.json
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+from datetime import datetime
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+import numpy as np  # noqa: E402
+import polars as pl  # noqa: E402
+import sklearn  # noqa: E402
+
+import config  # noqa: E402
+from benchmarks.synthetic import write_raw_listings  # noqa: E402
+from src.profiling import stage  # noqa: E402
+
+RESULTS_DIR = os.path.join(REPO_ROOT, "benchmarks", "results")
+DEFAULT_SIZES = [100_000, 1_000_000]
+
+# Number of single compare_land lookups timed per size
+N_LOOKUPS = 1_000
+
+# Number of candidates scored in one batch
+N_CANDIDATES = 100_000
+
+# Model training is only timed up to this many raw rows
+MODEL_MAX_ROWS = 1_000_000
+
+# A benchmark is flagged when it gets this much slower than the baseline
+REGRESSION_THRESHOLD = 1.2
+
+# Wall time budget of a single `python -m src.cli score` lookup,
+# process startup included
+CLI_SCORE_BUDGET_S = 1.0
+
+
+def _environment():
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=REPO_ROOT,
+            capture_output=True,
+            text=True,
+        ).stdout.strip()
+    except OSError:
+        commit = None
+
+    return {
+        "commit": commit or None,
+        "python": platform.python_version(),
+        "polars": pl.__version__,
+        "numpy": np.__version__,
+        "scikit-learn": sklearn.__version__,
+        "cpu_count": os.cpu_count(),
+        "platform": platform.platform(),
+    }
+
+
+def run_size(n_rows, results, seed=config.SEED):
+    """
+    Run every benchmark on `n_rows` synthetic raw listings.
+    Must be called from an empty working directory, since
+    the dataset paths in config.py are relative.
+    """
+    from s01_preprocess import preprocess_pipeline
+    from s02_data_split import split_data_pipeline
+    from src.compare_real_estate import compare_land
+    from src.nearest_comparables import get_nearest_comparables
+    from src.scoring import score_listings
+    from src.storage import read_dataset
+    from models.gradient_boosting import run_hist_gradient_boosting
+    from models.random_forest import run_random_forest
+    from models.registry import get_model, model_path
+
+    def timed(name):
+        @contextlib.contextmanager
+        def wrapper():
+            with stage(f"bench:{name}") as record:
+                yield record
+            results.append({"benchmark": name, "n_rows": n_rows, **record.as_dict()})
+            print(f"{name:<28} n={n_rows:>10,}  {record.wall_s:>9.3f}s")
+
+        return wrapper()
+
+    write_raw_listings(n_rows, config.RAW_DATA_PATH, seed=seed)
+
+    # Preprocessing (the streamed datasets are overwritten by the eager run)
+    with timed("preprocess:streaming") as record:
+        preprocess_pipeline(streaming=True)
+        record.rows_in = n_rows
+
+    with timed("preprocess") as record:
+        cleaned, _, _ = preprocess_pipeline()
+        record.rows_in = n_rows
+        record.rows_out = sum(df.height for df in cleaned.values())
+
+    # Data split
+    df_house = read_dataset(config.HOUSE_DATA_PATH, to_pandas=True)
+    with timed("split_data_pipeline") as record:
+        split = split_data_pipeline(
+            df_house,
+            "District",
+            config.CROSS_VAL_HOUSE_PATH,
+            data_path=config.HOUSE_DATA_PATH,
+        )
+        record.rows_in = record.rows_out = len(df_house)
+
+    # Single lookups (the first one loads the group statistics store)
+    df_land = cleaned["land"]
+    rng = np.random.default_rng(seed)
+    picks = df_land.select("District", "City").to_numpy()
+    picks = picks[rng.integers(0, len(picks), N_LOOKUPS)]
+    quiet = contextlib.redirect_stdout(io.StringIO())
+    with timed("compare_land:first"), quiet:
+        compare_land({"District": picks[0][0], "AreaAssigned": 1000, "Price": 1e5})
+    with timed(f"compare_land:x{N_LOOKUPS}"), quiet:
+        for district, city in picks:
+            compare_land(
+                {
+                    "District": district,
+                    "City": city,
+                    "AreaAssigned": 1000,
+                    "Price": 1e5,
+                }
+            )
+
+    # Single lookup from the command line, in a fresh interpreter
+    listing = {
+        "Type": "Land",
+        "District": picks[0][0],
+        "City": picks[0][1],
+        "AreaAssigned": 1000,
+        "Price": 1e5,
+    }
+    command = [sys.executable, "-m", "src.cli", "score"]
+    with timed("cli:score") as record:
+        subprocess.run(
+            command + ["--listing", json.dumps(listing)],
+            env={**os.environ, "PYTHONPATH": REPO_ROOT},
+            check=True,
+            capture_output=True,
+        )
+    if record.wall_s > CLI_SCORE_BUDGET_S:
+        print(f"cli:score is over its {CLI_SCORE_BUDGET_S:.1f}s startup budget")
+
+    # Nearest comparables (the first query builds and saves the KD-trees)
+    queries = df_house.sample(N_LOOKUPS, replace=True, random_state=seed)
+    queries = queries.to_dict("records")
+    with timed("nearest_comparables:first"):
+        nearest = get_nearest_comparables("House")
+    with timed(f"nearest_comparables:x{N_LOOKUPS}"):
+        for listing in queries:
+            nearest.query(listing)
+
+    # Batch scoring
+    candidates = pl.concat(
+        [
+            df.select("District", "City", "Price", "AreaAssigned").with_columns(
+                pl.lit(real_estate_type).alias("Type")
+            )
+            for real_estate_type, df in (
+                ("Land", cleaned["land"]),
+                ("House", cleaned["buildings"].filter(pl.col("Type") == "House")),
+                (
+                    "Apartment",
+                    cleaned["buildings"].filter(pl.col("Type") == "Apartment"),
+                ),
+            )
+        ]
+    )
+    candidates = candidates.sample(N_CANDIDATES, with_replacement=True, seed=seed)
+    with timed("score_listings") as record:
+        record.rows_in = record.rows_out = score_listings(candidates).height
+
+    # Model training, then batch prediction with the saved model
+    if n_rows <= MODEL_MAX_ROWS:
+        with timed("run_random_forest") as record, quiet:
+            run_random_forest(split, save_path=model_path("House"))
+            record.rows_in = len(df_house)
+
+        with timed("run_hist_gradient_boosting") as record, quiet:
+            run_hist_gradient_boosting(split)
+            record.rows_in = len(df_house)
+
+        house_candidates = candidates.filter(pl.col("Type") == "House")
+        with timed("predict_fair_price") as record:
+            get_model("House").predict(house_candidates)
+            record.rows_in = record.rows_out = house_candidates.height
+
+
+def compare_runs(results, baseline_path, threshold=REGRESSION_THRESHOLD):
+    """
+    Print the wall-time ratio of each benchmark against a baseline
+    run and return the benchmarks that regressed.
+    """
+    with open(baseline_path) as f:
+        baseline = {(r["benchmark"], r["n_rows"]): r for r in json.load(f)["results"]}
+
+    regressions = []
+    print(f"\nComparison with {os.path.relpath(baseline_path)}")
+    for r in results:
+        old = baseline.get((r["benchmark"], r["n_rows"]))
+        if old is None or not old["wall_s"]:
+            continue
+        ratio = r["wall_s"] / old["wall_s"]
+        flag = "  REGRESSION" if ratio > threshold else ""
+        print(
+            f"{r['benchmark']:<28} n={r['n_rows']:>10,}  "
+            f"{old['wall_s']:>9.3f}s -> {r['wall_s']:>9.3f}s  x{ratio:.2f}{flag}"
+        )
+        if flag:
+            regressions.append(r)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES)
+    parser.add_argument("--seed", type=int, default=config.SEED)
+    parser.add_argument("--compare", help="results file of a previous run")
+    parser.add_argument("--workdir", help="where the synthetic data is written")
+    parser.add_argument("--keep", action="store_true", help="keep the data")
+    args = parser.parse_args()
+
+    results = []
+    started = datetime.now()
+    cwd = os.getcwd()
+
+    for n_rows in args.sizes:
+        workdir = tempfile.mkdtemp(prefix=f"cribs-bench-{n_rows}-", dir=args.workdir)
+        os.chdir(workdir)
+        try:
+            run_size(n_rows, results, seed=args.seed)
+        finally:
+            os.chdir(cwd)
+            if not args.keep:
+                shutil.rmtree(workdir, ignore_errors=True)
+
+    # Store the results of this run
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    path = os.path.join(RESULTS_DIR, f"bench-{started:%Y%m%d-%H%M%S}.json")
+    with open(path, "w") as f:
+        json.dump(
+            {
+                "started": started.isoformat(timespec="seconds"),
+                "environment": _environment(),
+                "results": results,
+            },
+            f,
+            indent=2,
+        )
+    print(f"\nResults saved to: {os.path.relpath(path)}")
+
+    if args.compare and compare_runs(results, args.compare):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+import os
+
+import numpy as np
+import polars as pl
+
+import config
+from src.regions import DISTRICT_TO_REGION
+
+# Districts of the generated listings (plus one outside the reference table)
+DISTRICTS = list(DISTRICT_TO_REGION) + ["Z - Fora de Portugal"]
+
+# Share of listings per real estate type
+TYPES = {"Apartment": 0.45, "House": 0.3, "Land": 0.2, "Store": 0.05}
+
+ENERGY_CERTIFICATES = ["A+", "A", "B", "B-", "C", "D", "E", "F", "No Certificate"]
+
+# Number of cities and towns generated per district / city
+CITIES_PER_DISTRICT = 12
+TOWNS_PER_CITY = 4
+
+
+def _with_nulls(rng, values, null_rate):
+    """
+    Series of `values` where a `null_rate` share is missing.
+    """
+    series = pl.Series(values)
+    missing = np.flatnonzero(rng.random(len(values)) < null_rate)
+    return series.scatter(missing, None) if len(missing) else series
+
+
+def generate_raw_listings(n_rows, seed=config.SEED, chunk=0):
+    """
+    Generate `n_rows` synthetic raw listings with the schema that
+    s01_preprocess expects. Prices depend on the district, type, area
+    and construction year, so the models have some signal to learn.
+    District popularity and price levels depend only on `seed`, so
+    chunks (different `chunk`) of one dataset are consistent.
+    """
+    profile_rng = np.random.default_rng(seed)
+    district_weights = profile_rng.dirichlet(np.full(len(DISTRICTS), 0.7))
+    district_levels = profile_rng.normal(0, 0.5, len(DISTRICTS))
+    rng = np.random.default_rng([seed, chunk])
+
+    # Location, with a skewed district popularity
+    district_idx = rng.choice(len(DISTRICTS), n_rows, p=district_weights)
+    city_idx = rng.integers(0, CITIES_PER_DISTRICT, n_rows)
+    town_idx = rng.integers(0, TOWNS_PER_CITY, n_rows)
+    districts = np.array(DISTRICTS)[district_idx]
+    cities = np.char.add(np.char.add(districts, " City "), city_idx.astype(str))
+    towns = np.char.add(np.char.add(cities, " Town "), town_idx.astype(str))
+
+    # Type and size
+    types = rng.choice(list(TYPES), n_rows, p=list(TYPES.values()))
+    is_land = types == "Land"
+    living_area = np.round(rng.lognormal(4.6, 0.45, n_rows))
+    total_area = np.where(
+        is_land, np.round(rng.lognormal(7.5, 1.0, n_rows)), living_area * 1.3
+    )
+    bedrooms = rng.integers(0, 6, n_rows).astype(float)
+    construction_year = rng.integers(1900, 2025, n_rows).astype(float)
+
+    # Price per m2 from a district level, type and age effect and noise
+    district_level = district_levels[district_idx]
+    type_level = np.where(is_land, 5.0, np.where(types == "House", 7.3, 7.7))
+    age_effect = (construction_year - 1960) / 200
+    price_per_sqm = np.exp(
+        type_level + district_level + age_effect + rng.normal(0, 0.35, n_rows)
+    )
+    area_priced = np.where(is_land, total_area, living_area)
+    price = np.round(price_per_sqm * area_priced, -3)
+
+    return pl.DataFrame(
+        {
+            "Price": _with_nulls(rng, price, 0.01),
+            "District": districts,
+            "City": cities,
+            "Town": towns,
+            "Type": types,
+            "EnergyCertificate": _with_nulls(
+                rng, rng.choice(ENERGY_CERTIFICATES, n_rows), 0.02
+            ),
+            "GrossArea": _with_nulls(rng, total_area * 1.1, 0.5),
+            "TotalArea": _with_nulls(rng, total_area, 0.05),
+            "LivingArea": _with_nulls(rng, np.where(is_land, 0, living_area), 0.05),
+            "LotSize": _with_nulls(rng, total_area, 0.8),
+            "BuiltArea": _with_nulls(rng, living_area, 0.8),
+            "NumberOfBedrooms": _with_nulls(rng, bedrooms, 0.1),
+            "TotalRooms": _with_nulls(rng, bedrooms + 1, 0.1),
+            "NumberOfWC": _with_nulls(rng, rng.integers(0, 3, n_rows) * 1.0, 0.5),
+            "NumberOfBathrooms": _with_nulls(
+                rng, rng.integers(1, 4, n_rows) * 1.0, 0.03
+            ),
+            "Parking": rng.integers(0, 3, n_rows) * 1.0,
+            "HasParking": rng.random(n_rows) < 0.5,
+            "Floor": _with_nulls(rng, rng.integers(0, 10, n_rows).astype(str), 0.5),
+            "ConstructionYear": _with_nulls(rng, construction_year, 0.03),
+            "EnergyEfficiencyLevel": _with_nulls(
+                rng, rng.choice(["A", "B", "C"], n_rows), 0.9
+            ),
+            "PublishDate": np.full(n_rows, "2025-01-01"),
+            "Garage": _with_nulls(rng, rng.random(n_rows) < 0.4, 0.3),
+            "Elevator": rng.random(n_rows) < 0.5,
+            "ElectricCarsCharging": rng.random(n_rows) < 0.05,
+            "ConservationStatus": _with_nulls(
+                rng, rng.choice(["Good", "New", "Used"], n_rows), 0.7
+            ),
+        }
+    )
+
+
+def write_raw_listings(n_rows, path, seed=config.SEED, chunk_size=1_000_000):
+    """
+    Write synthetic raw listings to a CSV in chunks of `chunk_size`
+    rows, so large sizes do not have to fit in memory at once.
+    """
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "wb") as f:
+        for chunk, start in enumerate(range(0, n_rows, chunk_size)):
+            df = generate_raw_listings(min(chunk_size, n_rows - start), seed, chunk)
+            df.write_csv(f, include_header=chunk == 0)
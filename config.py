@@ -2,23 +2,267 @@
 # --- DATASET PATHS --- #
 #########################
 RAW_DATA_PATH = "data/raw/raw-data.csv"
-BUILD_DATA_PATH = "data/clean/buildings-data.csv"
-LAND_DATA_PATH = "data/clean/land-data.csv"
 
-HOUSE_DATA_PATH = "data/clean/house-data.csv"
-APT_DATA_PATH = "data/clean/apartment-data.csv"
+# Clean datasets are Parquet datasets partitioned by PARTITION_COLS
+BUILD_DATA_PATH = "data/clean/buildings-data.parquet"
+LAND_DATA_PATH = "data/clean/land-data.parquet"
+
+HOUSE_DATA_PATH = "data/clean/house-data.parquet"
+APT_DATA_PATH = "data/clean/apartment-data.parquet"
+
+PARTITION_COLS = ["Region", "District"]
+
+# Also write a CSV copy (e.g. `house-data.csv`) next to each dataset
+EXPORT_CSV = False
+
+# Build manifest used to skip stages whose inputs did not change
+MANIFEST_PATH = "data/manifest.json"
+
+#########################
+# --- PREPROCESSING --- #
+#########################
+# Process the raw data in batches with the Polars streaming engine,
+# for raw files that do not fit in memory
+STREAMING = False
+
+# Rows per streamed batch, lower values reduce the peak memory
+# (None lets Polars pick one from the number of columns and threads)
+STREAMING_CHUNK_SIZE = 50_000
+
+# Least deduplicated listings a District (per real estate type) must have
+MIN_GROUP_SUPPORT = {"buildings": 60, "land": 5}
+# Smaller ones are dropped ("drop") or renamed "<Region> (other)" ("rollup")
+SMALL_GROUP_POLICY = "drop"
+
+# Size of every location group of the cleaned datasets in the last run
+GROUP_CARDINALITY_REPORT_PATH = "logs/group-cardinality.csv"
+
+# Cleaning rules of each branch (see src/cleaning_rules.py), applied
+# before ("base") and after ("final") the outlier filter
+CLEANING_RULES = {
+    "buildings": {
+        "base": [
+            {
+                "name": "drop_empty_columns",
+                "kind": "drop_columns",
+                "columns": [
+                    "GrossArea",
+                    "TotalArea",
+                    "LivingArea",
+                    "HasParking",
+                    "Floor",
+                    "EnergyEfficiencyLevel",
+                    "PublishDate",
+                    "NumberOfBedrooms",
+                    "TotalRooms",
+                    "NumberOfWC",
+                    "ConservationStatus",
+                    "ElectricCarsCharging",
+                    "LotSize",
+                    "BuiltArea",
+                ],
+            },
+            {
+                "name": "keep_building_types",
+                "kind": "keep_values",
+                "column": "Type",
+                "values": ["Apartment", "House"],
+            },
+            {
+                "name": "drop_foreign_listings",
+                "kind": "drop_values",
+                "column": "District",
+                "values": ["Z - Fora de Portugal"],
+            },
+            {
+                "name": "missing_garage_is_false",
+                "kind": "fill_null",
+                "column": "Garage",
+                "value": False,
+            },
+            {"name": "drop_incomplete_rows", "kind": "drop_nulls"},
+        ],
+        "final": [
+            {
+                "name": "energy_certificate_codes",
+                "kind": "replace",
+                "column": "EnergyCertificate",
+                "mapping": {"No Certificate": "NC"},
+            },
+            {
+                "name": "small_districts",
+                "kind": "min_support",
+                "column": "District",
+                "by": ["Type"],
+                "min_count": MIN_GROUP_SUPPORT["buildings"],
+                "policy": SMALL_GROUP_POLICY,
+                "parent": "Region",
+            },
+        ],
+    },
+    "land": {
+        "base": [
+            {
+                "name": "keep_land",
+                "kind": "keep_values",
+                "column": "Type",
+                "values": ["Land"],
+            },
+            {
+                "name": "keep_land_columns",
+                "kind": "select_columns",
+                "columns": ["Price", "District", "City", "AreaAssigned", "PricePerSqm"],
+            },
+            {"name": "drop_incomplete_rows", "kind": "drop_nulls"},
+        ],
+        "final": [
+            {
+                "name": "drop_foreign_listings",
+                "kind": "drop_values",
+                "column": "District",
+                "values": ["Z - Fora de Portugal"],
+            },
+            {
+                "name": "small_districts",
+                "kind": "min_support",
+                "column": "District",
+                "min_count": MIN_GROUP_SUPPORT["land"],
+                "policy": SMALL_GROUP_POLICY,
+                "parent": "Region",
+            },
+        ],
+    },
+}
+
+# Listings of the same block (same values of these columns) whose columns
+# all differ by at most these shares of their values are near-duplicates
+# (a zero tolerance requires equal values). Each cluster only holds the
+# listings close to its first one, which is kept (see src/deduplication.py)
+DEDUP_BLOCK_COLS = ["Type", "District", "City"]
+DEDUP_TOLERANCES = {"Price": 0.02, "AreaAssigned": 0.02, "RoomsAssigned": 0}
+
+# Block columns the streamed listings are split on before they are
+# compared, so only one partition of them is in memory at a time
+DEDUP_PARTITION_COLS = ["Type", "District"]
+
+# Neighbours each listing is compared with, once sorted on each column
+DEDUP_WINDOW = 5
+
+# Near-duplicate clusters found in the last run
+DUPLICATES_REPORT_PATH = "logs/duplicate-clusters.parquet"
+
+# Outliers of the log-price within the groups of OUTLIER_GROUP_COLS
+# (any of Type, District and City) are removed (see src/outliers.py),
+# with the threshold of the method: "zscore" (standard deviations from
+# the mean), "mad" (scaled MADs from the median) or "iqr" (interquartile
+# ranges beyond the quartiles)
+OUTLIER_METHOD = "zscore"
+OUTLIER_GROUP_COLS = ["District"]
+OUTLIER_THRESHOLDS = {"zscore": 3, "mad": 3, "iqr": 1.5}
+
+# Rows removed by each cleaning rule in the last run
+CLEANING_REPORT_PATH = "logs/cleaning-report.json"
 
 #####################
 # --- CONSTANTS --- #
 #####################
 SEED = 42
 
+# Location columns defining a group of comparable listings
+COMPARABLE_KEYS = ["Region", "District", "City"]
+
+# Groups with fewer listings back off to their parent group (City ->
+# District -> Region) when listings are scored (see src/scoring.py)
+COMPARABLE_MIN_SUPPORT = 10
+
 ############################
 # --- CROSS-VALIDATION --- #
 ############################
-CROSS_VAL_LAND_PATH = "data/cross-val/folds_land.pkl"
-CROSS_VAL_HOUSE_PATH = "data/cross-val/folds_house.pkl"
-CROSS_VAL_APT_PATH = "data/cross-val/folds_apt.pkl"
+# Splits are stored as row indices of the clean datasets (see src/folds.py)
+CROSS_VAL_LAND_PATH = "data/cross-val/folds_land.npz"
+CROSS_VAL_HOUSE_PATH = "data/cross-val/folds_house.npz"
+CROSS_VAL_APT_PATH = "data/cross-val/folds_apt.npz"
 
 N_SPLITS = 5
 TEST_SIZE = 0.2
+
+#####################
+# --- PROFILING --- #
+#####################
+# Machine-readable report of every stage (wall/CPU time, RSS, rows)
+PROFILE_REPORT_PATH = "logs/stage-report.json"
+
+# Interval of the RSS samples taken during a stage, for its own peak
+RSS_SAMPLE_INTERVAL_S = 0.01
+
+# Also dump cProfile stats and Polars query plans/timings per stage
+PROFILE_STAGES = False
+PROFILE_DIR = "logs/profile"
+
+############################
+# --- GROUP STATISTICS --- #
+############################
+# Mergeable price statistics per group (see src/group_stats.py),
+# of the listings before the outlier filter and of the clean datasets
+BASE_STATS_PATH = "data/stats/base-stats"
+CLEAN_STATS_PATH = "data/stats/clean-stats"
+
+GROUP_STATS_KEYS = ["Type", "Region", "District", "City"]
+
+# Quantiles of the sketches are within this relative error
+SKETCH_RELATIVE_ACCURACY = 0.01
+
+###############################
+# --- NEAREST COMPARABLES --- #
+###############################
+# Listing attributes compared per real estate type (see src/nearest_comparables.py)
+KNN_FEATURES = {
+    "Land": ["AreaAssigned"],
+    "House": ["AreaAssigned", "RoomsAssigned", "ConstructionYear", "NumberOfBathrooms"],
+    "Apartment": [
+        "AreaAssigned",
+        "RoomsAssigned",
+        "ConstructionYear",
+        "NumberOfBathrooms",
+    ],
+}
+
+# Distance added (in standard deviations of the attributes) when a
+# listing lies in another City / District / Region than the query
+KNN_LOCATION_PENALTY = {"City": 0.5, "District": 1.0, "Region": 2.0}
+
+# Number of nearest comparables returned, and where the indexes are kept
+KNN_K = 10
+KNN_INDEX_DIR = "data/index"
+
+###################
+# --- SERVICE --- #
+###################
+# Address of the local scoring service (see src/service.py)
+SERVICE_HOST = "127.0.0.1"
+SERVICE_PORT = 8765
+
+# Seconds between checks for newly published datasets / statistics
+SERVICE_RELOAD_INTERVAL = 5.0
+
+##################
+# --- MODELS --- #
+##################
+# Trained models with their encoders and metadata (see models/registry.py)
+MODEL_DIR = "data/models"
+
+# Rows encoded and predicted per task of a batch prediction
+PREDICT_CHUNK_SIZE = 50_000
+
+##################
+# --- TUNING --- #
+##################
+# Results of the hyperparameter searches, one JSONL file per engine and
+# real estate type, appended as configurations are evaluated (see models/tuning.py)
+TUNING_DIR = "data/tuning"
+
+# Successive halving: configurations sampled, share of them kept per
+# rung (1 / eta) and share of the training rows they are first fitted on
+TUNING_N_CONFIGS = 27
+TUNING_ETA = 3
+TUNING_MIN_FRACTION = 1 / 9
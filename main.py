@@ -1,27 +1,59 @@
-# Import libraries
-import pandas as pd
-
 # Import dependencies
 import config
-from s01_preprocess import preprocess_pipeline_buildings, preprocess_pipeline_land
-from s02_data_split import split_data_pipeline
+from src.manifest import BuildManifest
+from src.profiling import REPORT, stage
+
 
+def run_pipelines(dpp=True, force=False, split=True):
+    """
+    Run the data pipelines.
+    Stages whose inputs did not change since the last
+    run (see the build manifest) are skipped unless `force`.
+    Stage timings are written to config.PROFILE_REPORT_PATH.
+    """
+    manifest = BuildManifest()
+    REPORT.clear()
 
-def run_pipelines(dpp=True):
-    # Run data preprocessing pipeline
+    # Run data preprocessing pipeline (single scan for buildings and land)
     if dpp:
-        preprocess_pipeline_land()
-        preprocess_pipeline_buildings()
-
-    # Load cleaned data
-    df_house = pd.read_csv(config.HOUSE_DATA_PATH)
-    df_apt = pd.read_csv(config.APT_DATA_PATH)
-    df_land = pd.read_csv(config.LAND_DATA_PATH)
-
-    # Run data split pipeline for buildings
-    split_data_pipeline(df_house, "District", config.CROSS_VAL_HOUSE_PATH)
-    split_data_pipeline(df_apt, "District", config.CROSS_VAL_APT_PATH)
-    split_data_pipeline(df_land, "District", config.CROSS_VAL_LAND_PATH)
+        from s01_preprocess import run_preprocess_stage
+
+        with stage("preprocess"):
+            run_preprocess_stage(manifest, force=force)
+        manifest.save()
+
+    # Run data split pipeline for buildings and land
+    if split:
+        from s02_data_split import run_split_stage
+
+        run_split_stage(
+            manifest,
+            "house",
+            config.HOUSE_DATA_PATH,
+            "District",
+            config.CROSS_VAL_HOUSE_PATH,
+            force=force,
+        )
+        run_split_stage(
+            manifest,
+            "apt",
+            config.APT_DATA_PATH,
+            "District",
+            config.CROSS_VAL_APT_PATH,
+            force=force,
+        )
+        run_split_stage(
+            manifest,
+            "land",
+            config.LAND_DATA_PATH,
+            "District",
+            config.CROSS_VAL_LAND_PATH,
+            force=force,
+        )
+        manifest.save()
+
+    # Save the stage report
+    REPORT.write(config.PROFILE_REPORT_PATH)
 
     return None
 
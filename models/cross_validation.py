@@ -0,0 +1,170 @@
+from concurrent.futures import ProcessPoolExecutor
+from sklearn.metrics import mean_squared_error, r2_score
+from threadpoolctl import threadpool_limits
+import numpy as np
+import os
+import pickle
+import time
+
+from models.features import FeatureMatrix
+
+# Feature matrix of the current worker process (see _init_worker)
+_FEATURES = None
+
+
+def split_cores(n_tasks, n_workers=None):
+    """
+    Split the available cores between concurrent tasks and the
+    threads of each task, so that workers x threads <= cores.
+
+    Returns:
+        tuple: (number of worker processes, n_jobs per worker)
+    """
+    n_cores = os.cpu_count() or 1
+    n_workers = max(1, min(n_workers or n_tasks, n_tasks, n_cores))
+    return n_workers, max(1, n_cores // n_workers)
+
+
+def evaluate(y_true, y_pred):
+    """
+    RMSE and R2 of a set of predictions.
+    """
+    return {
+        "rmse": float(np.sqrt(mean_squared_error(y_true, y_pred))),
+        "r2": float(r2_score(y_true, y_pred)),
+    }
+
+
+class _ByteCounter:
+    # File-like object counting the bytes written to it
+    def __init__(self):
+        self.size = 0
+
+    def write(self, data):
+        self.size += memoryview(data).nbytes
+
+
+def model_size_mb(model):
+    """
+    Size of a model once pickled, without keeping the pickle in memory.
+    """
+    counter = _ByteCounter()
+    pickle.dump(model, counter, protocol=pickle.HIGHEST_PROTOCOL)
+    return counter.size / 2**20
+
+
+def _init_worker(features, n_jobs):
+    # The matrix is sent once per worker, folds only send row indices
+    global _FEATURES
+    _FEATURES = features
+
+    # Models without n_jobs (OpenMP) get the same share of the cores
+    threadpool_limits(n_jobs)
+
+
+def _fit_timed(model, X_train, y_train, X_eval, y_eval):
+    """
+    Fit and evaluate a model, timing the fit and the predictions.
+    """
+    start = time.perf_counter()
+    model.fit(X_train, y_train)
+    fit_s = time.perf_counter() - start
+
+    start = time.perf_counter()
+    y_pred = model.predict(X_eval)
+    predict_s = time.perf_counter() - start
+
+    return {
+        **evaluate(y_eval, y_pred),
+        "fit_s": fit_s,
+        "predict_us_per_row": 1e6 * predict_s / max(len(X_eval), 1),
+    }
+
+
+def _fit_and_evaluate(make_model, train_idx, eval_idx, n_jobs, features=None):
+    """
+    Fit `make_model(n_jobs)` on the training rows and evaluate it.
+    """
+    features = features if features is not None else _FEATURES
+    X_train, y_train, X_eval, y_eval = features.fold(train_idx, eval_idx)
+    return _fit_timed(make_model(n_jobs), X_train, y_train, X_eval, y_eval)
+
+
+def cross_validate(make_model, split, features=None, n_workers=None, save_path=None):
+    """
+    Cross-validate a model on a saved split, then fit it on all
+    training rows and evaluate it on the test set.
+
+    Args:
+        make_model (callable): Returns a new model given its n_jobs.
+        split (FoldSplit): Row indices of the folds and test set.
+        features (FeatureMatrix): Encoded dataset (built from the split if None).
+        n_workers (int): Number of folds fitted at the same time (default: all).
+        save_path (str): If given, the final model is saved there with its
+            encoders and metadata (see models/registry.py).
+
+    Returns:
+        results (dict): "folds" with RMSE and R2 for each fold, and
+            "test" with RMSE and R2 on the test set, both with the fit
+            time (s) and the prediction latency (us per row), and the
+            size (MB) of the final model in "test".
+    """
+    if features is None:
+        features = FeatureMatrix(split.df)
+
+    # Split cores between folds and the threads of each model
+    n_workers, n_jobs = split_cores(len(split), n_workers)
+    fold_indices = list(zip(split.train_idx, split.val_idx))
+
+    if n_workers == 1:
+        fold_results = [
+            _fit_and_evaluate(make_model, train_idx, val_idx, n_jobs, features)
+            for train_idx, val_idx in fold_indices
+        ]
+    else:
+        with ProcessPoolExecutor(
+            max_workers=n_workers,
+            initializer=_init_worker,
+            initargs=(features, n_jobs),
+        ) as pool:
+            futures = [
+                pool.submit(_fit_and_evaluate, make_model, train_idx, val_idx, n_jobs)
+                for train_idx, val_idx in fold_indices
+            ]
+            fold_results = [future.result() for future in futures]
+
+    # Initialize results list
+    results = []
+    for fold_idx, result in enumerate(fold_results):
+        results.append({"fold": fold_idx, **result})
+        print(
+            f"Fold {fold_idx}: RMSE={result['rmse']:.2f}, R2={result['r2']:.2f}, "
+            f"fit={result['fit_s']:.1f}s"
+        )
+
+    # Final fit on all training data (the folds' validation sets cover it)
+    train_val_idx = np.concatenate(split.val_idx)
+    X_train, y_train, X_test, y_test = features.fold(train_val_idx, split.test_idx)
+    model = make_model(-1)
+    test_result = _fit_timed(model, X_train, y_train, X_test, y_test)
+    test_result["size_mb"] = model_size_mb(model)
+    print(
+        f"Test: RMSE={test_result['rmse']:.2f}, R2={test_result['r2']:.2f}, "
+        f"fit={test_result['fit_s']:.1f}s, "
+        f"predict={test_result['predict_us_per_row']:.1f}us/row, "
+        f"size={test_result['size_mb']:.1f}MB"
+    )
+
+    if save_path is not None:
+        from models.registry import TrainedModel
+
+        metadata = {
+            "data_path": split.data_path,
+            "source_hash": split.source_hash,
+            "n_train": len(train_val_idx),
+            "test": test_result,
+        }
+        TrainedModel(model, features.encoder(train_val_idx), metadata).save(save_path)
+        print(f"Model saved to: {os.path.relpath(save_path)}")
+
+    return {"folds": results, "test": test_result}
@@ -0,0 +1,159 @@
+import numpy as np
+import pandas as pd
+
+# Target of the models
+TARGET = "PricePerSqm"
+
+# Columns never used as features (Price / AreaAssigned is the target)
+EXCLUDED = ["Price", "PricePerSqm"]
+
+# Columns encoded as ordinal codes
+CATEGORICAL = ["Region", "District", "City", "Town", "EnergyCertificate"]
+
+# High-cardinality columns that also get a fold-local target encoding
+TARGET_ENCODED = ["City", "Town"]
+
+
+class FeatureMatrix:
+    """
+    Clean dataset encoded once into a contiguous float32 matrix.
+
+    Categorical columns are replaced by ordinal codes (missing or unseen
+    values are NaN). The codes use no target information, so they are
+    fitted on the whole dataset. Target encodings do use the target and
+    are therefore fitted per fold, on the training rows only.
+    """
+
+    def __init__(
+        self,
+        df: pd.DataFrame,
+        target=TARGET,
+        categorical=CATEGORICAL,
+        target_encoded=TARGET_ENCODED,
+    ):
+        self.target = target
+        self.categories = {
+            col: np.sort(df[col].dropna().unique()) for col in categorical if col in df
+        }
+        self.feature_names = [
+            col for col in df.columns if col not in EXCLUDED and col != target
+        ]
+        self.categorical_features = [
+            i for i, col in enumerate(self.feature_names) if col in self.categories
+        ]
+        self.target_encoded = [
+            self.feature_names.index(col)
+            for col in target_encoded
+            if col in self.categories
+        ]
+
+        self.X = self.transform(df)
+        self.y = df[target].to_numpy(dtype=np.float32)
+
+    def transform(self, df: pd.DataFrame) -> np.ndarray:
+        """
+        Encode a DataFrame with the fitted encoders.
+        """
+        return encode(df, self.feature_names, self.categories)
+
+    def fold(self, train_idx, eval_idx, target_encode=True, smoothing=10.0):
+        """
+        Training and evaluation arrays of one fold.
+
+        Returns:
+            tuple: X_train, y_train, X_eval, y_eval
+        """
+        X_train, y_train = self.X[train_idx], self.y[train_idx]
+        X_eval, y_eval = self.X[eval_idx], self.y[eval_idx]
+
+        if target_encode and self.target_encoded:
+            encodings = self._target_encodings(X_train, y_train, smoothing)
+            X_train = append_target_encodings(X_train, encodings)
+            X_eval = append_target_encodings(X_eval, encodings)
+
+        return X_train, y_train, X_eval, y_eval
+
+    def encoder(self, train_idx, target_encode=True, smoothing=10.0):
+        """
+        Encoder of new listings matching a model fitted on `train_idx`
+        (see fold), without the dataset.
+        """
+        encodings = {}
+        if target_encode and self.target_encoded:
+            encodings = self._target_encodings(
+                self.X[train_idx], self.y[train_idx], smoothing
+            )
+        return FeatureEncoder(self.feature_names, self.categories, encodings)
+
+    def _target_encodings(self, X_train, y_train, smoothing):
+        """
+        Smoothed target means of the codes of the high-cardinality
+        columns, computed from the training rows only (no validation
+        leakage). Missing codes map to the last entry, the prior.
+        """
+        prior = y_train.mean()
+        encodings = {}
+
+        for i in self.target_encoded:
+            n_codes = len(self.categories[self.feature_names[i]])
+            train_codes = np.nan_to_num(X_train[:, i], nan=n_codes).astype(np.int64)
+
+            sums = np.bincount(train_codes, weights=y_train, minlength=n_codes + 1)
+            counts = np.bincount(train_codes, minlength=n_codes + 1)
+            encoding = (sums + smoothing * prior) / (counts + smoothing)
+            encoding[n_codes] = prior
+            encodings[i] = encoding.astype(np.float32)
+
+        return encodings
+
+
+class FeatureEncoder:
+    """
+    Encoders fitted by a FeatureMatrix, kept with a trained model
+    to encode new listings the way its training rows were.
+    """
+
+    def __init__(self, feature_names, categories, target_encodings):
+        self.feature_names = list(feature_names)
+        self.categories = categories
+        self.target_encodings = target_encodings
+
+    def transform(self, df: pd.DataFrame) -> np.ndarray:
+        """
+        Encode listings (missing feature columns are NaN).
+        """
+        X = encode(df, self.feature_names, self.categories)
+        return append_target_encodings(X, self.target_encodings)
+
+
+def encode(df: pd.DataFrame, feature_names, categories) -> np.ndarray:
+    """
+    Encode the feature columns of a DataFrame: categorical columns as
+    ordinal codes of `categories` (missing or unseen values are NaN).
+    """
+    X = np.full((len(df), len(feature_names)), np.nan, dtype=np.float32)
+    for i, col in enumerate(feature_names):
+        if col not in df:
+            continue
+        if col in categories:
+            codes = pd.Categorical(df[col], categories=categories[col]).codes
+            X[:, i] = np.where(codes >= 0, codes, np.nan)
+        else:
+            X[:, i] = pd.to_numeric(df[col], errors="coerce").astype(np.float32)
+    return X
+
+
+def append_target_encodings(X: np.ndarray, encodings) -> np.ndarray:
+    """
+    Append the target encoding of each encoded column to X
+    (unseen or missing codes get the prior).
+    """
+    if not encodings:
+        return X
+
+    cols = []
+    for i, encoding in encodings.items():
+        n_codes = len(encoding) - 1
+        codes = np.nan_to_num(X[:, i], nan=n_codes).astype(np.int64)
+        cols.append(encoding[codes])
+    return np.hstack([X, np.column_stack(cols).astype(np.float32)])
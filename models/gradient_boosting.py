@@ -0,0 +1,83 @@
+from functools import partial
+from sklearn.ensemble import HistGradientBoostingRegressor
+
+from models.cross_validation import cross_validate
+from models.features import FeatureMatrix
+
+# Categorical features with more categories than bins stay ordinal codes
+MAX_BINS = 255
+
+
+def categorical_indices(features):
+    """
+    Columns of a FeatureMatrix split on as categories
+    (the categorical ones with at most MAX_BINS categories).
+    """
+    categorical = [
+        i
+        for i in features.categorical_features
+        if len(features.categories[features.feature_names[i]]) <= MAX_BINS
+    ]
+    return categorical or None
+
+
+def make_hist_gradient_boosting(
+    n_jobs,
+    categorical_features=None,
+    max_iter=500,
+    learning_rate=0.1,
+    max_leaf_nodes=31,
+    min_samples_leaf=20,
+    l2_regularization=0.0,
+    n_iter_no_change=10,
+    random_state=42,
+):
+    """
+    Gradient boosting on histogram-binned features, with native splits
+    on the categorical codes and early stopping on a held-out 10% of
+    the training rows. Its threads are set by the worker (see
+    models/cross_validation.py), so `n_jobs` is unused.
+    """
+    return HistGradientBoostingRegressor(
+        max_iter=max_iter,
+        learning_rate=learning_rate,
+        max_leaf_nodes=max_leaf_nodes,
+        min_samples_leaf=min_samples_leaf,
+        l2_regularization=l2_regularization,
+        max_bins=MAX_BINS,
+        categorical_features=categorical_features,
+        early_stopping=True,
+        n_iter_no_change=n_iter_no_change,
+        random_state=random_state,
+    )
+
+
+def run_hist_gradient_boosting(
+    split, features=None, n_workers=None, save_path=None, **params
+):
+    """
+    Run histogram gradient boosting on the provided folds and evaluate
+    performance, like run_random_forest (see models/random_forest.py).
+
+    Args:
+        split (FoldSplit): Row indices of the folds and test set.
+        features (FeatureMatrix): Encoded dataset (built from the split if None).
+        n_workers (int): Number of folds fitted at the same time (default: all).
+        save_path (str): Where the final model is saved (not saved if None).
+        **params: Gradient boosting hyperparameters.
+
+    Returns:
+        results (dict): "folds" with RMSE and R2 for each fold, and
+            "test" with RMSE and R2 on the test set.
+    """
+    if features is None:
+        features = FeatureMatrix(split.df)
+    params.setdefault("categorical_features", categorical_indices(features))
+
+    return cross_validate(
+        partial(make_hist_gradient_boosting, **params),
+        split,
+        features,
+        n_workers,
+        save_path,
+    )
@@ -1,56 +1,47 @@
+from functools import partial
 from sklearn.ensemble import RandomForestRegressor
-from sklearn.metrics import mean_squared_error, r2_score
-from sklearn.preprocessing import StandardScaler
-import numpy as np
 
+from models.cross_validation import cross_validate
 
-def run_random_forest(folds, test_df):
+
+def make_random_forest(
+    n_jobs,
+    n_estimators=100,
+    max_depth=None,
+    min_samples_leaf=1,
+    max_features=1.0,
+    random_state=42,
+):
+    """
+    Random Forest on the encoded features (trees need no scaling).
+    """
+    return RandomForestRegressor(
+        n_estimators=n_estimators,
+        max_depth=max_depth,
+        min_samples_leaf=min_samples_leaf,
+        max_features=max_features,
+        random_state=random_state,
+        n_jobs=n_jobs,
+    )
+
+
+def run_random_forest(split, features=None, n_workers=None, save_path=None, **params):
     """
     Run Random Forest on the provided folds and evaluate performance.
+    Folds are fitted concurrently in a process pool, then a final model
+    is fitted on all training data and evaluated on the test set.
 
     Args:
-        folds (list): List of tuples containing train and validation DataFrames.
-        test_df (DataFrame): Test DataFrame for final evaluation.
+        split (FoldSplit): Row indices of the folds and test set.
+        features (FeatureMatrix): Encoded dataset (built from the split if None).
+        n_workers (int): Number of folds fitted at the same time (default: all).
+        save_path (str): Where the final model is saved (not saved if None).
+        **params: Random Forest hyperparameters.
 
     Returns:
-        results (list): List of dictionaries with RMSE and R2 for each fold.
+        results (dict): "folds" with RMSE and R2 for each fold, and
+            "test" with RMSE and R2 on the test set.
     """
-
-    # Initialize results list
-    results = []
-
-    for fold_idx, (train_df, val_df) in enumerate(folds):
-        # Define predictors and target
-        features = [
-            col
-            for col in train_df.columns
-            if col not in ["PricePerSqm", "City", "strat_col"]
-        ]  # adjust if needed
-
-        X_train = train_df[features]
-        y_train = train_df["PricePerSqm"]
-
-        X_val = val_df[features]
-        y_val = val_df["PricePerSqm"]
-
-        # Optional: scale data
-        scaler = StandardScaler()
-        X_train_scaled = scaler.fit_transform(X_train)
-        X_val_scaled = scaler.transform(X_val)
-
-        # Fit model
-        rf = RandomForestRegressor(
-            n_estimators=100, max_depth=None, random_state=42, n_jobs=-1
-        )
-        rf.fit(X_train_scaled, y_train)
-
-        # Predict
-        y_pred = rf.predict(X_val_scaled)
-
-        # Evaluate
-        rmse = np.sqrt(mean_squared_error(y_val, y_pred))
-        r2 = r2_score(y_val, y_pred)
-
-        results.append({"fold": fold_idx, "rmse": rmse, "r2": r2})
-
-        print(f"Fold {fold_idx}: RMSE={rmse:.2f}, R2={r2:.2f}")
+    return cross_validate(
+        partial(make_random_forest, **params), split, features, n_workers, save_path
+    )
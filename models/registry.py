@@ -0,0 +1,163 @@
+import copy
+import json
+import os
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import joblib
+import numpy as np
+import polars as pl
+import sklearn
+
+import config
+from models.features import FeatureEncoder
+
+# Layout of a saved model directory, bumped on incompatible changes
+MODEL_FORMAT = 1
+
+# Real estate type of each trained dataset (see src/cli.py)
+MODEL_TYPES = {"land": "Land", "house": "House", "apt": "Apartment"}
+
+
+def model_path(property_type: str) -> str:
+    return os.path.join(config.MODEL_DIR, property_type.lower())
+
+
+class TrainedModel:
+    """
+    Fitted estimator with the encoders of its features and its metadata
+    (format, version, estimator and parameters, library versions,
+    training data and test metrics).
+
+    Saved as a directory with "model.joblib" (uncompressed, so its
+    arrays can be memory-mapped on load) and "metadata.json".
+    """
+
+    def __init__(self, model, encoder: FeatureEncoder, metadata=None):
+        self.model = model
+        self.encoder = encoder
+        self.metadata = {
+            "format": MODEL_FORMAT,
+            "version": f"{datetime.now():%Y%m%d-%H%M%S}",
+            "created_at": datetime.now().isoformat(timespec="seconds"),
+            "estimator": type(model).__name__,
+            "params": {k: repr(v) for k, v in model.get_params().items()},
+            "sklearn": sklearn.__version__,
+            "features": encoder.feature_names,
+            **(metadata or {}),
+        }
+        self.source_mtime = None
+
+    def save(self, path: str):
+        """
+        Write the model directory (replaced as a whole).
+        """
+        tmp_path = f"{path}.tmp"
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        os.makedirs(tmp_path)
+
+        joblib.dump(
+            {"model": self.model, "encoder": self.encoder},
+            os.path.join(tmp_path, "model.joblib"),
+        )
+        with open(os.path.join(tmp_path, "metadata.json"), "w") as f:
+            json.dump(self.metadata, f, indent=2, default=str)
+
+        shutil.rmtree(path, ignore_errors=True)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str, mmap_mode="r") -> "TrainedModel":
+        """
+        Load a saved model, memory-mapping its arrays (see joblib.load).
+        """
+        metadata = read_metadata(path)
+        if metadata.get("format") != MODEL_FORMAT:
+            raise ValueError(
+                f"Model at {path} has format {metadata.get('format')}, "
+                f"expected {MODEL_FORMAT}"
+            )
+
+        saved = joblib.load(os.path.join(path, "model.joblib"), mmap_mode=mmap_mode)
+        trained = cls.__new__(cls)
+        trained.model = saved["model"]
+        trained.encoder = saved["encoder"]
+        trained.metadata = metadata
+        trained.source_mtime = os.stat(path).st_mtime_ns
+        return trained
+
+    def predict(
+        self,
+        df,
+        chunk_size: int = config.PREDICT_CHUNK_SIZE,
+        n_threads: int = None,
+    ) -> np.ndarray:
+        """
+        Predict the target (PricePerSqm) of a Polars or pandas DataFrame
+        of listings. Rows are encoded and predicted in chunks, on
+        `n_threads` threads (default: all cores), so memory stays bounded
+        and the tree traversals (which release the GIL) run in parallel.
+        """
+        if isinstance(df, pl.DataFrame):
+            df = df.select(c for c in self.encoder.feature_names if c in df.columns)
+
+        n_rows = len(df)
+        if n_rows == 0:
+            return np.empty(0, dtype=np.float64)
+
+        # Threads are spread over chunks rather than within the estimator,
+        # set on a shallow copy (sharing the fitted arrays) as the model
+        # is shared by every caller of get_model
+        model = self.model
+        if hasattr(model, "n_jobs"):
+            model = copy.copy(model)
+            model.n_jobs = 1
+
+        starts = range(0, n_rows, chunk_size)
+        n_threads = max(1, min(n_threads or os.cpu_count() or 1, len(starts)))
+        if n_threads == 1:
+            return np.concatenate(
+                [self._predict_chunk(model, df, s, chunk_size) for s in starts]
+            )
+
+        with ThreadPoolExecutor(max_workers=n_threads) as pool:
+            chunks = pool.map(
+                lambda s: self._predict_chunk(model, df, s, chunk_size), starts
+            )
+            return np.concatenate(list(chunks))
+
+    def _predict_chunk(self, model, df, start, chunk_size):
+        if isinstance(df, pl.DataFrame):
+            chunk = df.slice(start, chunk_size).to_pandas()
+        else:
+            chunk = df.iloc[start : start + chunk_size]
+        return model.predict(self.encoder.transform(chunk))
+
+
+def read_metadata(path: str) -> dict:
+    """
+    Metadata of a saved model, without loading it.
+    """
+    with open(os.path.join(path, "metadata.json")) as f:
+        return json.load(f)
+
+
+# Models loaded so far, keyed by real estate type
+_MODEL_CACHE = {}
+
+
+def get_model(property_type: str) -> TrainedModel:
+    """
+    Return the trained model of a real estate type (Land, House or
+    Apartment) from config.MODEL_DIR, loaded once and reloaded when
+    it was saved again. Raises FileNotFoundError if none was trained.
+    """
+    path = model_path(property_type)
+    mtime = os.stat(path).st_mtime_ns
+
+    trained = _MODEL_CACHE.get(property_type)
+    if trained is None or trained.source_mtime != mtime:
+        trained = TrainedModel.load(path)
+        _MODEL_CACHE[property_type] = trained
+    return trained
@@ -0,0 +1,267 @@
+"""
+Hyperparameter search with successive halving over the saved folds.
+
+Configurations are sampled from the search space of an engine and all
+fitted on a small share of the training rows of every fold. The best
+1 / eta of them are fitted again on eta times more rows, and so on,
+until the remaining ones are fitted on all training rows. Bad
+configurations are therefore dropped after their cheapest fits.
+
+Each fold evaluation is appended to a JSONL results store as soon as it
+finishes, and a search started again only runs the missing ones, so an
+interrupted search resumes where it stopped.
+"""
+
+import hashlib
+import json
+import math
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from functools import partial
+
+import numpy as np
+
+import config
+from models.cross_validation import _fit_and_evaluate, _init_worker, split_cores
+from models.features import FeatureMatrix
+from models.gradient_boosting import categorical_indices, make_hist_gradient_boosting
+from models.random_forest import make_random_forest
+from src.logger import PyLogger
+
+# Setup logger
+logger = PyLogger(log_to_file=True, file_path="cribs", stage="tuning")
+
+# Values sampled for each hyperparameter of each engine
+SEARCH_SPACES = {
+    "random_forest": {
+        "n_estimators": [100, 200, 400],
+        "max_depth": [None, 10, 20, 40],
+        "min_samples_leaf": [1, 2, 5, 10],
+        "max_features": [1.0, 0.5, 0.33, "sqrt"],
+    },
+    "gradient_boosting": {
+        "learning_rate": [0.03, 0.05, 0.1, 0.2],
+        "max_leaf_nodes": [15, 31, 63, 127],
+        "min_samples_leaf": [10, 20, 50, 100],
+        "l2_regularization": [0.0, 0.1, 1.0, 10.0],
+    },
+}
+
+# Model factory of each engine (see models/random_forest.py)
+MAKE_MODEL = {
+    "random_forest": make_random_forest,
+    "gradient_boosting": make_hist_gradient_boosting,
+}
+
+
+def store_path(engine, property_type):
+    return os.path.join(config.TUNING_DIR, f"{engine}-{property_type.lower()}.jsonl")
+
+
+def config_id(params):
+    """
+    Stable identifier of a configuration.
+    """
+    return hashlib.sha256(json.dumps(params, sort_keys=True).encode()).hexdigest()[:12]
+
+
+def sample_configs(space, n_configs, seed=config.SEED):
+    """
+    `n_configs` distinct configurations drawn at random from `space`
+    (all of them if the space is smaller). The same seed gives the
+    same configurations, so a resumed search evaluates the same ones.
+    """
+    rng = np.random.default_rng(seed)
+    n_configs = min(n_configs, math.prod(len(values) for values in space.values()))
+
+    configs = {}
+    while len(configs) < n_configs:
+        params = {
+            name: values[rng.integers(len(values))] for name, values in space.items()
+        }
+        configs.setdefault(config_id(params), params)
+    return configs
+
+
+def read_store(path):
+    """
+    Fold evaluations saved in a results store, in the order they were run.
+    """
+    records = []
+    if not os.path.exists(path):
+        return records
+
+    with open(path) as f:
+        for line in f:
+            try:
+                records.append(json.loads(line))
+            except json.JSONDecodeError:
+                continue  # last line of an interrupted write
+    return records
+
+
+def load_results(path, source_hash):
+    """
+    Fold evaluations of a results store made on the dataset `source_hash`,
+    keyed by (config id, rung, fold).
+    """
+    return {
+        (record["config_id"], record["rung"], record["fold"]): record
+        for record in read_store(path)
+        if record.get("source_hash") == source_hash
+    }
+
+
+def _end_line(path):
+    # Terminate the last line of an interrupted write before appending
+    if not os.path.exists(path) or os.path.getsize(path) == 0:
+        return
+    with open(path, "rb+") as f:
+        f.seek(-1, os.SEEK_END)
+        if f.read(1) != b"\n":
+            f.write(b"\n")
+
+
+def _subsample(train_idx, fraction, seed):
+    # The rows of a smaller fraction are a subset of the larger ones
+    order = np.random.default_rng(seed).permutation(len(train_idx))
+    n_rows = max(1, int(round(fraction * len(train_idx))))
+    return np.sort(train_idx[order[:n_rows]])
+
+
+def successive_halving(
+    engine,
+    split,
+    property_type,
+    features=None,
+    n_configs=config.TUNING_N_CONFIGS,
+    eta=config.TUNING_ETA,
+    min_fraction=config.TUNING_MIN_FRACTION,
+    n_workers=None,
+    seed=config.SEED,
+):
+    """
+    Search the hyperparameters of a model engine on a saved split.
+
+    Args:
+        engine (str): "random_forest" or "gradient_boosting".
+        split (FoldSplit): Row indices of the folds (the test set is unused).
+        property_type (str): Land, House or Apartment, names the results store.
+        features (FeatureMatrix): Encoded dataset (built from the split if None).
+        n_configs (int): Number of configurations sampled.
+        eta (int): 1 / eta of the configurations are kept at each rung.
+        min_fraction (float): Share of the training rows of the first rung.
+        n_workers (int): Number of fits run at the same time (default: all cores).
+
+    Returns:
+        dict: "best" configuration (params, mean RMSE and R2 over the folds
+            at the last rung) and "rungs" with every configuration evaluated
+            at each rung, best first.
+    """
+    if features is None:
+        features = FeatureMatrix(split.df)
+
+    fixed = {"random_state": seed}
+    if engine == "gradient_boosting":
+        fixed["categorical_features"] = categorical_indices(features)
+
+    configs = sample_configs(SEARCH_SPACES[engine], n_configs, seed)
+    n_rungs = max(1, math.floor(math.log(1 / min_fraction, eta) + 1e-9) + 1)
+    fractions = [min_fraction * eta**rung for rung in range(n_rungs - 1)] + [1.0]
+
+    path = store_path(engine, property_type)
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    results = load_results(path, split.source_hash)
+    if results:
+        logger.info(f"Resuming the search from {len(results)} fold evaluations")
+    _end_line(path)
+
+    n_workers, n_jobs = split_cores(len(configs) * len(split), n_workers)
+    rungs = []
+    survivors = list(configs)
+
+    with (
+        ProcessPoolExecutor(
+            max_workers=n_workers,
+            initializer=_init_worker,
+            initargs=(features, n_jobs),
+        ) as pool,
+        open(path, "a") as store,
+    ):
+        for rung, fraction in enumerate(fractions):
+            # Fold evaluations of this rung missing from the store
+            futures = {}
+            for cid in survivors:
+                make_model = partial(MAKE_MODEL[engine], **configs[cid], **fixed)
+                for fold, (train_idx, val_idx) in enumerate(
+                    zip(split.train_idx, split.val_idx)
+                ):
+                    if (cid, rung, fold) in results:
+                        continue
+                    train_idx = _subsample(train_idx, fraction, seed + fold)
+                    future = pool.submit(
+                        _fit_and_evaluate, make_model, train_idx, val_idx, n_jobs
+                    )
+                    futures[future] = (cid, fold)
+
+            for future in as_completed(futures):
+                cid, fold = futures[future]
+                record = {
+                    "source_hash": split.source_hash,
+                    "config_id": cid,
+                    "params": configs[cid],
+                    "rung": rung,
+                    "fraction": fraction,
+                    "fold": fold,
+                    **future.result(),
+                }
+                results[(cid, rung, fold)] = record
+                store.write(json.dumps(record) + "\n")
+                store.flush()
+
+            # Mean over the folds, best first
+            scores = []
+            for cid in survivors:
+                folds = [results[(cid, rung, f)] for f in range(len(split))]
+                scores.append(
+                    {
+                        "config_id": cid,
+                        "params": configs[cid],
+                        "rmse": float(np.mean([r["rmse"] for r in folds])),
+                        "r2": float(np.mean([r["r2"] for r in folds])),
+                        "fit_s": float(np.mean([r["fit_s"] for r in folds])),
+                    }
+                )
+            scores.sort(key=lambda score: score["rmse"])
+            rungs.append({"fraction": fraction, "scores": scores})
+
+            best = scores[0]
+            logger.info(
+                f"Rung {rung} ({fraction:.0%} of the rows): {len(scores)} "
+                f"configurations, best RMSE={best['rmse']:.2f} {best['params']}"
+            )
+            survivors = [s["config_id"] for s in scores[: max(1, len(scores) // eta)]]
+
+    return {"best": rungs[-1]["scores"][0], "rungs": rungs}
+
+
+def best_params(engine, property_type, source_hash):
+    """
+    Best configuration fitted on all training rows in the results store
+    of an engine and real estate type, among the evaluations of the
+    dataset with `source_hash` (that of the current split), or None if
+    there is none yet.
+    """
+    records = read_store(store_path(engine, property_type))
+
+    # Configurations of this dataset evaluated on all training rows
+    rmse = {}
+    for r in records:
+        if r["fraction"] == 1.0 and r["source_hash"] == source_hash:
+            rmse.setdefault(r["config_id"], (r["params"], []))[1].append(r["rmse"])
+    if not rmse:
+        return None
+
+    n_folds = max(len(scores) for _, scores in rmse.values())
+    complete = [(np.mean(s), p) for p, s in rmse.values() if len(s) == n_folds]
+    return min(complete, key=lambda item: item[0])[1] if complete else None
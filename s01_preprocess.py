@@ -1,37 +1,98 @@
 # Import libraries
 import polars as pl
+import os
+import json
+import shutil
+from functools import reduce
 
 # Import dependencies
 import config
-from src.preprocess_functions import get_nr_of_groups_polars, assign_as_zero
+from src.preprocess_functions import (
+    get_nr_of_groups_polars,
+    group_cardinality,
+    assign_as_zero,
+)
+from src.regions import region_expr
+from src.cleaning_rules import CleaningRules
+from src.deduplication import (
+    dedup_columns,
+    drop_rows,
+    duplicate_rows,
+    near_duplicate_clusters,
+)
+from src.group_stats import GroupStatsStore
+from src.outliers import filter_outliers, outlier_bounds
+from src.manifest import file_digest, config_digest, code_digest
+from src.storage import write_dataset, read_dataset, scan_dataset, iter_partitions
+from src.profiling import stage, collect_all
 from src.logger import PyLogger
 
 # Setup logger
-logger = PyLogger(log_to_file=True, file_path="cribs")
-
-
-def preprocess_pipeline_buildings():
+logger = PyLogger(log_to_file=True, file_path="cribs", stage="preprocess")
+
+# Inputs that define the preprocess stage (see src/manifest.py)
+PREPROCESS_CONFIG_KEYS = [
+    "RAW_DATA_PATH",
+    "BUILD_DATA_PATH",
+    "LAND_DATA_PATH",
+    "HOUSE_DATA_PATH",
+    "APT_DATA_PATH",
+    "PARTITION_COLS",
+    "EXPORT_CSV",
+    "BASE_STATS_PATH",
+    "CLEAN_STATS_PATH",
+    "GROUP_STATS_KEYS",
+    "SKETCH_RELATIVE_ACCURACY",
+    "CLEANING_RULES",
+    "DEDUP_BLOCK_COLS",
+    "DEDUP_TOLERANCES",
+    "DEDUP_WINDOW",
+    "DEDUP_PARTITION_COLS",
+    "OUTLIER_METHOD",
+    "OUTLIER_GROUP_COLS",
+    "OUTLIER_THRESHOLDS",
+]
+PREPROCESS_CODE = [
+    __file__,
+    os.path.join(os.path.dirname(__file__), "src", "preprocess_functions.py"),
+    os.path.join(os.path.dirname(__file__), "src", "group_stats.py"),
+    os.path.join(os.path.dirname(__file__), "src", "cleaning_rules.py"),
+    os.path.join(os.path.dirname(__file__), "src", "deduplication.py"),
+    os.path.join(os.path.dirname(__file__), "src", "outliers.py"),
+    os.path.join(os.path.dirname(__file__), "src", "storage.py"),
+    os.path.join(os.path.dirname(__file__), "src", "regions.py"),
+    os.path.join(os.path.dirname(__file__), "src", "profiling.py"),
+]
+
+
+def scan_raw_data(path=config.RAW_DATA_PATH, skip_rows=0):
     """
-    Data preprocessing pipeline for buildings.
-    Gets the raw data and cleans it,
-    The cleaned data is stored in the
-    same directory as raw data.
+    Lazily scan the raw data.
+    Nothing is read until the plan is collected, which lets
+    Polars push filters and column projections into the scan.
+    With `skip_rows` only the rows appended after the first
+    `skip_rows` data rows are scanned.
     """
+    if skip_rows == 0:
+        return pl.scan_csv(path)
 
-    ################################
-    # -- Load data as dataframe -- #
-    ################################
-    df_raw = pl.read_csv(config.RAW_DATA_PATH)
+    # Infer the schema from the head of the file, not from the new rows
+    schema = pl.scan_csv(path).collect_schema()
+    return pl.scan_csv(path, schema=schema, skip_rows_after_header=skip_rows)
 
-    # Log raw data load
-    nrow_raw = df_raw.height
-    logger.info(f"Loaded raw data with {nrow_raw} rows")
+
+def shared_plan(lf_raw):
+    """
+    Steps shared by the buildings and land pipelines.
+    Every step is row-wise, so it is computed once on the
+    raw scan and both pipelines branch off the result.
+    """
 
     #########################
     # -- Get "true" area -- #
     #########################
     """This section processes the raw data areas' variables to assign the correct area"""
-    df = df_raw.with_columns(
+    lf = lf_raw.with_columns(
         pl.when(pl.col("Type") == "Land")
         .then(pl.col("TotalArea"))
         .otherwise(pl.col("LivingArea"))
@@ -42,7 +103,7 @@ def preprocess_pipeline_buildings():
     # -- Get "true" rooms -- #
     ##########################
     """This section processes the raw data rooms' variables to assign the correct number of rooms"""
-    df = df.with_columns(
+    lf = lf.with_columns(
         pl.when(
             pl.col("TotalRooms").is_not_null()
             & pl.col("NumberOfBedrooms").is_not_null()
@@ -56,381 +117,749 @@ def preprocess_pipeline_buildings():
         .alias("RoomsAssigned")
     )
 
-    ################################
-    # -- Remove "empty" columns -- #
-    ################################
-    """This section removes columns that are not needed for further analysis because 
-    they have a lot of missing values or are not relevant."""
-    df = df.select(
-        pl.exclude(
-            [
-                "GrossArea",
-                "TotalArea",
-                "LivingArea",
-                "HasParking",
-                "Floor",
-                "EnergyEfficiencyLevel",
-                "PublishDate",
-                "NumberOfBedrooms",
-                "TotalRooms",
-                "NumberOfWC",
-                "ConservationStatus",
-                "ElectricCarsCharging",
-                "LotSize",
-                "BuiltArea",
-            ]
-        )
-    )
-
-    ##################################################
-    # -- Remove small amount of real estate types -- #
-    ##################################################
-    """This section filters the dataset to keep only the relevant real estate types."""
-    preserved_types = ["Apartment", "House"]
-    df = df.filter(pl.col("Type").is_in(preserved_types))
-
-    #############################################
-    # -- Remove districts with small samples -- #
-    #############################################
-    """This section removes districts with small samples to ensure 
-    the dataset is robust for analysis."""
-
-    # Remove districts with small samples
-    # get_nr_of_groups_polars(df, ["District", "Type"])
-
-    removed_district = [
-        "Bragança",
-        "Beja",
-        "Ilha de Santa Maria",
-        "Viseu",
-        "Ilha de São Miguel",
-        "Ilha de Porto Santo",
-        "Z - Fora de Portugal",
-        "Ilha Terceira",
-        "Ilha da Madeira",
-        "Ilha do Faial",
-        "Ilha das Flores",
-    ]
-    df = df.filter(~pl.col("District").is_in(removed_district))
-
     ##############################################
     # -- Remove missing data of assigned area -- #
     ##############################################
     """This section filters out rows where the assigned area is missing or zero."""
-    # Remove rows where are is missing
-    df = df.filter(pl.col("AreaAssigned").is_not_null())
-
-    # Remove rows where area is zero
-    df = df.filter(pl.col("AreaAssigned") != 0)
-
-    ##############################################
-    # -- If garage is missing assign to False -- #
-    ##############################################
-    """This section fills missing values in the 'Garage' column with False,
-    indicating that the property does not have a garage."""
-    df = df.with_columns(pl.col("Garage").fill_null(False).alias("Garage"))
-
-    ##############################
-    # -- Remove all leftovers -- #
-    ##############################
-    """This section removes all othe rows with null values."""
-    df = df.drop_nulls()
-
-    # Check the districts again
-    # get_nr_of_groups_polars(df, ["District", "Type"])
+    lf = lf.filter(pl.col("AreaAssigned").is_not_null() & (pl.col("AreaAssigned") != 0))
 
     ######################################
     # -- Create Price per Area column -- #
     ######################################
     """This section computes the price per square meter for each property,
     which is a crucial metric for real estate analysis."""
-    df = df.with_columns(
+    lf = lf.with_columns(
         (pl.col("Price") / pl.col("AreaAssigned")).alias("PricePerSqm")
     )
 
-    #######################################
-    # -- Remove outliers using Z-score -- #
-    #######################################
-    """This section removes outliers from the dataset based
-    on the log z-score method."""
-
-    # Create log-transformed column of PricePerSqm
-    df = df.with_columns(pl.col("PricePerSqm").log1p().alias("LogPricePerSqm"))
-
-    # Compute group-wise z-score bournds
-    zscore_stats = df.group_by("District").agg(
-        [
-            pl.col("LogPricePerSqm").mean().alias("mean_log"),
-            pl.col("LogPricePerSqm").std().alias("std_log"),
-        ]
-    )
+    return lf
 
-    # Join bounds back to original data
-    df = df.join(zscore_stats, on="District", how="left")
 
-    # Filter out outliers using IQR
-    df = df.with_columns(
-        ((pl.col("LogPricePerSqm") - pl.col("mean_log")) / pl.col("std_log")).alias(
-            "zscore_log"
-        )
-    ).filter(
-        pl.col("zscore_log").abs() <= 3  # Threshold for z-score
-    )
+# Branch name -> phase ("base" / "final") -> cleaning rules, from config.py
+# (small Districts can be rolled up into their Region before it is a column)
+CLEANING = {
+    name: {
+        phase: CleaningRules(rules, derived={"Region": region_expr("District")})
+        for phase, rules in phases.items()
+    }
+    for name, phases in config.CLEANING_RULES.items()
+}
+
+
+def outlier_plan(lf_base, bounds=None):
+    """
+    Outlier filter of a branch and the Region of each listing.
+    `bounds` overrides the group statistics of `lf_base`.
+    """
 
-    # Optional: drop the helper bound columns
-    df = df.drop(["LogPricePerSqm", "mean_log", "std_log", "zscore_log"])
+    #########################################
+    # -- Remove outliers per price group -- #
+    #########################################
+    """This section removes outliers from the dataset based on the
+    log-price of their group (config.OUTLIER_METHOD)."""
+    lf = filter_outliers(lf_base, bounds=bounds)
 
     ###################################
     # -- Give regions per District -- #
     ###################################
     """This section maps each district to its corresponding region, which is useful for regional analysis."""
 
-    # Define a mapping from districts to regions
-    district_to_region = {
-        "Porto": "Norte",
-        "Braga": "Norte",
-        "Vila Real": "Norte",
-        "Viana do Castelo": "Norte",
-        "Aveiro": "Centro",
-        "Leiria": "Centro",
-        "Coimbra": "Centro",
-        "Guarda": "Centro",
-        "Castelo Branco": "Centro",
-        "Lisboa": "Lisboa",
-        "Setúbal": "Lisboa",
-        "Santarém": "Centro",
-        "Évora": "Alentejo",
-        "Portalegre": "Alentejo",
-        "Faro": "Algarve",
-    }
+    return lf.with_columns(region_expr("District"))
 
-    df = df.with_columns(
-        pl.struct(["District"])
-        .map_elements(
-            lambda s: district_to_region.get(s["District"], None),
-            return_dtype=pl.String,
-        )
-        .alias("Region")
-    )
 
-    #######################################
-    # -- Fix energy certificate values -- #
-    #######################################
-    """This section standardizes the energy certificate values to a consistent format."""
+def buildings_base_plan(lf_shared):
+    """
+    Data preprocessing plan for buildings, up to the outlier filter.
+    Takes the shared plan and returns the apartments and houses
+    with all of their missing data removed (config.CLEANING_RULES).
+    """
+    return CLEANING["buildings"]["base"].apply(lf_shared)
+
 
-    df = df.with_columns(
-        pl.when(pl.col("EnergyCertificate") == "No Certificate")
-        .then(pl.lit("NC"))
-        .otherwise(pl.col("EnergyCertificate"))
-        .alias("EnergyCertificate")
-    )
+def buildings_final_plan(lf_base, bounds=None, support=None):
+    """
+    Data preprocessing plan for buildings, from the outlier filter on.
+    `bounds` overrides the outlier bounds of the groups of `lf_base`,
+    `support` gives the group counts of its rules (see _group_support).
+    """
+    lf = CLEANING["buildings"]["final"].apply(outlier_plan(lf_base, bounds), support)
 
     ###########################
     # -- Remove duplicates -- #
     ###########################
     """This section removes duplicate rows from the dataset to ensure data integrity."""
-    df = df.unique()
+    return lf.unique()
 
-    #######################
-    # -- Final dataset -- #
-    #######################
 
-    # Log resulting cleaned data
-    nrow_clean = df.height
-    logger.info(
-        f"Preprocessed data of buildings real estate with {nrow_clean} rows - {100 * round(nrow_clean / nrow_raw, ndigits=2)}% of the initial dataset."
-    )
+def land_base_plan(lf_shared):
+    """
+    Data preprocessing plan for land, up to the outlier filter.
+    Takes the shared plan and returns the land plots with
+    all of their missing data removed (config.CLEANING_RULES).
+    """
+    return CLEANING["land"]["base"].apply(lf_shared)
+
+
+def land_final_plan(lf_base, bounds=None, support=None):
+    """
+    Data preprocessing plan for land, from the outlier filter on.
+    `bounds` overrides the outlier bounds of the groups of `lf_base`,
+    `support` gives the group counts of its rules (see _group_support).
+    """
+    lf = CLEANING["land"]["final"].apply(outlier_plan(lf_base, bounds), support)
+
+    ###########################
+    # -- Remove duplicates -- #
+    ###########################
+    """This section removes duplicate rows from the dataset to ensure data integrity."""
+    return lf.unique()
+
+
+def save_buildings(df):
+    """
+    Save the cleaned buildings, and the
+    houses and apartments separately.
+    """
 
     # Save preprocessed dataset (all)
-    df.write_csv(config.BUILD_DATA_PATH, separator=",")
+    write_dataset(df, config.BUILD_DATA_PATH)
+
+    # A streamed plan is split from the written dataset, not run again
+    if isinstance(df, pl.LazyFrame):
+        df = scan_dataset(config.BUILD_DATA_PATH)
 
     # Save preprocessed dataset per real estate type
     df_house = df.filter(pl.col("Type") == "House").select(pl.exclude("Type"))
     df_apt = df.filter(pl.col("Type") == "Apartment").select(pl.exclude("Type"))
 
-    df_house.write_csv(config.HOUSE_DATA_PATH, separator=",")
-    df_apt.write_csv(config.APT_DATA_PATH, separator=",")
+    write_dataset(df_house, config.HOUSE_DATA_PATH)
+    write_dataset(df_apt, config.APT_DATA_PATH)
 
 
-def preprocess_pipeline_land():
+def save_land(df):
     """
-    Data preprocessing pipeline.
-    Gets the raw data from land and cleans it,
-    The cleaned data is stored in the
-    similar directory as raw data.
+    Save the cleaned land plots.
     """
+    write_dataset(df, config.LAND_DATA_PATH)
 
-    ################################
-    # -- Load data as dataframe -- #
-    ################################
-    df_raw = pl.read_csv(config.RAW_DATA_PATH)
 
-    # Log raw data load
-    nrow_raw = df_raw.height
-    logger.info(f"Loaded raw data with {nrow_raw} rows")
+# Branch name -> (base plan, final plan, save function)
+BRANCHES = {
+    "buildings": (buildings_base_plan, buildings_final_plan, save_buildings),
+    "land": (land_base_plan, land_final_plan, save_land),
+}
 
-    ########################
-    # -- Pick only land -- #
-    ########################
-    """This section filters the dataset to keep only the relevant real estate types."""
-    df = df_raw.filter(pl.col("Type") == "Land")
+# Real estate types of each branch (the land datasets have no Type column)
+BRANCH_TYPES = {
+    "buildings": ["House", "Apartment"],
+    "land": ["Land"],
+}
 
-    #########################
-    # -- Get "true" area -- #
-    #########################
-    """This section processes the raw data areas' variables to assign the correct area"""
-    df = df.with_columns(
-        pl.when(pl.col("Type") == "Land")
-        .then(pl.col("TotalArea"))
-        .otherwise(pl.col("LivingArea"))
-        .alias("AreaAssigned")
+
+def _dataset_path(name):
+    return config.BUILD_DATA_PATH if name == "buildings" else config.LAND_DATA_PATH
+
+
+def _log_clean(name, nrow_clean, nrow_raw):
+    logger.info(
+        f"Preprocessed data of {name} real estate with {nrow_clean} rows - {100 * round(nrow_clean / nrow_raw, ndigits=2)}% of the initial dataset."
     )
 
-    ################################
-    # -- Remove "empty" columns -- #
-    ################################
-    """This section removes columns that are not needed for further analysis because 
-    they have a lot of missing values or are not relevant."""
-    df = df.select(["Price", "District", "City", "AreaAssigned"])
 
-    ##############################################
-    # -- Remove missing data of assigned area -- #
-    ##############################################
-    """This section filters out rows where the assigned area is missing or zero."""
-    # Remove rows where are is missing
-    df = df.filter(pl.col("AreaAssigned").is_not_null())
+def _rule_counts_plans(phase, frames, support=None):
+    """
+    Lazy number of rows each cleaning rule of `phase` removes from
+    the frames of each branch (the frames the rules are applied to),
+    with the group counts of `support` (by branch, see _group_support).
+    """
+    support = support or {}
+    return [
+        CLEANING[name][phase].removal_counts(lf, support.get(name))
+        for name, lf in frames.items()
+    ]
 
-    # Remove rows where area is zero
-    df = df.filter(pl.col("AreaAssigned") != 0)
+
+def _group_support(name, stats):
+    """
+    Listings of a branch in each group of its "final" min_support
+    rules, by rule name, from the group statistics store of the
+    listings before the outlier filter. The groups are sized on the
+    same rows (all the deduplicated listings) in every kind of run.
+    """
+    return {
+        rule["name"]: stats.group_moments(
+            rule.get("by", []) + [rule["column"]], types=BRANCH_TYPES[name]
+        ).select(pl.exclude("mean", "m2"))
+        for rule in CLEANING[name]["final"].rules
+        if rule["kind"] == "min_support"
+    }
+
+
+def _grown_groups(name, old, new):
+    """
+    Number of groups of the min_support rules of a branch that were too
+    small in the `old` group statistics store but are not in the `new`
+    one (their earlier listings were removed or rolled up).
+    """
+    grown = 0
+    support = _group_support(name, new)
+    for rule_name, df_old in _group_support(name, old).items():
+        rule = next(r for r in CLEANING[name]["final"].rules if r["name"] == rule_name)
+        keys = rule.get("by", []) + [rule["column"]]
+        grown += (
+            support[rule_name]
+            .join(df_old, on=keys, how="left", nulls_equal=True, suffix="_old")
+            .filter(
+                (pl.col("count_old").fill_null(0) < rule["min_count"])
+                & (pl.col("count") >= rule["min_count"])
+            )
+            .height
+        )
+    return grown
+
+
+def _save_rule_counts(counts, path=config.CLEANING_REPORT_PATH):
+    """
+    Log and save the rows removed by each cleaning rule, given
+    the collected `_rule_counts_plans` as {(branch, phase): df}.
+    """
+    report = {}
+    for (name, phase), df in counts.items():
+        row = df.row(0, named=True)
+        report.setdefault(name, {})[phase] = row
+        for rule, removed in row.items():
+            if rule != "rows_in":
+                logger.info(
+                    f"Cleaning rule {name}:{phase}:{rule} removed {removed} rows",
+                    rows_in=row["rows_in"],
+                )
+
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(report, f, indent=2)
+
+
+def _save_group_cardinality(path=config.GROUP_CARDINALITY_REPORT_PATH):
+    """
+    Save the size of every location group of the cleaned datasets,
+    flagging those under the MIN_GROUP_SUPPORT of their branch.
+    """
+    frames = [
+        group_cardinality(
+            scan_dataset(_dataset_path(name)),
+            min_support=config.MIN_GROUP_SUPPORT[name],
+        ).select(pl.lit(name).alias("branch"), pl.all())
+        for name in BRANCHES
+        if os.path.exists(_dataset_path(name))
+    ]
+    if frames:
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        pl.concat(frames, how="diagonal").write_csv(path)
+
+
+def _key_columns(columns):
+    """
+    Columns of a branch compared for near-duplicates or grouped on
+    by the group statistics.
+    """
+    block_cols, tolerances = dedup_columns(columns)
+    keys = block_cols + list(tolerances) + config.GROUP_STATS_KEYS + ["PricePerSqm"]
+    return [c for c in dict.fromkeys(keys) if c in columns]
+
+
+def _partition_cols(columns):
+    return [c for c in config.DEDUP_PARTITION_COLS if c in columns]
+
+
+def _near_duplicates(frames, counts, kept_rows=None):
+    """
+    Near-duplicate clusters of the collected frame of each branch (see
+    src/deduplication.py), or of its partitions with a "_row" column
+    (any iterable of frames, read one at a time). The rows they remove
+    are added to the "base" `counts` and the clusters saved to
+    config.DUPLICATES_REPORT_PATH.
+    The first `kept_rows[name]` rows of a frame are never removed.
+
+    Returns the indices of the rows to remove, after the kept ones.
+    """
+    kept_rows = kept_rows or {}
+    removed, report = {}, []
+    for name, blocks in frames.items():
+        if isinstance(blocks, pl.DataFrame):
+            blocks = [blocks.with_row_index("_row")]
+
+        clusters, rows_in = [], 0
+        for block in blocks:
+            block_cols, tolerances = dedup_columns(block.columns)
+            clusters.append(
+                near_duplicate_clusters(block).join(
+                    block.select(["_row"] + block_cols + list(tolerances)), on="_row"
+                )
+            )
+            rows_in += block.height
+        clusters = (
+            pl.concat(clusters, how="diagonal_relaxed")
+            if clusters
+            else pl.DataFrame(schema={"_row": pl.UInt32, "cluster": pl.UInt32})
+        )
+
+        offset = kept_rows.get(name, 0)
+        rows = duplicate_rows(clusters)
+        removed[name] = rows.filter(rows >= offset) - offset
+
+        counts[(name, "base")] = counts[(name, "base")].with_columns(
+            pl.lit(len(removed[name]), dtype=pl.UInt32).alias("near_duplicates")
+        )
+        logger.info(
+            f"Found {clusters['cluster'].n_unique()} clusters of near-duplicate "
+            f"{name} listings, removed {len(removed[name])} rows",
+            rows_in=rows_in - offset,
+        )
+        report.append(
+            clusters.with_columns(pl.lit(name).alias("branch")).rename({"_row": "row"})
+        )
+
+    path = config.DUPLICATES_REPORT_PATH
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    pl.concat(report, how="diagonal_relaxed").write_parquet(path)
+    return removed
+
+
+def _stats_plans(frames):
+    """
+    Lazy group statistics tables of the frames of each branch.
+    """
+    return [
+        plan
+        for name, lf in frames.items()
+        for plan in GroupStatsStore.plans(lf, property_type=BRANCH_TYPES[name][0])
+    ]
+
+
+def _stats_from(dfs):
+    """
+    Group statistics store of the collected `_stats_plans` tables.
+    """
+    stores = [GroupStatsStore(dfs[i], dfs[i + 1]) for i in range(0, len(dfs), 2)]
+    return reduce(GroupStatsStore.merge, stores)
+
+
+def _collect_stats(frames, engine="auto"):
+    return _stats_from(pl.collect_all(_stats_plans(frames), engine=engine))
+
+
+def _outlier_bounds(stats, name, lf):
+    """
+    Outlier bounds of the groups of a branch (whose base plan is `lf`)
+    from a group statistics store, for rows not all in one frame.
+    """
+    columns = lf.collect_schema().names()
+    return outlier_bounds(
+        stats,
+        group_cols=[c for c in config.OUTLIER_GROUP_COLS if c in columns],
+        types=BRANCH_TYPES[name],
+    )
+
+
+def _save_stats(stats, path, names):
+    """
+    Save a group statistics store. If only some branches were
+    processed, the groups of the other branches are kept.
+    """
+    if set(names) != set(BRANCHES) and os.path.exists(path):
+        types = [t for name in names for t in BRANCH_TYPES[name]]
+        stats = GroupStatsStore.load(path).drop_types(types).merge(stats)
+    stats.save(path)
+
+
+def preprocess_pipeline(buildings=True, land=True, streaming=None):
+    """
+    Data preprocessing pipeline.
+    Scans the raw data once and branches into the buildings
+    and land plans. The base plans are collected together, so the
+    shared scan and steps are computed a single time, and the final
+    plans filter the outliers of each group from the collected rows.
+    With `streaming` (default: config.STREAMING) the raw data
+    is processed out-of-core, see `preprocess_pipeline_streaming`.
+
+    Returns the cleaned dataframes, the group statistics store of
+    the listings before the outlier filter and the raw row count.
+    """
+    streaming = config.STREAMING if streaming is None else streaming
+    if streaming:
+        return preprocess_pipeline_streaming(buildings=buildings, land=land)
+
+    ###############################
+    # -- Build the lazy plans -- #
+    ###############################
+    lf_raw = scan_raw_data()
+    lf_shared = shared_plan(lf_raw)
+
+    names = [n for n, keep in (("buildings", buildings), ("land", land)) if keep]
+    lf_bases = {name: BRANCHES[name][0](lf_shared) for name in names}
 
     ##############################
-    # -- Remove all leftovers -- #
+    # -- Collect all at once -- #
     ##############################
-    """This section removes all othe rows with null values."""
-    df = df.drop_nulls()
+    """Collecting together lets Polars eliminate the common
+    subplans, so the raw file is parsed only once."""
+    with stage("preprocess:collect", logger) as st:
+        n = len(names)
+        dfs = collect_all(
+            ["preprocess:raw"]
+            + [f"preprocess:{name}:base" for name in names]
+            + [f"preprocess:{name}:base:rules" for name in names],
+            [lf_raw.select(pl.len())]
+            + list(lf_bases.values())
+            + _rule_counts_plans("base", {name: lf_shared for name in names}),
+        )
+        nrow_raw = st.rows_in = dfs[0].item()
+        bases = dict(zip(names, dfs[1 : n + 1]))
+        counts = {(name, "base"): df for name, df in zip(names, dfs[n + 1 :])}
+
+        # Near-duplicates are removed before any group statistics
+        removed = _near_duplicates(bases, counts)
+        bases = {
+            name: drop_rows(df, removed[name]).lazy() for name, df in bases.items()
+        }
+
+        # All rows are in memory, so the outlier filter computes the
+        # statistics of each group over its rows (window expressions)
+        stats = _collect_stats(bases)
+        support = {name: _group_support(name, stats) for name in names}
+        dfs = collect_all(
+            [f"preprocess:{name}" for name in names]
+            + [f"preprocess:{name}:final:rules" for name in names],
+            [BRANCHES[name][1](lf, support=support[name]) for name, lf in bases.items()]
+            + _rule_counts_plans(
+                "final", {name: outlier_plan(lf) for name, lf in bases.items()}, support
+            ),
+        )
+        results = dict(zip(names, dfs[:n]))
+        counts.update({(name, "final"): df for name, df in zip(names, dfs[n:])})
+        st.rows_out = sum(df.height for df in results.values())
 
-    # Check the districts again
-    # get_nr_of_groups_polars(df, ["District", "Type"])
+    _save_rule_counts(counts)
 
-    ######################################
-    # -- Create Price per Area column -- #
-    ######################################
-    """This section computes the price per square meter for each property,
-    which is a crucial metric for real estate analysis."""
-    df = df.with_columns(
-        (pl.col("Price") / pl.col("AreaAssigned")).alias("PricePerSqm")
-    )
+    # Log raw data load
+    logger.info(f"Loaded raw data with {nrow_raw} rows")
 
-    #######################################
-    # -- Remove outliers using Z-score -- #
-    #######################################
-    """This section removes outliers from the dataset based
-    on the log z-score method."""
-
-    # Create log-transformed column of PricePerSqm
-    df = df.with_columns(pl.col("PricePerSqm").log1p().alias("LogPricePerSqm"))
-
-    # Compute group-wise z-score bournds
-    zscore_stats = df.group_by("District").agg(
-        [
-            pl.col("LogPricePerSqm").mean().alias("mean_log"),
-            pl.col("LogPricePerSqm").std().alias("std_log"),
-        ]
-    )
+    #######################
+    # -- Final datasets -- #
+    #######################
+    for name, df in results.items():
+        _log_clean(name, df.height, nrow_raw)
+        with stage(f"preprocess:save:{name}", logger, rows_in=df.height):
+            BRANCHES[name][2](df)
+
+    with stage("preprocess:save:stats", logger):
+        _save_stats(stats, config.BASE_STATS_PATH, names)
+        clean_stats = _collect_stats({name: df.lazy() for name, df in results.items()})
+        _save_stats(clean_stats, config.CLEAN_STATS_PATH, names)
+
+    return results, stats, nrow_raw
+
+
+def preprocess_pipeline_streaming(buildings=True, land=True):
+    """
+    Out-of-core data preprocessing pipeline.
+    The raw data is streamed in batches of config.STREAMING_CHUNK_SIZE
+    rows, in two passes. The first pass computes the group statistics
+    of the listings, the second one filters the outliers with them and
+    streams the cleaned rows straight into the datasets. Only the rows
+    removed by the "base" cleaning rules are counted, in the first pass.
+
+    Near-duplicates are found on the columns they are compared on, which
+    the first pass writes (with the group statistics keys) to a temporary
+    dataset partitioned by config.DEDUP_PARTITION_COLS. Its partitions
+    are deduplicated one at a time, so only the largest one is in memory.
+
+    Returns lazy scans of the cleaned datasets, the group statistics
+    store of the listings before the outlier filter and the raw row count.
+    """
 
-    # Join bounds back to original data
-    df = df.join(zscore_stats, on="District", how="left")
+    ###############################
+    # -- Build the lazy plans -- #
+    ###############################
+    lf_raw = scan_raw_data()
+    lf_shared = shared_plan(lf_raw)
+
+    names = [n for n, keep in (("buildings", buildings), ("land", land)) if keep]
+    lf_bases = {name: BRANCHES[name][0](lf_shared) for name in names}
+    n = len(names)
+
+    with pl.Config(streaming_chunk_size=config.STREAMING_CHUNK_SIZE):
+
+        ###########################################
+        # -- First pass: statistics per group -- #
+        ###########################################
+        """Only the columns compared for near-duplicates and the group
+        statistics keys are written, with the row index of each listing,
+        and the statistics of the listings left are computed from them."""
+        with stage("preprocess:streaming:stats", logger) as st:
+            keys = {name: f"{_dataset_path(name)}.keys" for name in names}
+            sinks = []
+            for name, lf in lf_bases.items():
+                columns = _key_columns(lf.collect_schema().names())
+                shutil.rmtree(keys[name], ignore_errors=True)
+                sinks.append(
+                    lf.select(columns)
+                    .with_row_index("_row")
+                    .sink_parquet(
+                        pl.PartitionBy(keys[name], key=_partition_cols(columns)),
+                        mkdir=True,
+                        lazy=True,
+                    )
+                )
+            dfs = collect_all(
+                ["preprocess:raw"]
+                + [f"preprocess:{name}:base:rules" for name in names]
+                + [f"preprocess:{name}:base:keys" for name in names],
+                [lf_raw.select(pl.len())]
+                + _rule_counts_plans("base", {name: lf_shared for name in names})
+                + sinks,
+                engine="streaming",
+            )
+            nrow_raw = st.rows_in = dfs[0].item()
+            counts = {(name, "base"): df for name, df in zip(names, dfs[1 : n + 1])}
+
+            removed = _near_duplicates(
+                {name: iter_partitions(path) for name, path in keys.items()}, counts
+            )
+            _save_rule_counts(counts)
+            stats = _collect_stats(
+                {
+                    name: scan_dataset(path).filter(
+                        ~pl.col("_row").is_in(removed[name].implode())
+                    )
+                    for name, path in keys.items()
+                },
+                engine="streaming",
+            )
+            for path in keys.values():
+                shutil.rmtree(path, ignore_errors=True)
+
+        # Log raw data load
+        logger.info(f"Streamed raw data with {nrow_raw} rows")
+
+        ##############################################
+        # -- Second pass: filter and write batches -- #
+        ##############################################
+        results = {}
+        for name, lf_base in lf_bases.items():
+            _, final_plan, save = BRANCHES[name]
+            lf = final_plan(
+                drop_rows(lf_base, removed[name]),
+                bounds=_outlier_bounds(stats, name, lf_base),
+                support=_group_support(name, stats),
+            )
+            with stage(f"preprocess:save:{name}", logger) as st:
+                save(lf)
+                results[name] = scan_dataset(_dataset_path(name))
+                st.rows_out = results[name].select(pl.len()).collect().item()
+            _log_clean(name, st.rows_out, nrow_raw)
+
+        with stage("preprocess:save:stats", logger):
+            _save_stats(stats, config.BASE_STATS_PATH, names)
+            clean_stats = _collect_stats(results, engine="streaming")
+            _save_stats(clean_stats, config.CLEAN_STATS_PATH, names)
+
+    return results, stats, nrow_raw
+
+
+def preprocess_pipeline_incremental(skip_rows):
+    """
+    Incremental data preprocessing pipeline.
+    Cleans only the raw rows appended after the first `skip_rows`,
+    filters them with the stored group statistics merged with those
+    of the new rows, and appends them to the cleaned datasets.
+    Both statistics stores are updated by merging, never recomputed.
+
+    Returns the merged statistics store and the number of new raw rows,
+    or None if a group too small before is large enough with the new
+    listings, as its earlier listings can only be restored by a full run.
+    """
 
-    # Filter out outliers using IQR
-    df = df.with_columns(
-        ((pl.col("LogPricePerSqm") - pl.col("mean_log")) / pl.col("std_log")).alias(
-            "zscore_log"
+    ###############################
+    # -- Build the lazy plans -- #
+    ###############################
+    lf_raw = scan_raw_data(skip_rows=skip_rows)
+    lf_shared = shared_plan(lf_raw)
+
+    lf_bases = {name: BRANCHES[name][0](lf_shared) for name in BRANCHES}
+    n = len(lf_bases)
+    with stage("preprocess:incremental:collect", logger) as st:
+        dfs = collect_all(
+            ["preprocess:incremental:raw"]
+            + [f"preprocess:incremental:{name}:base" for name in lf_bases]
+            + [f"preprocess:incremental:{name}:base:rules" for name in lf_bases],
+            [lf_raw.select(pl.len())]
+            + list(lf_bases.values())
+            + _rule_counts_plans("base", {name: lf_shared for name in lf_bases}),
         )
-    ).filter(
-        pl.col("zscore_log").abs() <= 3  # Threshold for z-score
+        nrow_raw = st.rows_in = dfs[0].item()
+        bases = dict(zip(lf_bases, dfs[1 : n + 1]))
+        counts = {(name, "base"): df for name, df in zip(lf_bases, dfs[n + 1 :])}
+    logger.info(f"Loaded {nrow_raw} new rows of raw data")
+
+    ########################################
+    # -- Remove near-duplicate listings -- #
+    ########################################
+    """New listings are compared with each other and with the cleaned
+    ones of their partitions, which are kept when a new listing
+    duplicates them."""
+    frames, kept_rows = {}, {}
+    for name, df in bases.items():
+        columns = _key_columns(df.columns)
+        lf_old = scan_dataset(_dataset_path(name), columns=columns)
+        partition_cols = _partition_cols(columns)
+        if partition_cols:
+            partitions = df.select(partition_cols).unique().lazy()
+            lf_old = lf_old.join(partitions, on=partition_cols, how="semi")
+        df_old = lf_old.collect()
+        frames[name] = pl.concat([df_old, df.select(columns)], how="vertical_relaxed")
+        kept_rows[name] = df_old.height
+    removed = _near_duplicates(frames, counts, kept_rows)
+    bases = {name: drop_rows(df, removed[name]).lazy() for name, df in bases.items()}
+
+    #####################################
+    # -- Update the group statistics -- #
+    #####################################
+    """The statistics of the new rows are merged into the stored ones,
+    so the old rows never have to be read again."""
+    stats_old = GroupStatsStore.load(config.BASE_STATS_PATH)
+    stats = stats_old.merge(_collect_stats(bases))
+    grown = sum(_grown_groups(name, stats_old, stats) for name in bases)
+    if grown:
+        logger.info(f"{grown} small groups reached their minimum support")
+        return None
+
+    bounds = {name: _outlier_bounds(stats, name, lf) for name, lf in bases.items()}
+
+    # Small groups are the ones still small with the new listings
+    support = {name: _group_support(name, stats) for name in bases}
+    plans = [
+        BRANCHES[name][1](lf, bounds=bounds[name], support=support[name])
+        for name, lf in bases.items()
+    ]
+    plans += _rule_counts_plans(
+        "final",
+        {name: outlier_plan(lf, bounds[name]) for name, lf in bases.items()},
+        support,
     )
 
-    # Optional: drop the helper bound columns
-    df = df.drop(["LogPricePerSqm", "mean_log", "std_log", "zscore_log"])
-
     ###################################
-    # -- Give regions per District -- #
+    # -- Append to cleaned datasets -- #
     ###################################
-    """This section maps each district to its corresponding region, which is useful for regional analysis."""
+    with stage("preprocess:incremental:filter", logger, rows_in=nrow_raw) as st:
+        dfs = collect_all(
+            [f"preprocess:incremental:{name}" for name in lf_bases]
+            + [f"preprocess:incremental:{name}:final:rules" for name in lf_bases],
+            plans,
+        )
+        dfs_new = dfs[:n]
+        counts.update({(name, "final"): df for name, df in zip(lf_bases, dfs[n:])})
+        st.rows_out = sum(df.height for df in dfs_new)
+    _save_rule_counts(counts)
+
+    added = {}
+    for name, df_new in zip(lf_bases, dfs_new):
+        with stage(f"preprocess:append:{name}", logger, rows_in=df_new.height) as st:
+            df_old = read_dataset(_dataset_path(name)).select(df_new.columns)
+
+            # Only rows not in the dataset yet (it holds no duplicates)
+            df_added = df_new.unique().join(
+                df_old, on=df_new.columns, how="anti", nulls_equal=True
+            )
+            df = pl.concat([df_old, df_added], how="vertical_relaxed")
+            BRANCHES[name][2](df)
+            added[name] = df_added.lazy()
+            st.rows_out = df.height
+        logger.info(f"Appended {df_added.height} new rows to the {name} dataset")
+        _log_clean(name, df.height, skip_rows + nrow_raw)
+
+    with stage("preprocess:save:stats", logger):
+        stats.save(config.BASE_STATS_PATH)
+        clean_stats = GroupStatsStore.load(config.CLEAN_STATS_PATH)
+        clean_stats.merge(_collect_stats(added)).save(config.CLEAN_STATS_PATH)
+
+    return stats, nrow_raw
+
+
+def run_preprocess_stage(manifest, force=False):
+    """
+    Run the preprocessing pipeline only if needed.
+    - Skipped if the raw data, config and code did not change.
+    - Incremental if rows were only appended to the raw data, and
+      they make no group of a min_support rule large enough.
+    - Full rebuild otherwise.
+    """
+    outputs = [
+        config.BUILD_DATA_PATH,
+        config.LAND_DATA_PATH,
+        config.HOUSE_DATA_PATH,
+        config.APT_DATA_PATH,
+        config.BASE_STATS_PATH,
+        config.CLEAN_STATS_PATH,
+    ]
+    previous = manifest.get("preprocess")
+    raw_size = os.path.getsize(config.RAW_DATA_PATH)
+
+    # Hash the raw data (and the previously seen part of it)
+    prefix_digest = None
+    if previous is not None and previous["raw_size"] <= raw_size:
+        prefix_digest, raw_digest = file_digest(
+            config.RAW_DATA_PATH, prefix_size=previous["raw_size"]
+        )
+    else:
+        raw_digest = file_digest(config.RAW_DATA_PATH)
 
-    # Define a mapping from districts to regions
-    district_to_region = {
-        "Bragança": "Norte",
-        "Porto": "Norte",
-        "Braga": "Norte",
-        "Vila Real": "Norte",
-        "Viana do Castelo": "Norte",
-        "Viseu": "Centro",
-        "Aveiro": "Centro",
-        "Leiria": "Centro",
-        "Coimbra": "Centro",
-        "Guarda": "Centro",
-        "Castelo Branco": "Centro",
-        "Lisboa": "Lisboa",
-        "Setúbal": "Lisboa",
-        "Santarém": "Centro",
-        "Évora": "Alentejo",
-        "Portalegre": "Alentejo",
-        "Beja": "Alentejo",
-        "Faro": "Algarve",
-        "Ilha de Santa Maria": "Açores",
-        "Ilha de São Miguel": "Açores",
-        "Ilha Terceira": "Açores",
-        "Ilha do Faial": "Açores",
-        "Ilha das Flores": "Açores",
-        "Ilha de Porto Santo": "Madeira",
-        "Ilha da Madeira": "Madeira",
+    fingerprint = {
+        "raw": raw_digest,
+        "config": config_digest(PREPROCESS_CONFIG_KEYS),
+        "code": code_digest(PREPROCESS_CODE),
     }
 
-    df = df.with_columns(
-        pl.struct(["District"])
-        .map_elements(
-            lambda s: district_to_region.get(s["District"], None),
-            return_dtype=pl.String,
-        )
-        .alias("Region")
+    if not force and manifest.is_fresh("preprocess", fingerprint, outputs):
+        logger.info("Preprocess stage is up to date - skipped")
+        return False
+
+    appended = (
+        not force
+        and previous is not None
+        and prefix_digest == previous["fingerprint"]["raw"]
+        and previous["fingerprint"]["config"] == fingerprint["config"]
+        and previous["fingerprint"]["code"] == fingerprint["code"]
+        and all(os.path.exists(path) for path in outputs)
     )
 
-    #############################################
-    # -- Remove districts with small samples -- #
-    #############################################
-    """This section removes districts with small samples to ensure 
-    the dataset is robust for analysis."""
+    incremental = appended and preprocess_pipeline_incremental(previous["raw_rows"])
+    if incremental:
+        raw_rows = previous["raw_rows"] + incremental[1]
+    else:
+        _, _, raw_rows = preprocess_pipeline()
+    _save_group_cardinality()
 
-    removed_district = [
-        "Z - Fora de Portugal",
-        "Ilha do Faial",
-        "Ilha das Flores",
-    ]
-    df = df.filter(~pl.col("District").is_in(removed_district))
+    manifest.record("preprocess", fingerprint, raw_size=raw_size, raw_rows=raw_rows)
+    return True
 
-    ###########################
-    # -- Remove duplicates -- #
-    ###########################
-    """This section removes duplicate rows from the dataset to ensure data integrity."""
-    df = df.unique()
 
-    #######################
-    # -- Final dataset -- #
-    #######################
+def preprocess_pipeline_buildings():
+    """
+    Data preprocessing pipeline for buildings only.
+    """
+    return preprocess_pipeline(buildings=True, land=False)[0]["buildings"]
 
-    # Log resulting cleaned data
-    nrow_clean = df.height
-    logger.info(
-        f"Preprocessed data of land real estate with {nrow_clean} rows - {100 * round(nrow_clean / nrow_raw, ndigits=2)}% of the initial dataset."
-    )
 
-    # Save preprocessed dataset (all)
-    df.write_csv(config.LAND_DATA_PATH, separator=",")
+def preprocess_pipeline_land():
+    """
+    Data preprocessing pipeline for land only.
+    """
+    return preprocess_pipeline(buildings=False, land=True)[0]["land"]
 
 
 # Run the script
 if __name__ == "__main__":
     # Run the main preprocessing pipeline
-    preprocess_pipeline_buildings()
-    preprocess_pipeline_land()
+    preprocess_pipeline()
+    _save_group_cardinality()
@@ -1,14 +1,20 @@
 # Import libraries
-from sklearn.model_selection import StratifiedKFold, train_test_split
+import numpy as np
 import os
-import pickle
 
 # Import dependencies
 import config
+from src.manifest import path_digest, config_digest, code_digest
+from src.storage import read_dataset, resolve_dataset
+from src.folds import FoldSplit, dataset_digest, compact_indices, save_fold_indices
+from src.profiling import stage
 from src.logger import PyLogger
 
 # Setup logger
-logger = PyLogger(log_to_file=True, file_path="cribs")
+logger = PyLogger(log_to_file=True, file_path="cribs", stage="split")
+
+# Inputs that define a split stage (see src/manifest.py)
+SPLIT_CONFIG_KEYS = ["TEST_SIZE", "N_SPLITS", "SEED"]
 
 
 def split_data_pipeline(
@@ -18,47 +24,84 @@ def split_data_pipeline(
     test_size=config.TEST_SIZE,
     n_splits=config.N_SPLITS,
     random_state=config.SEED,
+    data_path=None,
 ):
     """
     Test size is 20% of the total size
     Number of splits is 5 folds
     Folds stratified by the column "strat_col"
+    Only the row positions of each set are saved, together with a
+    hash of `df` (and `data_path`, where `df` was read from).
     """
 
-    # Step 0: Remove unnecessary columns
-    df = df.drop(columns=["PricePerSqm"])
+    # scikit-learn is slow to import, only load it when a split is made
+    from sklearn.model_selection import StratifiedKFold, train_test_split
 
     # Step 1: Stratified train/test split
-    train_val_df, test_df = train_test_split(
-        df, test_size=test_size, stratify=df[strat_col], random_state=random_state
+    n_rows = len(df)
+    train_val_idx, test_idx = train_test_split(
+        np.arange(n_rows),
+        test_size=test_size,
+        stratify=df[strat_col],
+        random_state=random_state,
     )
 
     # Step 2: Stratified K-Fold on the training/validation set
     skf = StratifiedKFold(n_splits=n_splits, shuffle=True, random_state=random_state)
-    folds = []
+    train_folds, val_folds = [], []
 
     for fold, (train_idx, val_idx) in enumerate(
-        skf.split(train_val_df, train_val_df[strat_col])
+        skf.split(train_val_idx, df[strat_col].iloc[train_val_idx])
     ):
-        train_fold = train_val_df.iloc[train_idx].copy()
-        val_fold = train_val_df.iloc[val_idx].copy()
-        folds.append((train_fold, val_fold))
+        train_folds.append(compact_indices(train_val_idx[train_idx], n_rows))
+        val_folds.append(compact_indices(train_val_idx[val_idx], n_rows))
 
     # Save to a file
-    with open(save_path, "wb") as f:
-        pickle.dump({"folds": folds, "test_set": test_df}, f)
+    save_fold_indices(
+        save_path,
+        train_folds,
+        val_folds,
+        compact_indices(test_idx, n_rows),
+        dataset_digest(df),
+        data_path,
+    )
+
+    logger.info(f"Folds and test set indices saved to: {os.path.relpath(save_path)}")
+    return FoldSplit(save_path, df=df)
 
-    logger.info(f"Folds and test set saved to: {os.path.relpath(save_path)}")
-    return folds, test_df
+
+def run_split_stage(manifest, name, data_path, strat_col, save_path, force=False):
+    """
+    Run the data split pipeline only if the cleaned dataset,
+    the split config or this code changed since the last run.
+    """
+    fingerprint = {
+        "data": path_digest(resolve_dataset(data_path)),
+        "config": config_digest(SPLIT_CONFIG_KEYS),
+        "code": code_digest(
+            [__file__, os.path.join(os.path.dirname(__file__), "src", "folds.py")]
+        ),
+        "strat_col": strat_col,
+        "save_path": save_path,
+    }
+    stage_name = f"split:{name}"
+
+    if not force and manifest.is_fresh(stage_name, fingerprint, [save_path]):
+        logger.info(f"Split stage for {name} is up to date - skipped")
+        return False
+
+    with stage(stage_name, logger) as st:
+        df = read_dataset(data_path, to_pandas=True)
+        split_data_pipeline(df, strat_col, save_path, data_path=data_path)
+        st.rows_in = st.rows_out = len(df)
+    manifest.record(stage_name, fingerprint)
+    return True
 
 
 if __name__ == "__main__":
     # Test the pipeline
-    with open(config.CROSS_VAL_LAND_PATH, "rb") as f:
-        data = pickle.load(f)
-
-    folds = data["folds"]
-    test_set = data["test_set"]
+    split = FoldSplit(config.CROSS_VAL_LAND_PATH)
 
-    print(folds)
-    print(test_set)
+    for train_fold, val_fold in split:
+        print(train_fold.shape, val_fold.shape)
+    print(split.test_set())
@@ -0,0 +1,202 @@
+from typing import Dict, Optional, Sequence
+
+import polars as pl
+
+
+class CleaningRules:
+    """
+    Ordered cleaning rules, declared as dicts (see config.CLEANING_RULES)
+    with a "name", a "kind" and the parameters of that kind:
+    - drop_columns: remove "columns" (missing ones are ignored)
+    - select_columns: keep only "columns"
+    - keep_values: keep rows whose "column" is in "values"
+    - drop_values: remove rows whose "column" is in "values"
+    - fill_null: replace nulls of "column" with "value"
+    - replace: map values of "column" with "mapping" (others unchanged)
+    - drop_nulls: remove rows with a null in "columns" (default: all kept)
+    - min_support: groups of "column" (within the groups of the optional
+      "by" columns) with fewer than "min_count" rows, counting the rows
+      kept by the filters before it, are removed ("policy": "drop") or
+      renamed after the value of their "parent" column ("policy": "rollup"),
+      e.g. "Lisboa (other)" (see ROLLUP_LABEL), so they never take the
+      name of an existing group
+
+    A "parent" may also be one of the `derived` expressions, e.g. the
+    Region of a District before the dataset has a Region column.
+    The group counts of a min_support rule can be counted elsewhere
+    (e.g. over more rows than the frame holds) and given instead with a
+    `support` frame of its "by" and "column" columns and "count".
+
+    The rules are compiled into a single filter and a single projection,
+    so applying them adds one pass over the rows whatever their number.
+    Group counts are computed with a group_by and joined back, which
+    the streaming engine runs in bounded memory (unlike a window).
+    A filter sees the columns as rewritten by the rules before it.
+    Rows removed by a filter (as null/false) are counted per rule by
+    `removal_counts`, each against the rows the previous filters kept.
+    """
+
+    # Name of a rolled up group, from the value of its parent
+    ROLLUP_LABEL = "{} (other)"
+
+    KINDS = {
+        "drop_columns": ["columns"],
+        "select_columns": ["columns"],
+        "keep_values": ["column", "values"],
+        "drop_values": ["column", "values"],
+        "fill_null": ["column", "value"],
+        "replace": ["column", "mapping"],
+        "drop_nulls": [],
+        "min_support": ["column", "min_count", "policy"],
+    }
+
+    def __init__(
+        self, rules: Sequence[Dict], derived: Optional[Dict[str, pl.Expr]] = None
+    ):
+        self.rules = [dict(rule) for rule in rules]
+        self.derived = dict(derived or {})
+        for rule in self.rules:
+            kind = rule.get("kind")
+            if kind not in self.KINDS:
+                raise ValueError(f"Unknown kind of cleaning rule {rule.get('name')}")
+            missing = [p for p in ["name"] + self.KINDS[kind] if p not in rule]
+            if kind == "min_support" and rule.get("policy") == "rollup":
+                missing += [p for p in ["parent"] if p not in rule]
+            if missing:
+                raise ValueError(f"Cleaning rule {rule.get('name')} misses {missing}")
+            if kind == "min_support" and rule["policy"] not in ("drop", "rollup"):
+                raise ValueError(f"Unknown policy of cleaning rule {rule['name']}")
+
+    def compile(self, columns: Sequence[str], until: Optional[str] = None):
+        """
+        Compile the rules for a frame with `columns`, up to the rule
+        named `until` (excluded) if given. A min_support rule reads its
+        group counts from the "_support_<name>" column of the frame.
+
+        Returns:
+            tuple: the output columns as {name: expression} and the
+                filters as [(rule name, predicate)], in rule order.
+        """
+        exprs = {column: pl.col(column) for column in columns}
+        filters = []
+
+        def column(rule):
+            if rule["column"] not in exprs:
+                raise ValueError(
+                    f"Cleaning rule {rule['name']} needs column {rule['column']}"
+                )
+            return exprs[rule["column"]]
+
+        def add_filter(name, predicate):
+            filters.append((name, predicate))
+
+        for rule in self.rules:
+            kind = rule["kind"]
+            if rule["name"] == until:
+                break
+            if kind == "drop_columns":
+                for name in rule["columns"]:
+                    exprs.pop(name, None)
+            elif kind == "select_columns":
+                missing = [name for name in rule["columns"] if name not in exprs]
+                if missing:
+                    raise ValueError(f"Cleaning rule {rule['name']} needs {missing}")
+                exprs = {name: exprs[name] for name in rule["columns"]}
+            elif kind == "keep_values":
+                add_filter(rule["name"], column(rule).is_in(rule["values"]))
+            elif kind == "drop_values":
+                add_filter(rule["name"], ~column(rule).is_in(rule["values"]))
+            elif kind == "fill_null":
+                exprs[rule["column"]] = column(rule).fill_null(rule["value"])
+            elif kind == "replace":
+                exprs[rule["column"]] = column(rule).replace(rule["mapping"])
+            elif kind == "drop_nulls":
+                names = rule.get("columns") or list(exprs)
+                predicate = pl.all_horizontal(exprs[n].is_not_null() for n in names)
+                add_filter(rule["name"], predicate)
+            elif kind == "min_support":
+                column(rule)  # counted on the column as rewritten so far
+                count = pl.col(f"_support_{rule['name']}").fill_null(0)
+                small = count < rule["min_count"]
+                if rule["policy"] == "drop":
+                    add_filter(rule["name"], ~small)
+                else:
+                    parent = exprs.get(rule["parent"], self.derived.get(rule["parent"]))
+                    if parent is None:
+                        raise ValueError(
+                            f"Cleaning rule {rule['name']} needs {rule['parent']}"
+                        )
+                    exprs[rule["column"]] = (
+                        pl.when(small)
+                        .then(pl.format(self.ROLLUP_LABEL, parent))
+                        .otherwise(column(rule))
+                    )
+
+        return exprs, filters
+
+    def _with_support(self, lf, support):
+        # Left join the group counts of each min_support rule, the
+        # given ones or those of the rows the filters before it keep
+        support = support or {}
+        columns = lf.collect_schema().names()
+        for rule in self.rules:
+            if rule["kind"] != "min_support":
+                continue
+            keys = rule.get("by", []) + [rule["column"]]
+            exprs, filters = self.compile(columns, until=rule["name"])
+            if rule["name"] in support:
+                counts = support[rule["name"]].lazy()
+            else:
+                kept = pl.all_horizontal(
+                    [pl.lit(True)] + [p.fill_null(False) for _, p in filters]
+                )
+                counts = (
+                    lf.filter(kept)
+                    .select(exprs[key].alias(key) for key in keys)
+                    .group_by(keys)
+                    .agg(pl.len().alias("count"))
+                )
+            lf = lf.join(
+                counts.select(
+                    keys + [pl.col("count").alias(f"_support_{rule['name']}")]
+                ),
+                left_on=[exprs[key] for key in keys],
+                right_on=keys,
+                how="left",
+                nulls_equal=True,
+                maintain_order="left",
+            )
+        return lf, columns
+
+    def apply(
+        self, lf: pl.LazyFrame, support: Optional[Dict[str, pl.DataFrame]] = None
+    ) -> pl.LazyFrame:
+        """
+        Lazy plan of the rules applied to `lf`, with the group counts
+        of the min_support rules in `support` (by rule name) if given.
+        """
+        lf, columns = self._with_support(lf, support)
+        exprs, filters = self.compile(columns)
+        columns = [expr.alias(name) for name, expr in exprs.items()]
+        if not filters:
+            return lf.select(columns)
+
+        keep = pl.all_horizontal(predicate for _, predicate in filters)
+        return lf.filter(keep).select(columns)
+
+    def removal_counts(
+        self, lf: pl.LazyFrame, support: Optional[Dict[str, pl.DataFrame]] = None
+    ) -> pl.LazyFrame:
+        """
+        Lazy one-row frame with the number of rows of `lf` ("rows_in")
+        and the number each filtering rule removes (one column per rule).
+        """
+        lf, columns = self._with_support(lf, support)
+        _, filters = self.compile(columns)
+
+        kept, counts = pl.lit(True), [pl.len().alias("rows_in")]
+        for name, predicate in filters:
+            passed = predicate.fill_null(False)
+            counts.append((kept & ~passed).sum().alias(name))
+            kept = kept & passed
+        return lf.select(counts)
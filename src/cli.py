@@ -0,0 +1,187 @@
+"""
+Command line entry point of the project.
+
+Usage (from the repository root, see README.md):
+    python -m src.cli preprocess [--force] [--streaming]
+    python -m src.cli split [--force]
+    python -m src.cli score (--listing JSON | CANDIDATES) [--type TYPE]
+                            [--output PATH] [--fair-price]
+    python -m src.cli train {house,apt,land} [--engine ENGINE] [--workers N]
+                            [--no-save] [--tuned]
+    python -m src.cli tune {house,apt,land} [--engine ENGINE] [--configs N]
+                           [--workers N]
+    python -m src.cli serve [--host HOST] [--port PORT]
+
+Each subcommand imports the libraries it needs when it runs, so a
+lookup does not pay for scikit-learn or matplotlib at startup.
+"""
+
+import argparse
+import json
+import sys
+
+import config
+
+# Module and training function of each model engine
+ENGINES = {
+    "random_forest": ("models.random_forest", "run_random_forest"),
+    "gradient_boosting": ("models.gradient_boosting", "run_hist_gradient_boosting"),
+}
+
+# Fold file of each dataset trained on
+TRAIN_SPLITS = {
+    "house": "CROSS_VAL_HOUSE_PATH",
+    "apt": "CROSS_VAL_APT_PATH",
+    "land": "CROSS_VAL_LAND_PATH",
+}
+
+
+#####################
+# -- Subcommands -- #
+#####################
+def cmd_preprocess(args):
+    from main import run_pipelines
+
+    if args.streaming:
+        config.STREAMING = True
+    run_pipelines(dpp=True, force=args.force, split=False)
+
+
+def cmd_split(args):
+    from main import run_pipelines
+
+    run_pipelines(dpp=False, force=args.force)
+
+
+def cmd_score(args):
+    import polars as pl
+
+    from src.scoring import score_listings
+
+    if args.listing is not None:
+        candidates = pl.DataFrame([json.loads(args.listing)])
+    else:
+        candidates = args.candidates
+    scored = score_listings(
+        candidates, property_type=args.type, fair_price=args.fair_price
+    )
+
+    if args.output:
+        scored.write_parquet(args.output)
+    elif args.listing is not None:
+        print(json.dumps(scored.row(0, named=True), default=str))
+    else:
+        with pl.Config(tbl_rows=20, tbl_cols=-1):
+            print(scored)
+
+
+def cmd_train(args):
+    from importlib import import_module
+
+    from models.registry import MODEL_TYPES, model_path
+    from src.folds import FoldSplit
+
+    module, function = ENGINES[args.engine]
+    run_engine = getattr(import_module(module), function)
+
+    split = FoldSplit(getattr(config, TRAIN_SPLITS[args.dataset]))
+
+    params = {}
+    if args.tuned:
+        from models.tuning import best_params
+
+        params = best_params(args.engine, MODEL_TYPES[args.dataset], split.source_hash)
+        if params is None:
+            sys.exit(
+                f"No tuning results for {args.engine} on the current "
+                f"{args.dataset} split, run the tune command first"
+            )
+
+    save_path = None if args.no_save else model_path(MODEL_TYPES[args.dataset])
+    results = run_engine(split, n_workers=args.workers, save_path=save_path, **params)
+    print(json.dumps(results, indent=2, default=float))
+
+
+def cmd_tune(args):
+    from models.registry import MODEL_TYPES
+    from models.tuning import successive_halving
+    from src.folds import FoldSplit
+
+    split = FoldSplit(getattr(config, TRAIN_SPLITS[args.dataset]))
+    search = successive_halving(
+        args.engine,
+        split,
+        MODEL_TYPES[args.dataset],
+        n_configs=args.configs,
+        n_workers=args.workers,
+    )
+    print(json.dumps(search["best"], indent=2))
+
+
+def cmd_serve(args):
+    from src.service import serve
+
+    serve(args.host, args.port)
+
+
+################
+# -- Parser -- #
+################
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog="python -m src.cli",
+        description="Calculator of Real-estate Investments and Bargain Scores",
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    p = commands.add_parser("preprocess", help="clean the raw listings")
+    p.add_argument("--force", action="store_true", help="ignore the build manifest")
+    p.add_argument("--streaming", action="store_true", help="two-pass streaming mode")
+    p.set_defaults(func=cmd_preprocess)
+
+    p = commands.add_parser("split", help="make the cross-validation folds")
+    p.add_argument("--force", action="store_true", help="ignore the build manifest")
+    p.set_defaults(func=cmd_split)
+
+    p = commands.add_parser("score", help="score listings against their group")
+    source = p.add_mutually_exclusive_group(required=True)
+    source.add_argument("candidates", nargs="?", help="Parquet or Arrow IPC file")
+    source.add_argument("--listing", help="one listing as a JSON object")
+    p.add_argument("--type", help="real estate type of all the candidates")
+    p.add_argument("--output", help="write the scores to this Parquet file")
+    p.add_argument(
+        "--fair-price", action="store_true", help="add the trained models' prices"
+    )
+    p.set_defaults(func=cmd_score)
+
+    p = commands.add_parser("train", help="cross-validate and save a model")
+    p.add_argument("dataset", choices=sorted(TRAIN_SPLITS))
+    p.add_argument("--engine", choices=sorted(ENGINES), default="random_forest")
+    p.add_argument("--workers", type=int, help="folds fitted at the same time")
+    p.add_argument("--no-save", action="store_true", help="do not save the model")
+    p.add_argument("--tuned", action="store_true", help="use the best tuned params")
+    p.set_defaults(func=cmd_train)
+
+    p = commands.add_parser("tune", help="search hyperparameters (resumable)")
+    p.add_argument("dataset", choices=sorted(TRAIN_SPLITS))
+    p.add_argument("--engine", choices=sorted(ENGINES), default="random_forest")
+    p.add_argument("--configs", type=int, default=config.TUNING_N_CONFIGS)
+    p.add_argument("--workers", type=int, help="fits run at the same time")
+    p.set_defaults(func=cmd_tune)
+
+    p = commands.add_parser("serve", help="run the local scoring service")
+    p.add_argument("--host", default=config.SERVICE_HOST)
+    p.add_argument("--port", type=int, default=config.SERVICE_PORT)
+    p.set_defaults(func=cmd_serve)
+
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    args.func(args)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
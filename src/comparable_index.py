@@ -0,0 +1,130 @@
+import os
+from itertools import combinations, product
+from typing import Dict, Optional, Sequence
+
+import numpy as np
+import polars as pl
+
+from src.storage import resolve_dataset, scan_dataset
+
+# Location columns listings are grouped by
+INDEX_LEVELS = ("Region", "District", "City")
+
+
+class ComparableIndex:
+    """
+    In-memory index of comparable listings.
+    Listings are pre-grouped by every combination of the location
+    levels, and each group keeps its PricePerSqm values sorted, so a
+    lookup is a dict access and a median/percentile is O(log n).
+    """
+
+    def __init__(
+        self,
+        df: pl.DataFrame,
+        levels: Sequence[str] = INDEX_LEVELS,
+        value_col: str = "PricePerSqm",
+    ):
+        self.levels = tuple(levels)
+        self.value_col = value_col
+        self.groups = {}
+        self._derived = {}
+
+        # Index every subset of levels, e.g. (District,), (Region, City), ...
+        for r in range(len(self.levels) + 1):
+            for keys in combinations(self.levels, r):
+                self.groups[keys] = self._build_groups(df, list(keys))
+
+    def _build_groups(self, df, keys):
+        values = pl.col(self.value_col).drop_nulls().sort()
+        if not keys:
+            return {(): df.select(values).to_series().to_numpy()}
+
+        grouped = df.group_by(keys).agg(values)
+        return {
+            tuple(row[:-1]): np.asarray(row[-1], dtype=np.float64)
+            for row in grouped.iter_rows()
+        }
+
+    @classmethod
+    def from_path(cls, path, levels: Sequence[str] = INDEX_LEVELS):
+        """
+        Build the index from a clean dataset, reading only the needed columns.
+        """
+        df = scan_dataset(path, columns=list(levels) + ["PricePerSqm"]).collect()
+        return cls(df, levels=levels)
+
+    def lookup(self, filters: Dict[str, object]) -> Optional[np.ndarray]:
+        """
+        Sorted PricePerSqm values of the listings matching `filters`
+        (level -> value or list of values), or None if there are none.
+        """
+        unknown = set(filters) - set(self.levels)
+        if unknown:
+            raise KeyError(f"Cannot filter comparables on {sorted(unknown)}")
+
+        keys = tuple(level for level in self.levels if level in filters)
+        choices = [
+            filters[k] if isinstance(filters[k], list) else [filters[k]] for k in keys
+        ]
+
+        # One dict access per combination of the requested values
+        groups = self.groups[keys]
+        arrays = [groups[combo] for combo in product(*choices) if combo in groups]
+        if not arrays:
+            return None
+        if len(arrays) == 1:
+            return arrays[0]
+        return np.sort(np.concatenate(arrays))
+
+    def cached(self, key, builder):
+        """
+        Per-group data derived from the index (e.g. plot distributions),
+        computed once by `builder()` and dropped with the index.
+        """
+        if key not in self._derived:
+            self._derived[key] = builder()
+        return self._derived[key]
+
+    @staticmethod
+    def quantile(values: np.ndarray, q: float) -> float:
+        """
+        Linearly interpolated quantile of a sorted array, in O(1).
+        """
+        pos = q * (len(values) - 1)
+        lower = int(np.floor(pos))
+        upper = min(lower + 1, len(values) - 1)
+        return float(values[lower] + (values[upper] - values[lower]) * (pos - lower))
+
+    def median(self, filters: Dict[str, object]) -> Optional[float]:
+        values = self.lookup(filters)
+        return None if values is None else self.quantile(values, 0.5)
+
+    def percentile_rank(self, filters: Dict[str, object], value: float):
+        """
+        Share of comparable listings priced at or below `value`.
+        """
+        values = self.lookup(filters)
+        if values is None:
+            return None
+        return float(np.searchsorted(values, value, side="right") / len(values))
+
+
+# Indexes built so far, keyed by dataset path
+_INDEX_CACHE = {}
+
+
+def get_comparable_index(path, levels: Sequence[str] = INDEX_LEVELS):
+    """
+    Return the index of a clean dataset, building it only on first use
+    or when the dataset was rewritten since.
+    """
+    source = resolve_dataset(path)
+    mtime = os.stat(source).st_mtime_ns if os.path.exists(source) else None
+    key = (path, tuple(levels))
+
+    cached = _INDEX_CACHE.get(key)
+    if cached is None or cached[0] != mtime:
+        cached = (mtime, ComparableIndex.from_path(path, levels=levels))
+        _INDEX_CACHE[key] = cached
+    return cached[1]
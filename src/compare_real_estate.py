@@ -1,41 +1,64 @@
-import pandas as pd
-import numpy as np
-import seaborn as sns
-import matplotlib.pyplot as plt
 import sys
 import os
 
+import numpy as np
+
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
-from config import LAND_DATA_PATH
+from config import LAND_DATA_PATH, CLEAN_STATS_PATH, COMPARABLE_MIN_SUPPORT
+from src.comparable_index import ComparableIndex, get_comparable_index
+from src.group_stats import get_group_stats
 
 
-def compare_land(input_dict, df_path=LAND_DATA_PATH):
+def compare_land(
+    input_dict, df_path=LAND_DATA_PATH, plot_path=None, stats_path=CLEAN_STATS_PATH
+):
     """
     Match input land specs with land dataset.
+    The number, median and rank of the comparables come from the
+    group statistics store, loaded once, so no listing is read.
+    If no listing matches the location exactly (e.g. a City with no
+    listings), the most similar listings (see src/nearest_comparables.py)
+    are used instead. If fewer than COMPARABLE_MIN_SUPPORT listings
+    match, the City, then the District, is dropped from the location.
+    If `plot_path` is given, the comparison plot (PNG/SVG) is written
+    there, from the comparables of an in-memory index of the dataset.
     """
 
-    df = pd.read_csv(df_path)
-
     # Keywords to skip of the input dictionary
     skip_keywords = ["AreaAssigned", "Price"]
 
-    # Filter dtaframe according to the inputs
-    for column, value in input_dict.items():
-        # Skip specific columns
-        if any(kw in column for kw in skip_keywords):
-            continue  # Skip unwanted filters
-
-        if isinstance(value, list):
-            # If more than one value in an input index
-            df = df[df[column].isin(value)]
-        else:
-            df = df[df[column] == value]
-
-    if df.empty:
+    # Find the comparable listings according to the inputs
+    filters = {
+        column: value
+        for column, value in input_dict.items()
+        if not any(kw in column for kw in skip_keywords)
+    }
+    stats = get_group_stats(stats_path)
+    group = stats.lookup(filters, types=["Land"])
+
+    # Back off to the parent location while there are too few listings
+    for column, parent in [("City", "District"), ("District", "Region")]:
+        if group is None or group[1].sum() >= COMPARABLE_MIN_SUPPORT:
+            break
+        if column in filters and parent in filters:
+            wider = {k: v for k, v in filters.items() if k != column}
+            filters, group = wider, stats.lookup(wider, types=["Land"])
+            print(f"Few matches in the {column} - using its {parent}.")
+
+    # Back off to the nearest listings (needs the area and a District)
+    nearest = None
+    if group is None and input_dict.get("AreaAssigned") and "District" in filters:
+        from src.nearest_comparables import get_nearest_comparables
+
+        nearest = get_nearest_comparables("Land").query(input_dict)
+        print("No exact matches - using the most similar listings.")
+
+    if group is None and nearest is None:
         print("No matches found - check your input values.")
         return None
 
-    print(df.head())
+    n_comparables = int(group[1].sum()) if nearest is None else nearest.height
+    print(f"Found {n_comparables} comparable listings.")
 
     # Get the area and the price of the input
     area_input = input_dict.get("AreaAssigned", None)
@@ -49,30 +72,43 @@ def compare_land(input_dict, df_path=LAND_DATA_PATH):
     price_per_sqm = price_input / area_input
     print(f"Input Price per Sqm: {price_per_sqm:.2f} EUR/m2")
 
-    # Median price per square meter
-    median_price = df["PricePerSqm"].median()
-
-    sns.histplot(data=df, x=np.log(df["PricePerSqm"]), kde=True)
-    plt.xlabel("log(PricePerSqm)")
-    plt.title("Distribution of Price per Sqm in the Dataset")
-    plt.axvline(
-        np.log(price_per_sqm),
-        color="red",
-        linestyle="--",
-        label=f"Input: {price_per_sqm:.2f} €/m2",
-    )
-    plt.axvline(
-        np.log(median_price),
-        color="darkblue",
-        linestyle="--",
-        label=f"Median: {median_price:.2f} €/m2",
-    )
-
-    plt.legend()
-    plt.tight_layout()
-    plt.show()
-
-    return None
+    # Median price per square meter and rank of the input
+    if nearest is None:
+        median_price = stats.quantile(group, 0.5)
+        percentile = stats.percentile_rank(group, price_per_sqm)
+    else:
+        values = nearest["PricePerSqm"].sort().to_numpy()
+        median_price = ComparableIndex.quantile(values, 0.5)
+        percentile = float(
+            np.searchsorted(values, price_per_sqm, side="right") / len(values)
+        )
+
+    # Plot the comparison (the group distribution is computed once per group)
+    if plot_path is not None:
+        from src.plot_comparison import group_distribution, plot_comparison
+
+    if plot_path is not None and nearest is not None:
+        distribution = group_distribution(values)
+        plot_comparison(distribution, price_per_sqm, median_price, path=plot_path)
+    elif plot_path is not None:
+        index = get_comparable_index(df_path)
+        values = index.lookup(filters)
+        group_key = tuple(
+            sorted(
+                (k, tuple(v) if isinstance(v, list) else v) for k, v in filters.items()
+            )
+        )
+        distribution = index.cached(
+            ("distribution", group_key), lambda: group_distribution(values)
+        )
+        plot_comparison(distribution, price_per_sqm, median_price, path=plot_path)
+
+    return {
+        "price_per_sqm": price_per_sqm,
+        "median_price_per_sqm": median_price,
+        "percentile": percentile,
+        "n_comparables": n_comparables,
+    }
 
 
 if __name__ == "__main__":
@@ -84,4 +120,4 @@ if __name__ == "__main__":
         "Price": 27000,  # in euros
     }
 
-    compare_land(input_dict=land_dict)
+    compare_land(input_dict=land_dict, plot_path="comparison-land.png")
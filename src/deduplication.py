@@ -0,0 +1,174 @@
+"""
+Near-duplicate listings: the same property listed again with a rounded
+price or a slightly different area.
+
+Listings are only compared within a block (same Type, District and
+City, and the same value of every column with a zero tolerance, e.g.
+the rooms). Within a block they are sorted on each column with a
+tolerance, and every listing is compared with its `window` next
+neighbours only (sorted neighbourhood), so the cost grows with
+rows x window instead of rows^2. Each cluster of near-duplicates has a
+representative, its first listing, and only holds listings within the
+tolerances of it, so a chain of small differences never merges
+distinct properties. Only the representatives are kept.
+"""
+
+from typing import Dict, Sequence, Union
+
+import numpy as np
+import polars as pl
+
+import config
+
+
+def dedup_columns(
+    columns: Sequence[str],
+    block_cols: Sequence[str] = config.DEDUP_BLOCK_COLS,
+    tolerances: Dict[str, float] = config.DEDUP_TOLERANCES,
+):
+    """
+    Block and compared columns present in `columns`.
+    """
+    return [c for c in block_cols if c in columns], {
+        c: t for c, t in tolerances.items() if c in columns
+    }
+
+
+def _representatives(a: np.ndarray, b: np.ndarray, n_rows: int) -> np.ndarray:
+    """
+    Representative of each of `n_rows` rows, given the pairs of linked
+    rows `a` < `b`. Rows are visited in order and join the first earlier
+    row they are linked to that is a representative itself, or else
+    become one.
+
+    Rows are settled in rounds of vectorized steps over the pairs left:
+    a row linked to an earlier representative is not one, a row only
+    linked to earlier rows that are not representatives is one. Each
+    round costs O(pairs) and settles at least the first row left, in
+    practice every row whose earlier links are settled, so the rounds
+    are bounded by the longest chain of linked rows (a few for listings).
+    """
+    undecided = np.zeros(n_rows, dtype=bool)
+    undecided[b] = True
+    is_rep = ~undecided
+    lo, hi = a, b
+    while len(lo):
+        linked = np.zeros(n_rows, dtype=bool)
+        linked[hi[is_rep[lo]]] = True
+        waiting = np.zeros(n_rows, dtype=bool)
+        waiting[hi[undecided[lo]]] = True
+        settled = undecided & (linked | ~waiting)
+        is_rep[settled & ~linked] = True
+        undecided[settled] = False
+
+        # Pairs that can still settle their later row
+        keep = undecided[hi] & (undecided[lo] | is_rep[lo])
+        lo, hi = lo[keep], hi[keep]
+    is_rep |= undecided
+
+    # Every other row joins its first linked representative
+    joins = is_rep[a] & ~is_rep[b]
+    lo, hi = a[joins], b[joins]
+    order = np.lexsort((lo, hi))
+    lo, hi = lo[order], hi[order]
+    first = np.ones(len(hi), dtype=bool)
+    first[1:] = hi[1:] != hi[:-1]
+
+    representative = np.arange(n_rows, dtype=np.int64)
+    representative[hi[first]] = lo[first]
+    return representative
+
+
+def near_duplicate_clusters(
+    df: pl.DataFrame,
+    block_cols: Sequence[str] = config.DEDUP_BLOCK_COLS,
+    tolerances: Dict[str, float] = config.DEDUP_TOLERANCES,
+    window: int = config.DEDUP_WINDOW,
+) -> pl.DataFrame:
+    """
+    Clusters of near-duplicate rows of `df`. Two rows are linked when
+    they share the `block_cols` and, for each column of `tolerances`,
+    differ by at most that share of the larger of their two values.
+    Columns missing from `df` are ignored, and rows with a null in them
+    are never linked. A row joins the cluster of the first earlier row
+    it is linked to that represents a cluster (see `_representatives`).
+
+    Rows are identified by their "_row" column if `df` has one (e.g. a
+    block of a larger frame), by their position otherwise.
+
+    Returns the rows of the clusters of 2+ rows: "_row", "cluster"
+    ("_row" of its representative) and "cluster_size".
+    """
+    block_cols, tolerances = dedup_columns(df.columns, block_cols, tolerances)
+    exact = block_cols + [c for c, t in tolerances.items() if t == 0]
+    df = df.sort("_row") if "_row" in df.columns else df.with_row_index("_row")
+    rows = df["_row"].cast(pl.UInt32)
+
+    # Rows are linked by their position, in "_row" order
+    keys = df.lazy().select(block_cols + list(tolerances)).with_row_index("_pos")
+
+    def linked(k):
+        # Row and its k-th next neighbour share the block and are close
+        other = {c: pl.col(c).shift(-k) for c in block_cols + list(tolerances)}
+        return pl.all_horizontal(
+            [pl.col(c) == other[c] for c in exact]
+            + [
+                (pl.col(c) - other[c]).abs()
+                <= t * pl.max_horizontal(pl.col(c).abs(), other[c].abs())
+                for c, t in tolerances.items()
+                if t > 0
+            ]
+        ).fill_null(False)
+
+    # One sorted pass per column with a tolerance (or on the block only)
+    sort_cols = [c for c, t in tolerances.items() if t > 0] or [None]
+    edges = []
+    for sort_col in sort_cols:
+        ordered = keys.sort(exact + ([sort_col] if sort_col else []), nulls_last=True)
+        edges += [
+            ordered.select(
+                pl.min_horizontal("_pos", pl.col("_pos").shift(-k)).alias("a"),
+                pl.max_horizontal("_pos", pl.col("_pos").shift(-k)).alias("b"),
+                linked(k).alias("_linked"),
+            )
+            .filter(pl.col("_linked"))
+            .drop("_linked")
+            for k in range(1, window + 1)
+        ]
+    edges = pl.concat(pl.collect_all(edges)).unique()
+
+    empty = pl.DataFrame(
+        schema={"_row": pl.UInt32, "cluster": pl.UInt32, "cluster_size": pl.UInt32}
+    )
+    if edges.height == 0:
+        return empty
+
+    representative = _representatives(
+        edges["a"].to_numpy(), edges["b"].to_numpy(), df.height
+    )
+    return (
+        pl.DataFrame({"_row": rows, "cluster": rows.gather(representative)})
+        .with_columns(pl.len().over("cluster").cast(pl.UInt32).alias("cluster_size"))
+        .filter(pl.col("cluster_size") > 1)
+    )
+
+
+def duplicate_rows(clusters: pl.DataFrame) -> pl.Series:
+    """
+    Row indices of the near-duplicates to remove (all but the
+    representative of each cluster).
+    """
+    return clusters.filter(pl.col("_row") != pl.col("cluster"))["_row"]
+
+
+def drop_rows(
+    df: Union[pl.DataFrame, pl.LazyFrame], rows: pl.Series
+) -> Union[pl.DataFrame, pl.LazyFrame]:
+    """
+    `df` without the rows at the indices `rows`.
+    """
+    return (
+        df.with_row_index("_row")
+        .filter(~pl.col("_row").is_in(rows.implode()))
+        .drop("_row")
+    )
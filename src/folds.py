@@ -0,0 +1,97 @@
+import hashlib
+import os
+
+import numpy as np
+import pandas as pd
+
+from src.storage import read_dataset
+
+
+def dataset_digest(df: pd.DataFrame) -> str:
+    """
+    SHA-256 of the content and row order of a DataFrame.
+    """
+    row_hashes = pd.util.hash_pandas_object(df, index=False).to_numpy()
+    h = hashlib.sha256(row_hashes.tobytes())
+    h.update(",".join(map(str, df.columns)).encode())
+    return h.hexdigest()
+
+
+def compact_indices(idx, n_rows):
+    """
+    Row positions in the smallest integer dtype that can hold them.
+    """
+    dtype = np.int32 if n_rows < np.iinfo(np.int32).max else np.int64
+    return np.asarray(idx, dtype=dtype)
+
+
+def save_fold_indices(save_path, train_idx, val_idx, test_idx, source_hash, data_path):
+    """
+    Save a split as row positions only (no data copies).
+    """
+    arrays = {"test": test_idx}
+    for fold, (train, val) in enumerate(zip(train_idx, val_idx)):
+        arrays[f"train_{fold}"] = train
+        arrays[f"val_{fold}"] = val
+
+    os.makedirs(os.path.dirname(save_path) or ".", exist_ok=True)
+    with open(save_path, "wb") as f:
+        np.savez(
+            f,
+            source_hash=np.array(source_hash),
+            data_path=np.array(data_path or ""),
+            **arrays,
+        )
+
+
+class FoldSplit:
+    """
+    Cross-validation split stored as row positions of a clean dataset.
+    Fold and test DataFrames are only materialized when accessed,
+    as row selections of the dataset the split was made from.
+    Iterating over it yields (train_df, val_df) tuples.
+    """
+
+    def __init__(self, path, df=None):
+        with np.load(path) as data:
+            self.source_hash = str(data["source_hash"])
+            self.data_path = str(data["data_path"]) or None
+            self.test_idx = data["test"]
+            n_splits = sum(1 for key in data.files if key.startswith("train_"))
+            self.train_idx = [data[f"train_{i}"] for i in range(n_splits)]
+            self.val_idx = [data[f"val_{i}"] for i in range(n_splits)]
+
+        self._df = df
+        self._verified = False
+
+    @property
+    def df(self):
+        """
+        Source dataset, loaded on first use and checked against the split.
+        """
+        if self._df is None:
+            if self.data_path is None:
+                raise ValueError("Split has no data path, pass the dataset as df")
+            self._df = read_dataset(self.data_path, to_pandas=True)
+
+        if not self._verified:
+            if dataset_digest(self._df) != self.source_hash:
+                raise ValueError(
+                    "Dataset does not match the one the split was made from"
+                )
+            self._verified = True
+        return self._df
+
+    def __len__(self):
+        return len(self.train_idx)
+
+    def __getitem__(self, fold):
+        df = self.df
+        return df.iloc[self.train_idx[fold]], df.iloc[self.val_idx[fold]]
+
+    def __iter__(self):
+        for fold in range(len(self)):
+            yield self[fold]
+
+    def test_set(self):
+        return self.df.iloc[self.test_idx]
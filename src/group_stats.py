@@ -0,0 +1,494 @@
+import math
+import os
+import shutil
+from functools import reduce
+from itertools import product
+from typing import Dict, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+import polars as pl
+
+import config
+from src.regions import region_expr
+from src.storage import dataset_exists, scan_dataset
+
+# Log-price of a listing, the value the outlier filters work on
+LOG_PRICE = pl.col("PricePerSqm").log1p()
+
+# Sketch bucket of values <= 0 (log-spaced buckets only hold positive values)
+ZERO_BUCKET = -(2**31)
+
+
+def sketch_bucket(value: pl.Expr, gamma: float) -> pl.Expr:
+    """
+    Quantile sketch bucket of `value`: ceil(log(value) / log(gamma)).
+    """
+    return (
+        pl.when(value > 0)
+        .then((value.log() / math.log(gamma)).ceil())
+        .otherwise(ZERO_BUCKET)
+        .cast(pl.Int32)
+    )
+
+
+def group_moments(
+    lf: pl.LazyFrame, group_cols: Union[str, List[str]], value: pl.Expr
+) -> pl.LazyFrame:
+    """
+    Per-group count, mean and M2 (sum of squared deviations) of `value`.
+    These moments can be merged across batches without the raw rows.
+    """
+    if isinstance(group_cols, str):
+        group_cols = [group_cols]
+
+    return (
+        lf.with_columns(value.alias("_value"))
+        .group_by(group_cols)
+        .agg(
+            [
+                pl.col("_value").count().alias("count"),
+                pl.col("_value").mean().alias("mean"),
+                ((pl.col("_value") - pl.col("_value").mean()) ** 2).sum().alias("m2"),
+            ]
+        )
+    )
+
+
+def merge_moments(
+    left: pl.DataFrame, right: pl.DataFrame, group_cols: Union[str, List[str]]
+) -> pl.DataFrame:
+    """
+    Merge two moment tables (Chan et al. parallel update).
+    Groups present in only one table are kept as they are.
+    """
+    if isinstance(group_cols, str):
+        group_cols = [group_cols]
+
+    merged = left.join(
+        right, on=group_cols, how="full", coalesce=True, nulls_equal=True, suffix="_r"
+    )
+    n_a = pl.col("count").fill_null(0)
+    n_b = pl.col("count_r").fill_null(0)
+    n = n_a + n_b
+    delta = pl.col("mean_r").fill_null(0) - pl.col("mean").fill_null(0)
+
+    return merged.select(
+        group_cols
+        + [
+            n.alias("count"),
+            (
+                (
+                    pl.col("mean").fill_null(0) * n_a
+                    + pl.col("mean_r").fill_null(0) * n_b
+                )
+                / n
+            ).alias("mean"),
+            (
+                pl.col("m2").fill_null(0)
+                + pl.col("m2_r").fill_null(0)
+                + delta**2 * n_a * n_b / n
+            ).alias("m2"),
+        ]
+    )
+
+
+def rollup_moments(
+    moments: pl.DataFrame, group_cols: Union[str, List[str]]
+) -> pl.DataFrame:
+    """
+    Merge the moments of the groups of a finer moment table
+    into moments of coarser `group_cols` groups.
+    """
+    n = pl.col("count").sum()
+    mean = (pl.col("mean") * pl.col("count")).sum() / n
+    m2 = pl.col("m2") + pl.col("count") * (pl.col("mean") - mean) ** 2
+
+    return moments.group_by(group_cols).agg(
+        n.alias("count"), mean.alias("mean"), m2.sum().alias("m2")
+    )
+
+
+class GroupStatsStore:
+    """
+    Mergeable statistics of the listing prices of each group of
+    `keys` (by default property type and location, see config.py):
+    - count, mean and M2 of the log-price (for the z-score filter)
+    - a log-bucket quantile sketch of PricePerSqm (DDSketch style):
+      a value v > 0 falls in bucket ceil(log(v) / log(gamma)), so any
+      quantile is known within `relative_accuracy` of its true value
+
+    Both merge by summing per group, so new data is added to the
+    store without reading old rows, and statistics of coarser groups
+    (e.g. a District over all cities) are rolled up from the finer ones.
+    """
+
+    def __init__(
+        self,
+        moments: pl.DataFrame,
+        sketch: pl.DataFrame,
+        keys: Sequence[str] = config.GROUP_STATS_KEYS,
+        relative_accuracy: float = config.SKETCH_RELATIVE_ACCURACY,
+    ):
+        self.moments = moments
+        self.sketch = sketch
+        self.keys = list(keys)
+        self.relative_accuracy = relative_accuracy
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._groups = {}
+        self._tables = {}
+
+    ####################
+    # -- Build / IO -- #
+    ####################
+    @staticmethod
+    def plans(
+        lf: pl.LazyFrame,
+        keys: Sequence[str] = config.GROUP_STATS_KEYS,
+        property_type: Optional[str] = None,
+        relative_accuracy: float = config.SKETCH_RELATIVE_ACCURACY,
+    ) -> List[pl.LazyFrame]:
+        """
+        Lazy moment and sketch tables of the listings of `lf`, to collect
+        (e.g. together with other plans) and pass to the constructor.
+        Region is derived from District and Type set to `property_type`
+        when the listings do not have them.
+        """
+        keys = list(keys)
+        columns = lf.collect_schema().names()
+        if "Region" in keys and "Region" not in columns:
+            lf = lf.with_columns(region_expr("District"))
+        if "Type" in keys and "Type" not in columns:
+            lf = lf.with_columns(pl.lit(property_type).alias("Type"))
+        lf = lf.filter(pl.col("PricePerSqm").is_not_null())
+
+        gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        bucket = sketch_bucket(pl.col("PricePerSqm"), gamma).alias("bucket")
+        moments = group_moments(lf, keys, LOG_PRICE).with_columns(
+            pl.col("count").cast(pl.Int64)
+        )
+        sketch = lf.group_by(keys + [bucket]).agg(
+            pl.len().cast(pl.Int64).alias("count")
+        )
+        return [moments, sketch]
+
+    @classmethod
+    def from_frame(cls, df, keys=config.GROUP_STATS_KEYS, property_type=None):
+        """
+        Build the store of a DataFrame or LazyFrame of listings.
+        """
+        moments, sketch = pl.collect_all(
+            cls.plans(df.lazy(), keys=keys, property_type=property_type)
+        )
+        return cls(moments, sketch, keys=keys)
+
+    @classmethod
+    def load(cls, path: str):
+        """
+        Load a store written by `save`.
+        """
+        moments = pl.read_parquet(os.path.join(path, "moments.parquet"))
+        sketch_path = os.path.join(path, "sketch.parquet")
+        sketch = pl.read_parquet(sketch_path)
+        metadata = pl.read_parquet_metadata(sketch_path)
+
+        return cls(
+            moments,
+            sketch,
+            keys=[col for col in moments.columns if col not in ("count", "mean", "m2")],
+            relative_accuracy=float(metadata["relative_accuracy"]),
+        )
+
+    def save(self, path: str):
+        """
+        Write the store as two Parquet files in the `path` directory,
+        swapped in at once like the clean datasets.
+        """
+        tmp_path = f"{path}.tmp"
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        os.makedirs(tmp_path)
+
+        self.moments.write_parquet(os.path.join(tmp_path, "moments.parquet"))
+        self.sketch.write_parquet(
+            os.path.join(tmp_path, "sketch.parquet"),
+            metadata={"relative_accuracy": str(self.relative_accuracy)},
+        )
+
+        shutil.rmtree(path, ignore_errors=True)
+        os.replace(tmp_path, path)
+
+    ################
+    # -- Update -- #
+    ################
+    def merge(self, other: "GroupStatsStore") -> "GroupStatsStore":
+        """
+        Store of the listings of both stores.
+        """
+        if other.keys != self.keys or other.gamma != self.gamma:
+            raise ValueError("Cannot merge group stats with different keys or buckets")
+
+        sketch = (
+            pl.concat([self.sketch, other.sketch])
+            .group_by(self.keys + ["bucket"])
+            .agg(pl.col("count").sum())
+        )
+        return GroupStatsStore(
+            merge_moments(self.moments, other.moments, self.keys),
+            sketch,
+            keys=self.keys,
+            relative_accuracy=self.relative_accuracy,
+        )
+
+    def drop_types(self, types: Sequence[str]) -> "GroupStatsStore":
+        """
+        Store without the groups of the given property types.
+        """
+        keep = ~pl.col("Type").is_in(list(types))
+        return GroupStatsStore(
+            self.moments.filter(keep),
+            self.sketch.filter(keep),
+            keys=self.keys,
+            relative_accuracy=self.relative_accuracy,
+        )
+
+    ##########################
+    # -- Table statistics -- #
+    ##########################
+    def _bucket_value(self, bucket: pl.Expr) -> pl.Expr:
+        # Value at the middle (in relative terms) of the bucket
+        return (
+            pl.when(bucket == ZERO_BUCKET)
+            .then(0.0)
+            .otherwise((bucket * math.log(self.gamma)).exp() * 2 / (self.gamma + 1))
+        )
+
+    def _cached(self, key, builder):
+        # Derived tables are computed once, the store is never modified
+        if key not in self._tables:
+            self._tables[key] = builder()
+        return self._tables[key]
+
+    @staticmethod
+    def _types_key(types):
+        return None if types is None else tuple(types)
+
+    def _select(self, table, types):
+        return table if types is None else table.filter(pl.col("Type").is_in(types))
+
+    def group_moments(self, group_cols, types=None) -> pl.DataFrame:
+        """
+        Log-price moments of the `group_cols` groups,
+        optionally of the given property types only.
+        """
+        return rollup_moments(self._select(self.moments, types), group_cols)
+
+    def cumulative(self, group_cols, types=None) -> pl.DataFrame:
+        """
+        Sketch of the `group_cols` groups with, per bucket, the number of
+        listings in that bucket or below ("cum") and in the group ("total").
+        """
+        return self._cached(
+            ("cumulative", tuple(group_cols), self._types_key(types)),
+            lambda: self._select(self.sketch, types)
+            .group_by(group_cols + ["bucket"])
+            .agg(pl.col("count").sum())
+            .sort(group_cols + ["bucket"])
+            .with_columns(
+                pl.col("count").cum_sum().over(group_cols).alias("cum"),
+                pl.col("count").sum().over(group_cols).alias("total"),
+            ),
+        )
+
+    def quantiles(self, group_cols, q=0.5, types=None) -> pl.DataFrame:
+        """
+        Count and approximate `q` quantile of PricePerSqm of the
+        `group_cols` groups, in columns "count" and "quantile".
+        Like `ComparableIndex.quantile`, the values at the ranks
+        around q * (count - 1) are linearly interpolated.
+        """
+        rank = q * (pl.col("total") - 1)
+        lower = self._bucket_value(pl.col("_lower"))
+        upper = self._bucket_value(pl.col("_upper"))
+
+        return self._cached(
+            ("quantiles", tuple(group_cols), q, self._types_key(types)),
+            lambda: self.cumulative(group_cols, types)
+            .group_by(group_cols)
+            .agg(
+                pl.col("total").first().alias("count"),
+                pl.col("bucket")
+                .filter(pl.col("cum") > rank.floor())
+                .min()
+                .alias("_lower"),
+                pl.col("bucket")
+                .filter(pl.col("cum") > rank.ceil())
+                .min()
+                .alias("_upper"),
+                (rank - rank.floor()).first().alias("_weight"),
+            )
+            .with_columns(
+                (lower + (upper - lower) * pl.col("_weight")).alias("quantile")
+            )
+            .drop(["_lower", "_upper", "_weight"]),
+        )
+
+    def bucket_expr(self, value: pl.Expr) -> pl.Expr:
+        """
+        Sketch bucket of the values of `value`.
+        """
+        return sketch_bucket(value, self.gamma)
+
+    def bucket_value_expr(self, bucket: pl.Expr) -> pl.Expr:
+        """
+        Value standing for the listings of the sketch buckets `bucket`.
+        """
+        return self._bucket_value(bucket)
+
+    def bucket_fraction_expr(self, value: pl.Expr) -> pl.Expr:
+        """
+        Position of the values of `value` within their bucket, from 0
+        (lower bound) to 1 (upper bound), in log terms.
+        """
+        position = value.log() / math.log(self.gamma)
+        return pl.when(value > 0).then(position - position.ceil() + 1).otherwise(1.0)
+
+    #############################
+    # -- Single group lookup -- #
+    #############################
+    def lookup(
+        self, filters: Dict[str, object], types: Optional[Sequence[str]] = None
+    ) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+        """
+        Sorted sketch buckets and their counts of the listings matching
+        `filters` (key -> value or list of values), or None if there are
+        none. The rolled-up sketches are cached per set of keys.
+        """
+        unknown = set(filters) - set(self.keys)
+        if unknown:
+            raise KeyError(f"Cannot filter group stats on {sorted(unknown)}")
+
+        keys = tuple(key for key in self.keys if key in filters)
+        cache_key = (keys, self._types_key(types))
+        if cache_key not in self._groups:
+            self._groups[cache_key] = self._build_groups(list(keys), types)
+        groups = self._groups[cache_key]
+
+        choices = [
+            filters[k] if isinstance(filters[k], list) else [filters[k]] for k in keys
+        ]
+        found = [groups[combo] for combo in product(*choices) if combo in groups]
+        if not found:
+            return None
+        if len(found) == 1:
+            return found[0]
+
+        buckets, inverse = np.unique(
+            np.concatenate([b for b, _ in found]), return_inverse=True
+        )
+        counts = np.bincount(inverse, weights=np.concatenate([c for _, c in found]))
+        return buckets, counts.astype(np.int64)
+
+    def _build_groups(self, keys, types):
+        sketch = (
+            self._select(self.sketch, types)
+            .group_by(keys + ["bucket"])
+            .agg(pl.col("count").sum())
+            .sort("bucket")
+        )
+        if not keys:
+            return {(): (sketch["bucket"].to_numpy(), sketch["count"].to_numpy())}
+
+        grouped = sketch.group_by(keys, maintain_order=True).agg("bucket", "count")
+        return {
+            tuple(row[:-2]): (np.asarray(row[-2]), np.asarray(row[-1]))
+            for row in grouped.iter_rows()
+        }
+
+    def quantile(self, group: Tuple[np.ndarray, np.ndarray], q: float) -> float:
+        """
+        Approximate quantile of a group returned by `lookup`
+        (interpolated like `quantiles`).
+        """
+        buckets, counts = group
+        cum = np.cumsum(counts)
+        rank = q * (cum[-1] - 1)
+        lower, upper = self._value(
+            buckets[np.searchsorted(cum, [np.floor(rank), np.ceil(rank)], side="right")]
+        )
+        return float(lower + (upper - lower) * (rank - np.floor(rank)))
+
+    def _value(self, buckets: np.ndarray) -> np.ndarray:
+        values = 2 * self.gamma ** buckets.astype(np.float64) / (self.gamma + 1)
+        return np.where(buckets == ZERO_BUCKET, 0.0, values)
+
+    def percentile_rank(self, group: Tuple[np.ndarray, np.ndarray], value: float):
+        """
+        Approximate share of the listings of a group priced at or below
+        `value`. Listings in the bucket of `value` are counted in
+        proportion to where `value` lies in the bucket (in log terms).
+        """
+        buckets, counts = group
+        if value > 0:
+            position = math.log(value) / math.log(self.gamma)
+            bucket = math.ceil(position)
+            fraction = position - (bucket - 1)
+        else:
+            bucket, fraction = ZERO_BUCKET, 1.0
+
+        i = np.searchsorted(buckets, bucket)
+        below = counts[:i].sum()
+        if i < len(buckets) and buckets[i] == bucket:
+            below += counts[i] * fraction
+        return float(below / counts.sum())
+
+
+# Stores loaded so far, keyed by path
+_STATS_CACHE = {}
+
+# Clean datasets the clean statistics store is built from, by type
+CLEAN_DATASETS = {
+    "Land": config.LAND_DATA_PATH,
+    "House": config.HOUSE_DATA_PATH,
+    "Apartment": config.APT_DATA_PATH,
+}
+
+
+def build_clean_stats(path: str = config.CLEAN_STATS_PATH) -> GroupStatsStore:
+    """
+    Build the store of the clean datasets and save it at `path`, for
+    a tree where the preprocessing never ran (e.g. a fresh checkout).
+    """
+    paths = {t: p for t, p in CLEAN_DATASETS.items() if dataset_exists(p)}
+    if not paths:
+        raise FileNotFoundError(
+            f"No group statistics at {path} and no clean datasets to build "
+            "them from, run `python -m src.cli preprocess` first"
+        )
+
+    plans = [
+        plan
+        for property_type, dataset in paths.items()
+        for plan in GroupStatsStore.plans(
+            scan_dataset(dataset), property_type=property_type
+        )
+    ]
+    dfs = pl.collect_all(plans)
+    stores = [GroupStatsStore(dfs[i], dfs[i + 1]) for i in range(0, len(dfs), 2)]
+    stats = reduce(GroupStatsStore.merge, stores)
+    stats.save(path)
+    return stats
+
+
+def get_group_stats(path: str = config.CLEAN_STATS_PATH) -> GroupStatsStore:
+    """
+    Return the store saved at `path`, loading it only on first
+    use or when it was rewritten since. The clean statistics
+    store is built from the clean datasets if it is missing.
+    """
+    if not os.path.exists(path) and path == config.CLEAN_STATS_PATH:
+        build_clean_stats(path)
+    mtime = os.stat(path).st_mtime_ns
+    cached = _STATS_CACHE.get(path)
+    if cached is None or cached[0] != mtime:
+        cached = (mtime, GroupStatsStore.load(path))
+        _STATS_CACHE[path] = cached
+    return cached[1]
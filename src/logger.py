@@ -1,34 +1,150 @@
+import atexit
+import json
+import os
+import queue
+import sys
+import threading
+import time
 from datetime import datetime
 
+# Numeric value of each level, records below the logger level are dropped
+LEVELS = {"DEBUG": 10, "INFO": 20, "WARN": 30, "ERROR": 40}
+
+
+class _LogSink:
+    """
+    One buffered handle per log file, shared by all loggers writing to it.
+    Records are JSON-encoded either by the caller or, with `background`,
+    by a daemon thread draining a queue.
+    """
+
+    def __init__(self, path, background=False, buffer_size=1 << 16):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+
+        # Runs append to the file, each one starting with a marker record
+        self.file = open(path, "a", buffering=buffer_size, encoding="utf-8")
+        self.lock = threading.Lock()
+        self.queue = None
+        self._write(
+            {
+                "ts": time.time(),
+                "level": "INFO",
+                "stage": "run",
+                "message": "Run started",
+                "pid": os.getpid(),
+                "argv": sys.argv,
+            }
+        )
+
+        if background:
+            self.queue = queue.SimpleQueue()
+            self.thread = threading.Thread(target=self._drain, daemon=True)
+            self.thread.start()
+
+        atexit.register(self.close)
+
+    def write(self, record):
+        if self.queue is not None:
+            self.queue.put(record)
+        else:
+            self._write(record)
+
+    def _write(self, record):
+        line = json.dumps(record, ensure_ascii=False, default=str)
+        with self.lock:
+            self.file.write(line + "\n")
+            if record["level"] == "ERROR":
+                self.file.flush()
+
+    def _drain(self):
+        while (record := self.queue.get()) is not None:
+            self._write(record)
+            if self.queue.empty():
+                self.flush()
+
+    def flush(self):
+        with self.lock:
+            if not self.file.closed:
+                self.file.flush()
+
+    def close(self):
+        if self.queue is not None and self.thread.is_alive():
+            self.queue.put(None)
+            self.thread.join()
+        with self.lock:
+            if not self.file.closed:
+                self.file.close()
+
+
+# Open log sinks, keyed by file path
+_SINKS = {}
+_SINKS_LOCK = threading.Lock()
+
+
+def _get_sink(path, background):
+    with _SINKS_LOCK:
+        if path not in _SINKS:
+            _SINKS[path] = _LogSink(path, background=background)
+        return _SINKS[path]
+
 
 class PyLogger:
-    def __init__(self, log_to_file=False, file_path="script"):
+    """
+    Structured logger writing JSON lines to `logs/<file_path>.log`.
+    Each record holds a timestamp, level, stage, message and any extra
+    fields (e.g. timings) passed as keyword arguments. Loggers of the
+    same file share one buffered handle, and each process appends to
+    the file after a "Run started" record, so earlier runs are kept.
+    """
+
+    def __init__(
+        self,
+        log_to_file=False,
+        file_path="script",
+        level="DEBUG",
+        stage=None,
+        background=False,
+    ):
         self.log_to_file = log_to_file
         self.file_path = f"logs/{file_path}.log"
+        self.level = LEVELS[level]
+        self.stage = stage
+        self._sink = _get_sink(self.file_path, background) if log_to_file else None
 
-        if self.log_to_file:
-            # Clear existing log file on creation (optional)
-            with open(self.file_path, "w") as f:
-                f.write("============ Logging process started ============\n")
+    def _log(self, level, message, stage=None, **fields):
+        # Filter before doing any formatting work
+        if LEVELS[level] < self.level:
+            return
 
-    def _log(self, level, message):
-        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        full_message = f"{timestamp} [{level}]: {message.capitalize()}"
+        record = {
+            "ts": time.time(),
+            "level": level,
+            "stage": stage or self.stage,
+            "message": message,
+            **fields,
+        }
 
-        if self.log_to_file:
-            with open(self.file_path, "a") as f:
-                f.write(full_message + "\n")
+        if self._sink is not None:
+            self._sink.write(record)
         else:
-            print(full_message)
+            timestamp = datetime.fromtimestamp(record["ts"]).strftime(
+                "%Y-%m-%d %H:%M:%S"
+            )
+            extra = "".join(f" {key}={value}" for key, value in fields.items())
+            print(f"{timestamp} [{level}]: {message}{extra}")
+
+    def info(self, message, **fields):
+        self._log("INFO", message, **fields)
 
-    def info(self, message):
-        self._log("INFO", message)
+    def warning(self, message, **fields):
+        self._log("WARN", message, **fields)
 
-    def warning(self, message):
-        self._log("WARN", message)
+    def error(self, message, **fields):
+        self._log("ERROR", message, **fields)
 
-    def error(self, message):
-        self._log("ERROR", message)
+    def debug(self, message, **fields):
+        self._log("DEBUG", message, **fields)
 
-    def debug(self, message):
-        self._log("DEBUG", message)
+    def flush(self):
+        if self._sink is not None:
+            self._sink.flush()
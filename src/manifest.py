@@ -0,0 +1,116 @@
+import hashlib
+import json
+import os
+from datetime import datetime
+
+import config
+
+_CHUNK_SIZE = 1 << 20
+
+
+def file_digest(path, prefix_size=None):
+    """
+    SHA-256 of a file. If `prefix_size` is given, the digest of the
+    first `prefix_size` bytes is returned too, from the same single read.
+    """
+    h = hashlib.sha256()
+    prefix_hex = None
+    offset = 0
+    with open(path, "rb") as f:
+        while chunk := f.read(_CHUNK_SIZE):
+            if prefix_size is not None and offset <= prefix_size < offset + len(chunk):
+                cut = prefix_size - offset
+                h.update(chunk[:cut])
+                prefix_hex = h.hexdigest()
+                h.update(chunk[cut:])
+            else:
+                h.update(chunk)
+            offset += len(chunk)
+
+    if prefix_size is None:
+        return h.hexdigest()
+    if prefix_size == offset:
+        prefix_hex = h.hexdigest()
+    return prefix_hex, h.hexdigest()
+
+
+def path_digest(path):
+    """
+    SHA-256 of a file, or of all files (and their relative
+    paths) of a directory such as a partitioned dataset.
+    """
+    if not os.path.isdir(path):
+        return file_digest(path)
+
+    h = hashlib.sha256()
+    for root, dirs, files in os.walk(path):
+        dirs.sort()
+        for name in sorted(files):
+            file_path = os.path.join(root, name)
+            h.update(os.path.relpath(file_path, path).encode())
+            h.update(file_digest(file_path).encode())
+    return h.hexdigest()
+
+
+def config_digest(names):
+    """
+    Hash of the given `config.py` constants.
+    """
+    values = {name: getattr(config, name) for name in sorted(names)}
+    return hashlib.sha256(
+        json.dumps(values, sort_keys=True, default=str).encode()
+    ).hexdigest()
+
+
+def code_digest(paths):
+    """
+    Hash of the source files a stage depends on.
+    """
+    h = hashlib.sha256()
+    for path in sorted(paths):
+        h.update(os.path.basename(path).encode())
+        with open(path, "rb") as f:
+            h.update(f.read())
+    return h.hexdigest()
+
+
+class BuildManifest:
+    """
+    Records, per pipeline stage, the fingerprint of its inputs
+    so that stages whose inputs did not change can be skipped.
+    """
+
+    def __init__(self, path=config.MANIFEST_PATH):
+        self.path = path
+        self.stages = {}
+
+        if os.path.exists(self.path):
+            with open(self.path, "r") as f:
+                self.stages = json.load(f).get("stages", {})
+
+    def get(self, stage):
+        return self.stages.get(stage)
+
+    def is_fresh(self, stage, fingerprint, outputs=()):
+        """
+        True if the stage was built from the same fingerprint
+        and all of its outputs still exist.
+        """
+        entry = self.stages.get(stage)
+        if entry is None or entry.get("fingerprint") != fingerprint:
+            return False
+        return all(os.path.exists(path) for path in outputs)
+
+    def record(self, stage, fingerprint, **extra):
+        self.stages[stage] = {
+            "fingerprint": fingerprint,
+            "built_at": datetime.now().isoformat(timespec="seconds"),
+            **extra,
+        }
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"stages": self.stages}, f, indent=2, default=str)
+        os.replace(tmp_path, self.path)
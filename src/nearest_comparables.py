@@ -0,0 +1,181 @@
+import os
+import pickle
+from typing import Dict, Sequence
+
+import numpy as np
+import polars as pl
+from sklearn.neighbors import KDTree
+
+import config
+from src.regions import PARENT_REGION
+from src.scoring import DATASET_PATHS
+from src.storage import resolve_dataset, scan_dataset
+
+# Features compared on a log scale (skewed, and a relative difference matters)
+LOG_FEATURES = ["AreaAssigned"]
+
+
+class NearestComparables:
+    """
+    k-nearest-neighbour search of comparable listings.
+
+    The distance between two listings is the euclidean distance of their
+    standardized attributes (`features`), plus a penalty when they lie in
+    another City, District or Region (config.KNN_LOCATION_PENALTY).
+
+    The listings are sorted by location and a KD-tree is built on the
+    attributes of every City, District and Region (and of all listings).
+    A query searches the tree of its own City first and backs off to its
+    District, Region and the whole dataset only while a listing there
+    could still be closer than the k-th best found, so a City with few
+    listings still gets comparables. The search is approximate: each
+    tree returns its k nearest listings on the attributes alone.
+    """
+
+    def __init__(
+        self,
+        df: pl.DataFrame,
+        features: Sequence[str],
+        penalties: Dict[str, float] = config.KNN_LOCATION_PENALTY,
+    ):
+        self.features = list(features)
+        self.penalties = dict(penalties)
+        self.source_mtime = None
+        self._log_cols = [i for i, f in enumerate(self.features) if f in LOG_FEATURES]
+
+        # Listings with all attributes, sorted so every location is a slice
+        self.df = df.drop_nulls(self.features + ["District", "City"]).sort(
+            ["Region", "District", "City"], nulls_last=True
+        )
+        X = self._transform(self.df.select(self.features).to_numpy())
+        self.mean = X.mean(axis=0)
+        self.std = np.where(X.std(axis=0) > 0, X.std(axis=0), 1.0)
+        X = (X - self.mean) / self.std
+
+        self.locations = {
+            level: self.df[level].to_numpy() for level in ("Region", "District", "City")
+        }
+
+        # Location, e.g. (Region, District) -> (first row, KD-tree of its rows)
+        self.trees = {(): (0, KDTree(X))}
+        for depth in range(1, 4):
+            slices = (
+                self.df.with_row_index("_row")
+                .group_by(["Region", "District", "City"][:depth], maintain_order=True)
+                .agg(pl.col("_row").min().alias("start"), pl.len().alias("size"))
+            )
+            for *key, start, size in slices.iter_rows():
+                self.trees[tuple(key)] = (start, KDTree(X[start : start + size]))
+
+    def _transform(self, X) -> np.ndarray:
+        X = np.array(X, dtype=np.float64)
+        X[:, self._log_cols] = np.log1p(X[:, self._log_cols])
+        return X
+
+    @classmethod
+    def from_path(cls, path: str, features: Sequence[str]):
+        """
+        Build the search structure from a clean dataset.
+        """
+        comparables = cls(scan_dataset(path).collect(), features)
+        comparables.source_mtime = os.stat(path).st_mtime_ns
+        return comparables
+
+    def save(self, path: str):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            pickle.dump(self, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+
+    @staticmethod
+    def load(path: str) -> "NearestComparables":
+        with open(path, "rb") as f:
+            return pickle.load(f)
+
+    def query(self, listing: Dict[str, object], k: int = config.KNN_K) -> pl.DataFrame:
+        """
+        The `k` listings most similar to `listing` (a dict with the
+        attributes and at least a District), closest first, with
+        their distance to it in a "Distance" column.
+        """
+        missing = [f for f in self.features if listing.get(f) is None]
+        if missing:
+            raise ValueError(f"Missing listing attributes: {missing}")
+
+        x = self._transform([[listing[f] for f in self.features]])
+        x = (x - self.mean) / self.std
+        region = listing.get("Region") or PARENT_REGION.get(listing.get("District"))
+        location = (region, listing.get("District"), listing.get("City"))
+
+        # Search the City, District, Region, then all listings; a listing
+        # outside each of them pays (at least) the next penalty
+        outside = [
+            self.penalties["City"],
+            self.penalties["District"],
+            self.penalties["Region"],
+            np.inf,
+        ]
+        best = {}
+        for depth, next_penalty in zip((3, 2, 1, 0), outside):
+            if location[:depth] not in self.trees:
+                continue
+
+            start, tree = self.trees[location[:depth]]
+            dist, idx = tree.query(x, k=min(k, tree.data.shape[0]))
+            rows = start + idx[0]
+            total = np.sqrt(dist[0] ** 2 + self._penalty(rows, location) ** 2)
+            best.update(zip(rows.tolist(), total.tolist()))
+
+            if len(best) >= k and sorted(best.values())[k - 1] <= next_penalty:
+                break
+
+        rows, distances = zip(*sorted(best.items(), key=lambda item: item[1])[:k])
+        return self.df[list(rows)].with_columns(
+            pl.Series("Distance", distances, dtype=pl.Float64)
+        )
+
+    def _penalty(self, rows: np.ndarray, location: tuple) -> np.ndarray:
+        """
+        Location penalty of the listings `rows` relative to
+        `location` (Region, District, City).
+        """
+        same_region = self.locations["Region"][rows] == location[0]
+        same_district = same_region & (self.locations["District"][rows] == location[1])
+        same_city = same_district & (self.locations["City"][rows] == location[2])
+        return np.select(
+            [same_city, same_district, same_region],
+            [0.0, self.penalties["City"], self.penalties["District"]],
+            default=self.penalties["Region"],
+        )
+
+
+# Search structures loaded so far, keyed by real estate type
+_KNN_CACHE = {}
+
+
+def index_path(property_type: str) -> str:
+    return os.path.join(config.KNN_INDEX_DIR, f"knn-{property_type.lower()}.pkl")
+
+
+def get_nearest_comparables(property_type: str) -> NearestComparables:
+    """
+    Return the search structure of a real estate type (Land, House or
+    Apartment): from memory, else from its file in config.KNN_INDEX_DIR,
+    else built from the clean dataset and saved there. It is rebuilt
+    when the clean dataset was rewritten since it was built.
+    """
+    data_path = DATASET_PATHS[property_type]
+    mtime = os.stat(resolve_dataset(data_path)).st_mtime_ns
+
+    comparables = _KNN_CACHE.get(property_type)
+    if comparables is None or comparables.source_mtime != mtime:
+        path = index_path(property_type)
+        comparables = NearestComparables.load(path) if os.path.exists(path) else None
+        if comparables is None or comparables.source_mtime != mtime:
+            comparables = NearestComparables.from_path(
+                data_path, config.KNN_FEATURES[property_type]
+            )
+            comparables.save(path)
+        _KNN_CACHE[property_type] = comparables
+    return comparables
@@ -0,0 +1,170 @@
+"""
+Group-wise outlier filters on the log-price, log(1 + PricePerSqm), of
+the listings:
+- zscore: further than `threshold` standard deviations from the mean
+- mad: further than `threshold` scaled median absolute deviations
+  (MAD x 1.4826, the standard deviation of normal data) from the median
+- iqr: further than `threshold` interquartile ranges below the first
+  or above the third quartile
+
+When all listings are in the frame, the predicate of each group is a
+window expression over its rows, so the filter is a single pass with
+the groups evaluated in parallel, and no statistics table is joined or
+column added. Otherwise (streamed or appended rows) the bounds of each
+group come from the group statistics store (see src/group_stats.py),
+the quantiles from its sketches within their relative accuracy.
+"""
+
+from typing import Optional, Sequence
+
+import polars as pl
+
+import config
+from src.group_stats import LOG_PRICE, GroupStatsStore
+
+METHODS = ("zscore", "mad", "iqr")
+
+# MAD of normally distributed data times this is its standard deviation
+MAD_SCALE = 1.4826
+
+# Log-price std under which a group has no spread (rounding of equal prices)
+MIN_STD = 1e-9
+
+
+def _check_method(method):
+    if method not in METHODS:
+        raise ValueError(f"Unknown outlier method {method}, expected one of {METHODS}")
+
+
+def outlier_predicate(
+    method: str = config.OUTLIER_METHOD,
+    group_cols: Sequence[str] = config.OUTLIER_GROUP_COLS,
+    threshold: Optional[float] = None,
+) -> pl.Expr:
+    """
+    True for the listings within the bounds of their `group_cols` group
+    (null where the bounds are undefined, e.g. the std of a single row).
+    As in the original z-score filter, the listings of a group without
+    spread (all at the same price) get no z-score and are not kept.
+    `threshold` defaults to config.OUTLIER_THRESHOLDS of the method.
+    """
+    _check_method(method)
+    if threshold is None:
+        threshold = config.OUTLIER_THRESHOLDS[method]
+
+    x = LOG_PRICE
+    if method == "zscore":
+        std = pl.when(x.std() > MIN_STD).then(x.std())
+        keep = (x - x.mean()).abs() <= threshold * std
+    elif method == "mad":
+        deviation = (x - x.median()).abs()
+        keep = deviation <= threshold * MAD_SCALE * deviation.median()
+    else:
+        q1, q3 = x.quantile(0.25, "linear"), x.quantile(0.75, "linear")
+        iqr = q3 - q1
+        keep = x.is_between(q1 - threshold * iqr, q3 + threshold * iqr)
+
+    return keep.over(list(group_cols)) if group_cols else keep
+
+
+def outlier_bounds(
+    stats: GroupStatsStore,
+    method: str = config.OUTLIER_METHOD,
+    group_cols: Sequence[str] = config.OUTLIER_GROUP_COLS,
+    threshold: Optional[float] = None,
+    types: Optional[Sequence[str]] = None,
+) -> pl.DataFrame:
+    """
+    Lower and upper bounds of the log-price of the `group_cols` groups
+    of a group statistics store (optionally of the given property types
+    only), in columns "lower" and "upper".
+    """
+    _check_method(method)
+    if threshold is None:
+        threshold = config.OUTLIER_THRESHOLDS[method]
+    group_cols = list(group_cols)
+
+    if method == "zscore":
+        moments = stats.group_moments(group_cols, types=types)
+        std = (pl.col("m2") / (pl.col("count") - 1)).sqrt()
+        std = pl.when((pl.col("count") > 1) & (std > MIN_STD)).then(std)
+        return moments.select(
+            group_cols
+            + [
+                (pl.col("mean") - threshold * std).alias("lower"),
+                (pl.col("mean") + threshold * std).alias("upper"),
+            ]
+        )
+
+    if method == "iqr":
+        q1, q3 = [
+            stats.quantiles(group_cols, q, types=types).select(
+                group_cols + [pl.col("quantile").log1p().alias(name)]
+            )
+            for q, name in ((0.25, "q1"), (0.75, "q3"))
+        ]
+        iqr = pl.col("q3") - pl.col("q1")
+        return q1.join(q3, on=group_cols, nulls_equal=True).select(
+            group_cols
+            + [
+                (pl.col("q1") - threshold * iqr).alias("lower"),
+                (pl.col("q3") + threshold * iqr).alias("upper"),
+            ]
+        )
+
+    # MAD: weighted median of the distances of the sketch buckets to the median
+    median = stats.quantiles(group_cols, 0.5, types=types).select(
+        group_cols + [pl.col("quantile").log1p().alias("median")]
+    )
+    deviation = (
+        stats.cumulative(group_cols, types=types)
+        .join(median, on=group_cols, nulls_equal=True)
+        .with_columns(
+            (stats.bucket_value_expr(pl.col("bucket")).log1p() - pl.col("median"))
+            .abs()
+            .alias("_deviation")
+        )
+        .sort(group_cols + ["_deviation"])
+        .with_columns(pl.col("count").cum_sum().over(group_cols).alias("_cum"))
+        .group_by(group_cols)
+        .agg(
+            pl.col("median").first(),
+            pl.col("_deviation")
+            .filter(pl.col("_cum") >= pl.col("total") / 2)
+            .first()
+            .alias("mad"),
+        )
+    )
+    spread = threshold * MAD_SCALE * pl.col("mad")
+    return deviation.select(
+        group_cols
+        + [
+            (pl.col("median") - spread).alias("lower"),
+            (pl.col("median") + spread).alias("upper"),
+        ]
+    )
+
+
+def filter_outliers(
+    lf: pl.LazyFrame,
+    method: str = config.OUTLIER_METHOD,
+    group_cols: Sequence[str] = config.OUTLIER_GROUP_COLS,
+    threshold: Optional[float] = None,
+    bounds: Optional[pl.DataFrame] = None,
+) -> pl.LazyFrame:
+    """
+    Remove the outliers of `lf` within its `group_cols` groups (those
+    missing from `lf` are ignored, e.g. Type for land), and the rows
+    whose group bounds are undefined. If `bounds` (of `outlier_bounds`)
+    is given they are used instead of the statistics of `lf` itself.
+    """
+    columns = lf.collect_schema().names()
+    group_cols = [c for c in group_cols if c in columns]
+    if bounds is None:
+        return lf.filter(outlier_predicate(method, group_cols, threshold))
+
+    return (
+        lf.join(bounds.lazy(), on=group_cols, how="left")
+        .filter(LOG_PRICE.is_between(pl.col("lower"), pl.col("upper")))
+        .select(columns)
+    )
@@ -1,20 +1,79 @@
-import pandas as pd
+import io
+from typing import NamedTuple, Optional
+
 import numpy as np
-import seaborn as sns
-import matplotlib.pyplot as plt
-import sys
-import os
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+
+# Resolution of the KDE curve and of the binned data it is estimated on
+KDE_GRID_SIZE = 200
+KDE_BINS = 512
+
+
+class GroupDistribution(NamedTuple):
+    """
+    Histogram and KDE of log(PricePerSqm) of one comparable group.
+    """
+
+    bin_edges: np.ndarray
+    counts: np.ndarray
+    kde_x: np.ndarray
+    kde_y: np.ndarray
+
+
+def group_distribution(values: np.ndarray) -> GroupDistribution:
+    """
+    Precompute the histogram and the Gaussian KDE (Scott's rule) of the
+    log-values of a group. The KDE is estimated on binned data, so its
+    cost does not grow with the group size, and is scaled to counts.
+    """
+    log_values = np.log(values)
+    counts, bin_edges = np.histogram(log_values, bins="auto")
 
+    kde_x = np.linspace(bin_edges[0], bin_edges[-1], KDE_GRID_SIZE)
+    kde_y = np.zeros_like(kde_x)
+    n = len(log_values)
+    std = log_values.std(ddof=1) if n > 1 else 0.0
 
-def plot_comparison():
+    if std > 0:
+        bandwidth = std * n ** (-1 / 5)
+        fine_counts, fine_edges = np.histogram(log_values, bins=KDE_BINS)
+        centers = (fine_edges[:-1] + fine_edges[1:]) / 2
+        z = (kde_x[:, None] - centers[None, :]) / bandwidth
+        density = (np.exp(-0.5 * z**2) @ fine_counts) / (
+            n * bandwidth * np.sqrt(2 * np.pi)
+        )
+        kde_y = density * n * np.diff(bin_edges).mean()
+
+    return GroupDistribution(bin_edges, counts, kde_x, kde_y)
+
+
+def plot_comparison(
+    distribution: GroupDistribution,
+    price_per_sqm: float,
+    median_price: float,
+    path: Optional[str] = None,
+    fmt: Optional[str] = None,
+    caption: Optional[str] = None,
+) -> Optional[bytes]:
+    """
+    Render the group distribution with the input and median lines.
+    Uses the Agg canvas (no display needed). The figure is written to
+    `path` if given, otherwise the encoded image is returned as bytes.
+    `fmt` is "png" or "svg" (by default taken from the path, else png).
+    """
     # Create figure and axes explicitly
-    fig, ax = plt.subplots(figsize=(8, 5))
+    fig = Figure(figsize=(8, 5))
+    FigureCanvasAgg(fig)
+    ax = fig.subplots()
 
-    # Plot the histogram with KDE
-    sns.histplot(data=df, x=np.log(df["PricePerSqm"]), kde=True, ax=ax)
+    # Plot the precomputed histogram with KDE
+    ax.stairs(distribution.counts, distribution.bin_edges, fill=True, alpha=0.5)
+    ax.plot(distribution.kde_x, distribution.kde_y)
 
     # Add axis labels and title
     ax.set_xlabel("log(PricePerSqm)")
+    ax.set_ylabel("Count")
     ax.set_title("Distribution of Price per Sqm in the Dataset")
 
     # Add vertical lines
@@ -32,17 +91,25 @@ def plot_comparison():
     )
 
     # Add caption below the plot
-    fig.text(
-        0.5,
-        -0.05,
-        "Figure 1: Distribution of log-transformed price per square meter in the dataset.",
-        ha="center",
-        va="top",
-        fontsize=10,
-        style="italic",
-    )
+    if caption:
+        fig.text(
+            0.5,
+            -0.05,
+            caption,
+            ha="center",
+            va="top",
+            fontsize=10,
+            style="italic",
+        )
 
-    # Show legend and plot
+    # Show legend and write the figure
     ax.legend()
-    plt.tight_layout()
-    plt.show()
+    fig.tight_layout()
+
+    if path is not None:
+        fig.savefig(path, format=fmt, bbox_inches="tight")
+        return None
+
+    buffer = io.BytesIO()
+    fig.savefig(buffer, format=fmt or "png", bbox_inches="tight")
+    return buffer.getvalue()
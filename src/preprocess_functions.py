@@ -1,23 +1,68 @@
 import polars as pl
-from typing import Union, List
+from typing import List, Optional, Sequence, Union
 
 
-def get_nr_of_groups_polars(df: pl.DataFrame, column_names: Union[str, List[str]]):
+def get_nr_of_groups_polars(
+    df: Union[pl.DataFrame, pl.LazyFrame], column_names: Union[str, List[str]]
+) -> pl.DataFrame:
+    """
+    Number and percentage of rows of each group of `column_names`,
+    largest first.
+    """
     if isinstance(column_names, str):
         column_names = [column_names]
 
-    total_rows = df.height
-
-    groups = (
-        df.group_by(column_names)
+    return (
+        df.lazy()
+        .group_by(column_names)
         .agg(pl.len().alias("count"))
+        .with_columns(
+            (pl.col("count") / pl.col("count").sum() * 100).round(2).alias("percentage")
+        )
         .sort("count", descending=True)
-        .with_columns((pl.col("count") / total_rows * 100).round(2).alias("percentage"))
+        .collect()
     )
 
-    for row in groups.iter_rows(named=True):
-        keys = ", ".join(f"{col}={row[col]}" for col in column_names)
-        print(f"{keys}: {row['count']} ({row['percentage']}%)")
+
+def group_cardinality(
+    df: Union[pl.DataFrame, pl.LazyFrame],
+    levels: Sequence[str] = ("Region", "District", "City"),
+    by: Sequence[str] = ("Type",),
+    min_support: Optional[int] = None,
+) -> pl.DataFrame:
+    """
+    Number of rows of every location group at each level of the
+    `levels` hierarchy (Region, Region x District, ...), within the
+    groups of `by`, from a single aggregation over the rows.
+
+    Returns a tidy frame with one row per group: "level" (the finest
+    location column of the group), the `by` and `levels` columns (null
+    below the level), "count", "parent_count" (rows of the enclosing
+    group one level up) and, if `min_support` is given, "small" (the
+    group has fewer rows than it).
+    """
+    levels, by = list(levels), [c for c in by if c in df.collect_schema().names()]
+    counts = df.lazy().group_by(by + levels).agg(pl.len().alias("count")).collect()
+
+    frames = []
+    for depth in range(1, len(levels) + 1):
+        keys, parent = by + levels[:depth], by + levels[: depth - 1]
+        frame = counts.group_by(keys).agg(pl.col("count").sum())
+        frame = frame.with_columns(
+            (
+                pl.col("count").sum().over(parent) if parent else pl.col("count").sum()
+            ).alias("parent_count"),
+            pl.lit(levels[depth - 1]).alias("level"),
+            *[pl.lit(None, dtype=counts.schema[c]).alias(c) for c in levels[depth:]],
+        )
+        frames.append(frame.select(["level"] + by + levels + ["count", "parent_count"]))
+
+    cardinality = pl.concat(frames).sort(["level"] + by + levels, nulls_last=True)
+    if min_support is not None:
+        cardinality = cardinality.with_columns(
+            (pl.col("count") < min_support).alias("small")
+        )
+    return cardinality
 
 
 def assign_as_zero(df, anchor_col: str, anchor_value, assign_col: str):
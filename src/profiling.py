@@ -0,0 +1,199 @@
+import cProfile
+import csv
+import json
+import os
+import resource
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+import polars as pl
+
+import config
+
+
+def peak_rss_mb():
+    """
+    Peak resident set size of the process so far, in MB.
+    """
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak / (1 << 20) if sys.platform == "darwin" else peak / (1 << 10)
+
+
+def rss_mb():
+    """
+    Current resident set size of the process, in MB (None without /proc).
+    """
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+    except (OSError, ValueError, IndexError):
+        return None
+    return pages * os.sysconf("SC_PAGE_SIZE") / (1 << 20)
+
+
+class RssSampler:
+    """
+    Samples the current RSS every `interval` seconds in a background
+    thread, to get the peak of a stage rather than of the whole process.
+    """
+
+    def __init__(self, interval=config.RSS_SAMPLE_INTERVAL_S):
+        self.interval = interval
+        self.start_mb = self.peak_mb = rss_mb()
+        self._done = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _sample(self):
+        current = rss_mb()
+        if current is not None and (self.peak_mb is None or current > self.peak_mb):
+            self.peak_mb = current
+
+    def _run(self):
+        while not self._done.wait(self.interval):
+            self._sample()
+
+    def start(self):
+        if self.start_mb is not None:
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._done.set()
+        if self._thread.is_alive():
+            self._thread.join()
+        self._sample()
+
+
+class StageRecord:
+    """
+    Measurements of one run of a named stage. Memory is the RSS at the
+    start of the stage, its sampled peak during the stage and the growth
+    between the two, next to the peak of the whole process so far.
+    `rows_in` / `rows_out` are filled in by the stage itself.
+    """
+
+    def __init__(self, name, rows_in=None):
+        self.name = name
+        self.rows_in = rows_in
+        self.rows_out = None
+        self.wall_s = None
+        self.cpu_s = None
+        self.rss_start_mb = None
+        self.stage_peak_rss_mb = None
+        self.rss_growth_mb = None
+        self.process_peak_rss_mb = None
+
+    def as_dict(self):
+        return {
+            "stage": self.name,
+            "wall_s": self.wall_s,
+            "cpu_s": self.cpu_s,
+            "rss_start_mb": self.rss_start_mb,
+            "stage_peak_rss_mb": self.stage_peak_rss_mb,
+            "rss_growth_mb": self.rss_growth_mb,
+            "process_peak_rss_mb": self.process_peak_rss_mb,
+            "rows_in": self.rows_in,
+            "rows_out": self.rows_out,
+        }
+
+
+class StageReport:
+    """
+    Collects the stage records of a run and writes them as JSON or CSV.
+    """
+
+    def __init__(self):
+        self.records = []
+
+    def add(self, record):
+        self.records.append(record.as_dict())
+
+    def write(self, path=config.PROFILE_REPORT_PATH):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+
+        if path.endswith(".csv"):
+            with open(path, "w", newline="") as f:
+                writer = csv.DictWriter(f, fieldnames=list(StageRecord("").as_dict()))
+                writer.writeheader()
+                writer.writerows(self.records)
+        else:
+            with open(path, "w") as f:
+                json.dump(self.records, f, indent=2)
+
+    def clear(self):
+        self.records = []
+
+
+# Report shared by all stages of the process
+REPORT = StageReport()
+
+
+def _profile_path(name, suffix):
+    os.makedirs(config.PROFILE_DIR, exist_ok=True)
+    safe_name = name.replace(":", "-").replace("/", "-")
+    return os.path.join(config.PROFILE_DIR, f"{safe_name}{suffix}")
+
+
+@contextmanager
+def stage(name, logger=None, rows_in=None, profile=None):
+    """
+    Measure a named stage: wall time, CPU time, RSS and row counts.
+    The record is added to REPORT and logged. With `profile` (default:
+    config.PROFILE_STAGES) a cProfile dump is written to PROFILE_DIR.
+
+    Usage:
+        with stage("split:land", logger, rows_in=df.height) as st:
+            ...
+            st.rows_out = out.height
+    """
+    profile = config.PROFILE_STAGES if profile is None else profile
+    record = StageRecord(name, rows_in=rows_in)
+    profiler = cProfile.Profile() if profile else None
+
+    sampler = RssSampler().start()
+    wall_start, cpu_start = time.perf_counter(), time.process_time()
+    if profiler is not None:
+        profiler.enable()
+    try:
+        yield record
+    finally:
+        if profiler is not None:
+            profiler.disable()
+            profiler.dump_stats(_profile_path(name, ".prof"))
+
+        record.wall_s = round(time.perf_counter() - wall_start, 6)
+        record.cpu_s = round(time.process_time() - cpu_start, 6)
+        sampler.stop()
+        if sampler.start_mb is not None:
+            record.rss_start_mb = round(sampler.start_mb, 1)
+            record.stage_peak_rss_mb = round(sampler.peak_mb, 1)
+            record.rss_growth_mb = round(sampler.peak_mb - sampler.start_mb, 1)
+        record.process_peak_rss_mb = round(peak_rss_mb(), 1)
+        REPORT.add(record)
+
+        if logger is not None:
+            logger.info(f"Stage {name} finished", **record.as_dict())
+
+
+def collect_all(names, lazy_frames, profile=None, engine="auto"):
+    """
+    Collect Polars lazy frames together (sharing common subplans).
+    With `profile` (default: config.PROFILE_STAGES) each frame is instead
+    collected with LazyFrame.profile(), and its optimized query plan and
+    per-node timings are written to PROFILE_DIR.
+    """
+    profile = config.PROFILE_STAGES if profile is None else profile
+    if not profile:
+        return pl.collect_all(lazy_frames, engine=engine)
+
+    dfs = []
+    for name, lf in zip(names, lazy_frames):
+        with open(_profile_path(name, ".plan.txt"), "w") as f:
+            f.write(lf.explain(engine=engine))
+        df, timings = lf.profile(engine=engine)
+        timings.write_csv(_profile_path(name, ".timings.csv"))
+        dfs.append(df)
+    return dfs
@@ -0,0 +1,54 @@
+import polars as pl
+
+from src.cleaning_rules import CleaningRules
+
+# Reference table mapping each district to its region
+DISTRICT_TO_REGION = {
+    "Bragança": "Norte",
+    "Porto": "Norte",
+    "Braga": "Norte",
+    "Vila Real": "Norte",
+    "Viana do Castelo": "Norte",
+    "Viseu": "Centro",
+    "Aveiro": "Centro",
+    "Leiria": "Centro",
+    "Coimbra": "Centro",
+    "Guarda": "Centro",
+    "Castelo Branco": "Centro",
+    "Santarém": "Centro",
+    "Lisboa": "Lisboa",
+    "Setúbal": "Lisboa",
+    "Évora": "Alentejo",
+    "Portalegre": "Alentejo",
+    "Beja": "Alentejo",
+    "Faro": "Algarve",
+    "Ilha de Santa Maria": "Açores",
+    "Ilha de São Miguel": "Açores",
+    "Ilha Terceira": "Açores",
+    "Ilha do Faial": "Açores",
+    "Ilha das Flores": "Açores",
+    "Ilha de Porto Santo": "Madeira",
+    "Ilha da Madeira": "Madeira",
+}
+
+# Districts with too few listings may be rolled up into their Region
+# (see src/cleaning_rules.py), under a label of the Region
+PARENT_REGION = {
+    **DISTRICT_TO_REGION,
+    **{
+        CleaningRules.ROLLUP_LABEL.format(region): region
+        for region in DISTRICT_TO_REGION.values()
+    },
+}
+
+
+def region_expr(district_col: str = "District") -> pl.Expr:
+    """
+    Native (vectorized) District -> Region expression.
+    Districts missing from the reference table map to null.
+    """
+    return (
+        pl.col(district_col)
+        .replace_strict(PARENT_REGION, default=None, return_dtype=pl.String)
+        .alias("Region")
+    )
@@ -0,0 +1,238 @@
+import os
+from typing import Dict, List, Optional, Union
+
+import polars as pl
+
+import config
+from src.regions import region_expr
+from src.group_stats import GroupStatsStore, get_group_stats
+
+# Clean dataset holding the comparables of each real estate type
+DATASET_PATHS = {
+    "Land": config.LAND_DATA_PATH,
+    "House": config.HOUSE_DATA_PATH,
+    "Apartment": config.APT_DATA_PATH,
+}
+
+
+def load_candidates(source) -> pl.DataFrame:
+    """
+    Load candidate listings from a Polars/pandas DataFrame
+    or from a Parquet or Arrow IPC (.arrow/.ipc/.feather) file.
+    """
+    if isinstance(source, pl.DataFrame):
+        return source
+    if isinstance(source, (str, os.PathLike)):
+        ext = os.path.splitext(str(source))[1].lower()
+        if ext in (".arrow", ".ipc", ".feather"):
+            return pl.read_ipc(source, memory_map=True)
+        return pl.read_parquet(source)
+    return pl.from_pandas(source)
+
+
+def score_listings(
+    candidates,
+    property_type: Optional[str] = None,
+    group_cols: Union[str, List[str]] = config.COMPARABLE_KEYS,
+    stats_path: str = config.CLEAN_STATS_PATH,
+    stats: Optional[GroupStatsStore] = None,
+    min_support: Optional[int] = config.COMPARABLE_MIN_SUPPORT,
+    fair_price: bool = False,
+    models: Optional[Dict[str, object]] = None,
+) -> pl.DataFrame:
+    """
+    Score many candidate listings against their comparable group.
+    The group statistics come from the group statistics store (see
+    src/group_stats.py) saved at `stats_path`, or from `stats` if an
+    already loaded store is given, so no comparable listing is read.
+
+    Candidates need Price, AreaAssigned and the group columns (Region
+    is derived from District if missing), plus a Type column (Land,
+    House, Apartment) unless `property_type` is given. Missing finer
+    group columns (e.g. no City) are treated as unknown, so these
+    candidates are compared with their coarser groups. Returned columns:
+    - PricePerSqm: price per square meter of the candidate
+    - GroupLevel: last group column of the group it is compared with
+    - GroupCount, GroupMedian: size and median PricePerSqm of its group
+    - Percentile: share of the group priced at or below the candidate
+    - BargainScore: relative discount to the group median (> 0 is cheaper)
+    GroupMedian and Percentile are approximate, within the relative
+    accuracy of the quantile sketches (config.SKETCH_RELATIVE_ACCURACY).
+
+    A candidate whose group has fewer than `min_support` comparables is
+    compared with the group one level up instead (e.g. its District,
+    then its Region, for the default group columns), up to the first
+    group column. No back-off is done if `min_support` is None.
+
+    With `fair_price`, the PricePerSqm predicted by the trained model of
+    each type (see models/registry.py, or `models` if already loaded by
+    type) is added as FairPricePerSqm, with the relative discount to it
+    as ModelBargainScore.
+    """
+    if isinstance(group_cols, str):
+        group_cols = [group_cols]
+
+    if stats is None:
+        stats = get_group_stats(stats_path)
+    df = load_candidates(candidates)
+    required = ["Price", "AreaAssigned"] + (["Type"] if property_type is None else [])
+    missing = [column for column in required if column not in df.columns]
+    if missing:
+        raise ValueError(f"Candidates miss the columns {missing}")
+    if (
+        "Region" in group_cols
+        and "Region" not in df.columns
+        and "District" in df.columns
+    ):
+        df = df.with_columns(region_expr("District"))
+    if not any(column in df.columns for column in group_cols):
+        raise ValueError(f"Candidates need at least one of the columns {group_cols}")
+
+    # Missing finer location columns are unknown, so their groups back off
+    df = df.with_columns(
+        pl.lit(None, dtype=pl.String).alias(column)
+        for column in group_cols
+        if column not in df.columns
+    ).with_row_index("_row")
+    if property_type is not None:
+        df = df.with_columns(pl.lit(property_type).alias("Type"))
+    df = df.with_columns(
+        (pl.col("Price") / pl.col("AreaAssigned")).alias("PricePerSqm")
+    )
+
+    # Group columns of each level, finest first (e.g. City, District, Region)
+    levels = [group_cols[:depth] for depth in range(len(group_cols), 0, -1)]
+    if min_support is None:
+        levels = levels[:1]
+
+    scored = []
+    for real_estate_type, group in df.partition_by("Type", as_dict=True).items():
+        real_estate_type = real_estate_type[0]
+        if real_estate_type not in DATASET_PATHS:
+            raise ValueError(f"Unknown real estate type: {real_estate_type}")
+
+        if fair_price:
+            group = _add_fair_price(group, real_estate_type, models)
+
+        valid = (
+            group.filter(pl.col("PricePerSqm").is_not_null())
+            .with_columns(
+                stats.bucket_expr(pl.col("PricePerSqm")).alias("_bucket"),
+                stats.bucket_fraction_expr(pl.col("PricePerSqm")).alias("_fraction"),
+            )
+            .sort("_bucket")
+        )
+        scores = [
+            _group_scores(stats, group, valid, cols, [real_estate_type]).sort("_row")
+            for cols in levels
+        ]
+
+        # The finest level with enough comparables, else the coarsest one
+        def pick(column, values=None):
+            choices = [
+                pl.col(f"{column}_{i}") if values is None else pl.lit(values[i])
+                for i in range(len(levels))
+            ]
+            return pl.coalesce(
+                [
+                    pl.when(pl.col(f"GroupCount_{i}") >= min_support).then(choice)
+                    for i, choice in enumerate(choices[:-1])
+                ]
+                + choices[-1:]
+            ).alias(column)
+
+        combined = pl.concat(
+            [
+                s.drop("_row").rename(lambda c, i=i: f"{c}_{i}")
+                for i, s in enumerate(scores)
+            ],
+            how="horizontal",
+        ).select(
+            pick("GroupLevel", [cols[-1] for cols in levels]),
+            pick("GroupCount"),
+            pick("GroupMedian"),
+            pick("Percentile"),
+        )
+
+        scored.append(
+            pl.concat([group.sort("_row"), combined], how="horizontal").with_columns(
+                (1 - pl.col("PricePerSqm") / pl.col("GroupMedian")).alias(
+                    "BargainScore"
+                )
+            )
+        )
+
+    return pl.concat(scored).sort("_row").drop("_row")
+
+
+def _add_fair_price(group, real_estate_type, loaded=None) -> pl.DataFrame:
+    """
+    Add the model-based fair price of the candidates of one type.
+    """
+    if loaded is None or real_estate_type not in loaded:
+        # The models (and scikit-learn) are only loaded when asked for
+        from models.registry import get_model
+
+        model = get_model(real_estate_type)
+    else:
+        model = loaded[real_estate_type]
+
+    return group.with_columns(
+        pl.Series("FairPricePerSqm", model.predict(group), dtype=pl.Float64)
+    ).with_columns(
+        (1 - pl.col("PricePerSqm") / pl.col("FairPricePerSqm")).alias(
+            "ModelBargainScore"
+        )
+    )
+
+
+def _group_scores(stats, group, valid, group_cols, types) -> pl.DataFrame:
+    """
+    Size, median PricePerSqm and rank of the comparable group (of
+    `group_cols`) of each candidate of `group` (one real estate type).
+    `valid` are its candidates with a price, sorted by sketch bucket.
+    """
+    cumulative = stats.cumulative(group_cols, types=types).select(
+        group_cols
+        + [
+            pl.col("bucket").alias("_ref_bucket"),
+            pl.col("count").alias("_count"),
+            pl.col("cum").alias("_cum"),
+        ]
+    )
+    summary = stats.quantiles(group_cols, 0.5, types=types).rename(
+        {"count": "GroupCount", "quantile": "GroupMedian"}
+    )
+
+    # Number of comparables priced at or below each candidate,
+    # the ones of its own sketch bucket in proportion to its position
+    matched = valid.join_asof(
+        cumulative.sort("_ref_bucket"),
+        left_on="_bucket",
+        right_on="_ref_bucket",
+        by=group_cols,
+        strategy="backward",
+        check_sortedness=False,  # both sides are sorted on the bucket
+    ).select(
+        "_row",
+        (
+            pl.col("_cum")
+            - pl.when(pl.col("_ref_bucket") == pl.col("_bucket"))
+            .then(pl.col("_count") * (1 - pl.col("_fraction")))
+            .otherwise(0)
+        ).alias("_rank"),
+    )
+
+    return (
+        group.select(["_row", "PricePerSqm"] + group_cols)
+        .join(matched, on="_row", how="left")
+        .join(summary, on=group_cols, how="left")
+        .select(
+            "_row",
+            "GroupCount",
+            "GroupMedian",
+            pl.when(pl.col("PricePerSqm").is_not_null())
+            .then(pl.col("_rank").fill_null(0) / pl.col("GroupCount"))
+            .alias("Percentile"),
+        )
+    )
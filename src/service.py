@@ -0,0 +1,230 @@
+"""
+Local HTTP/JSON scoring service.
+
+The clean datasets, the group statistics store, the nearest-comparables
+search structures and the trained models are loaded once at startup and
+kept in memory. New artifacts published by the pipeline are picked up
+without a restart.
+
+Endpoints:
+    GET  /health        status and load time of the artifacts
+    POST /score         {"Type": ..., "District": ..., "Price": ..., ...}
+    POST /score/batch   {"listings": [{...}, ...]}
+    POST /comparables   {"Type": ..., "District": ..., <attributes>, "k": 10}
+
+Usage:
+    python -m src.service --port 8765
+"""
+
+import argparse
+import json
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import polars as pl
+
+import config
+from models.registry import TrainedModel, model_path
+from src.group_stats import get_group_stats
+from src.logger import PyLogger
+from src.nearest_comparables import get_nearest_comparables
+from src.scoring import DATASET_PATHS, score_listings
+from src.storage import dataset_exists, resolve_dataset
+
+# Setup logger
+logger = PyLogger(log_to_file=True, file_path="cribs", stage="service")
+
+
+def artifact_version():
+    """
+    Modification times of the artifacts served, to detect new ones.
+    """
+    paths = [config.CLEAN_STATS_PATH]
+    paths += [resolve_dataset(path) for path in DATASET_PATHS.values()]
+    paths += [model_path(property_type) for property_type in DATASET_PATHS]
+    return tuple(os.stat(p).st_mtime_ns if os.path.exists(p) else None for p in paths)
+
+
+class ServiceState:
+    """
+    Everything the requests are served from. A reload builds a new
+    state and swaps it in whole, so a request never sees a mix of
+    old and new artifacts.
+    """
+
+    def __init__(self):
+        self.version = artifact_version()
+        self.stats = get_group_stats(config.CLEAN_STATS_PATH)
+        self.nearest = {
+            property_type: get_nearest_comparables(property_type)
+            for property_type, path in DATASET_PATHS.items()
+            if dataset_exists(path)
+        }
+        self.models = {
+            property_type: TrainedModel.load(model_path(property_type))
+            for property_type in DATASET_PATHS
+            if os.path.exists(model_path(property_type))
+        }
+        self.loaded_at = time.time()
+
+
+class ScoringServer(ThreadingHTTPServer):
+    """
+    Threaded HTTP server (one thread per connection) holding the state
+    and a watcher thread that reloads it when the artifacts change.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, address, reload_interval=config.SERVICE_RELOAD_INTERVAL):
+        super().__init__(address, ScoringHandler)
+        self.state = ServiceState()
+        self.reload_interval = reload_interval
+        self._stopped = threading.Event()
+        self._watcher = threading.Thread(target=self._watch, daemon=True)
+        self._watcher.start()
+
+    def _watch(self):
+        while not self._stopped.wait(self.reload_interval):
+            if artifact_version() == self.state.version:
+                continue
+            try:
+                self.state = ServiceState()
+                logger.info("Reloaded the scoring artifacts")
+            except Exception as e:
+                # e.g. a dataset still being written, retried on the next check
+                logger.warning(f"Could not reload the scoring artifacts: {e}")
+
+    def server_close(self):
+        self._stopped.set()
+        super().server_close()
+
+
+def _score(state, candidates):
+    """
+    Score candidates, with the model-based fair price when every
+    type among them has a trained model.
+    """
+    types = set(candidates["Type"]) if "Type" in candidates.columns else set()
+    return score_listings(
+        candidates,
+        stats=state.stats,
+        fair_price=bool(types) and types <= set(state.models),
+        models=state.models,
+    )
+
+
+class ScoringHandler(BaseHTTPRequestHandler):
+    server_version = "cribs"
+
+    def do_GET(self):
+        if self.path != "/health":
+            return self._send(404, {"error": f"Unknown path: {self.path}"})
+
+        state = self.server.state
+        self._send(
+            200,
+            {
+                "status": "ok",
+                "loaded_at": state.loaded_at,
+                "types": sorted(state.nearest),
+                "models": {
+                    property_type: model.metadata["version"]
+                    for property_type, model in state.models.items()
+                },
+            },
+        )
+
+    def do_POST(self):
+        routes = {
+            "/score": self._score,
+            "/score/batch": self._score_batch,
+            "/comparables": self._comparables,
+        }
+        if self.path not in routes:
+            return self._send(404, {"error": f"Unknown path: {self.path}"})
+
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            body = json.loads(self.rfile.read(length) or b"{}")
+            self._send(200, routes[self.path](self.server.state, body))
+        except pl.exceptions.PolarsError as e:
+            # Polars messages describe the internal query, not the request
+            logger.warning(f"Request to {self.path} rejected: {e!r}")
+            self._send(400, {"error": f"Invalid listing data ({type(e).__name__})"})
+        except (ValueError, KeyError, TypeError) as e:
+            self._send(400, {"error": str(e)})
+        except Exception as e:
+            logger.error(f"Request to {self.path} failed: {e!r}")
+            self._send(500, {"error": "Internal error"})
+
+    ###################
+    # -- Endpoints -- #
+    ###################
+    @staticmethod
+    def _score(state, listing):
+        return _score(state, pl.DataFrame([listing])).row(0, named=True)
+
+    @staticmethod
+    def _score_batch(state, body):
+        listings = body["listings"]
+        if not listings:
+            return {"scores": []}
+        return {"scores": _score(state, pl.DataFrame(listings)).to_dicts()}
+
+    @staticmethod
+    def _comparables(state, body):
+        listing = dict(body)
+        k = int(listing.pop("k", config.KNN_K))
+        nearest = state.nearest.get(listing.get("Type"))
+        if nearest is None:
+            raise ValueError(f"Unknown real estate type: {listing.get('Type')}")
+        return {"comparables": nearest.query(listing, k=k).to_dicts()}
+
+    #################
+    # -- Helpers -- #
+    #################
+    def _send(self, status, payload):
+        data = json.dumps(payload, default=str).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        logger.debug(format % args, client=self.client_address[0])
+
+
+def serve(
+    host=config.SERVICE_HOST,
+    port=config.SERVICE_PORT,
+    reload_interval=config.SERVICE_RELOAD_INTERVAL,
+):
+    """
+    Load the artifacts and serve requests until interrupted.
+    """
+    server = ScoringServer((host, port), reload_interval=reload_interval)
+    logger.info(f"Scoring service listening on http://{host}:{port}")
+    print(f"Scoring service listening on http://{host}:{port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        logger.flush()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local scoring service")
+    parser.add_argument("--host", default=config.SERVICE_HOST)
+    parser.add_argument("--port", type=int, default=config.SERVICE_PORT)
+    parser.add_argument(
+        "--reload-interval", type=float, default=config.SERVICE_RELOAD_INTERVAL
+    )
+    args = parser.parse_args()
+
+    serve(args.host, args.port, args.reload_interval)
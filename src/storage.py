@@ -0,0 +1,123 @@
+import glob
+import os
+import shutil
+from typing import Dict, Iterator, List, Optional, Union
+
+import polars as pl
+
+import config
+
+
+def csv_export_path(path: str) -> str:
+    """
+    CSV export path of a dataset, e.g. `house-data.parquet` -> `house-data.csv`.
+    """
+    return f"{os.path.splitext(path)[0]}.csv"
+
+
+def write_dataset(
+    df: Union[pl.DataFrame, pl.LazyFrame],
+    path: str,
+    partition_by: Optional[List[str]] = config.PARTITION_COLS,
+    export_csv: bool = config.EXPORT_CSV,
+):
+    """
+    Write a clean dataset as typed, zstd-compressed Parquet, partitioned
+    (hive style) by `partition_by`. The dataset is written next to `path`
+    first and swapped in afterwards, so readers never see a partial write.
+    A LazyFrame is streamed into the files batch by batch, without
+    collecting it in memory first.
+    """
+    tmp_path = f"{path}.tmp"
+    shutil.rmtree(tmp_path, ignore_errors=True)
+
+    if isinstance(df, pl.LazyFrame):
+        target = (
+            pl.PartitionBy(tmp_path, key=partition_by) if partition_by else tmp_path
+        )
+        df.sink_parquet(target, compression="zstd", mkdir=True, engine="streaming")
+    elif partition_by:
+        df.write_parquet(tmp_path, compression="zstd", partition_by=partition_by)
+    else:
+        df.write_parquet(tmp_path, compression="zstd")
+
+    if os.path.isdir(path):
+        shutil.rmtree(path)
+    elif os.path.exists(path):
+        os.remove(path)
+    os.replace(tmp_path, path)
+
+    # Optional CSV export (e.g. for spreadsheets)
+    if export_csv and isinstance(df, pl.LazyFrame):
+        scan_dataset(path).sink_csv(csv_export_path(path), engine="streaming")
+    elif export_csv:
+        df.write_csv(csv_export_path(path), separator=",")
+
+
+def resolve_dataset(path: str) -> str:
+    """
+    Path a clean dataset is read from: the Parquet dataset, or its
+    CSV export if the Parquet dataset was never built.
+    """
+    return path if os.path.exists(path) else csv_export_path(path)
+
+
+def dataset_exists(path: str) -> bool:
+    """
+    Whether a clean dataset (or its CSV export) exists.
+    """
+    return os.path.exists(resolve_dataset(path))
+
+
+def scan_dataset(
+    path: str,
+    columns: Optional[List[str]] = None,
+    filters: Optional[Dict[str, object]] = None,
+) -> pl.LazyFrame:
+    """
+    Lazily scan a clean dataset.
+    `filters` maps a column to a value or list of values; filters on
+    partition columns prune whole files, the others are pushed into the
+    Parquet reader together with the `columns` projection. Local files
+    are memory-mapped by the Polars reader.
+    Falls back to the CSV export if the Parquet dataset was never built.
+    """
+    source = resolve_dataset(path)
+    if source == path:
+        lf = pl.scan_parquet(path, hive_partitioning=os.path.isdir(path))
+    else:
+        lf = pl.scan_csv(source)
+
+    for column, value in (filters or {}).items():
+        if isinstance(value, list):
+            lf = lf.filter(pl.col(column).is_in(value))
+        else:
+            lf = lf.filter(pl.col(column) == value)
+
+    if columns is not None:
+        lf = lf.select(columns)
+
+    return lf
+
+
+def read_dataset(
+    path: str,
+    columns: Optional[List[str]] = None,
+    filters: Optional[Dict[str, object]] = None,
+    to_pandas: bool = False,
+):
+    """
+    Read a clean dataset (see `scan_dataset`), as Polars or pandas.
+    """
+    df = scan_dataset(path, columns=columns, filters=filters).collect()
+    return df.to_pandas() if to_pandas else df
+
+
+def iter_partitions(path: str) -> Iterator[pl.DataFrame]:
+    """
+    Read a partitioned Parquet dataset one partition at a time
+    (the partition columns are stored in its files).
+    """
+    files = glob.glob(os.path.join(path, "**", "*.parquet"), recursive=True)
+    for directory in sorted({os.path.dirname(file) for file in files}):
+        yield pl.read_parquet(os.path.join(directory, "*.parquet"))
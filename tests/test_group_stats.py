@@ -0,0 +1,35 @@
+import numpy as np
+import polars as pl
+
+import config
+from src.group_stats import GroupStatsStore
+
+
+def test_sketch_quantiles_within_relative_accuracy():
+    rng = np.random.default_rng(0)
+    n_rows = 20_000
+    df = pl.DataFrame(
+        {
+            "Type": rng.choice(["House", "Apartment"], n_rows),
+            "District": rng.choice(["Lisboa", "Porto", "Faro"], n_rows),
+            "City": rng.choice(["A", "B", "C", "D"], n_rows),
+            "PricePerSqm": rng.lognormal(7.5, 0.6, n_rows),
+        }
+    )
+    store = GroupStatsStore.from_frame(df)
+    accuracy = config.SKETCH_RELATIVE_ACCURACY
+
+    for group_cols in (["Type"], ["Type", "District"], ["District", "City"]):
+        for q in (0.05, 0.25, 0.5, 0.75, 0.95):
+            estimated = store.quantiles(group_cols, q=q)
+            exact = df.group_by(group_cols).agg(
+                pl.len().alias("exact_count"),
+                pl.col("PricePerSqm")
+                .quantile(q, interpolation="linear")
+                .alias("exact"),
+            )
+            both = estimated.join(exact, on=group_cols)
+            assert both.height == exact.height
+            assert (both["count"] == both["exact_count"]).all()
+            error = (both["quantile"] - both["exact"]).abs() / both["exact"]
+            assert error.max() <= accuracy + 1e-9, (group_cols, q)
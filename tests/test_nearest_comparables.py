@@ -0,0 +1,51 @@
+import numpy as np
+import polars as pl
+
+from src.nearest_comparables import NearestComparables
+from src.regions import DISTRICT_TO_REGION
+
+
+def _listings(n_rows, seed):
+    rng = np.random.default_rng(seed)
+    districts = ["Lisboa", "Setúbal", "Porto", "Braga", "Faro"]
+    district = rng.choice(districts, n_rows)
+    return pl.DataFrame(
+        {
+            "District": district,
+            "City": [f"{d}-{c}" for d, c in zip(district, rng.integers(0, 4, n_rows))],
+            "AreaAssigned": rng.lognormal(4.5, 0.5, n_rows),
+            "RoomsAssigned": rng.integers(0, 6, n_rows),
+            "PricePerSqm": rng.lognormal(7.5, 0.5, n_rows),
+        }
+    ).with_columns(
+        pl.col("District").replace_strict(DISTRICT_TO_REGION).alias("Region")
+    )
+
+
+def _brute_force(comparables, listing, k):
+    # Distance of the listing to every indexed listing
+    X = comparables._transform(comparables.df.select(comparables.features).to_numpy())
+    x = comparables._transform([[listing[f] for f in comparables.features]])
+    attributes = np.sqrt((((X - x) / comparables.std) ** 2).sum(axis=1))
+    location = (
+        DISTRICT_TO_REGION[listing["District"]],
+        listing["District"],
+        listing["City"],
+    )
+    penalty = comparables._penalty(np.arange(len(X)), location)
+    return np.sort(np.sqrt(attributes**2 + penalty**2))[:k]
+
+
+def test_query_matches_brute_force():
+    comparables = NearestComparables(
+        _listings(3_000, seed=0), ["AreaAssigned", "RoomsAssigned"]
+    )
+    queries = _listings(50, seed=1).to_dicts()
+
+    for k in (1, 5, 20):
+        for listing in queries:
+            found = comparables.query(listing, k=k)
+            assert found.height == k
+            np.testing.assert_allclose(
+                found["Distance"].to_numpy(), _brute_force(comparables, listing, k)
+            )
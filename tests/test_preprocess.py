@@ -0,0 +1,27 @@
+import config
+from benchmarks.synthetic import write_raw_listings
+from s01_preprocess import preprocess_pipeline
+from src.storage import read_dataset
+
+
+def _outputs():
+    frames = {}
+    for path in [config.BUILD_DATA_PATH, config.LAND_DATA_PATH]:
+        df = read_dataset(path)
+        frames[path] = df.select(sorted(df.columns)).sort(sorted(df.columns))
+    return frames
+
+
+def test_streaming_matches_eager(tmp_path, monkeypatch):
+    # The dataset paths in config.py are relative to the working directory
+    monkeypatch.chdir(tmp_path)
+    write_raw_listings(20_000, config.RAW_DATA_PATH)
+
+    preprocess_pipeline(streaming=False)
+    eager = _outputs()
+    preprocess_pipeline(streaming=True)
+    streaming = _outputs()
+
+    for path, df in eager.items():
+        assert df.height > 0
+        assert df.equals(streaming[path]), path
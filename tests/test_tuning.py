@@ -0,0 +1,63 @@
+import numpy as np
+import pandas as pd
+
+import config
+from models import tuning
+from src.folds import FoldSplit, dataset_digest, save_fold_indices
+
+
+def _split(tmp_path, n_rows=300, n_folds=3):
+    rng = np.random.default_rng(0)
+    df = pd.DataFrame(
+        {
+            "District": rng.choice(["Lisboa", "Porto", "Faro"], n_rows),
+            "AreaAssigned": rng.lognormal(4.5, 0.5, n_rows),
+            "RoomsAssigned": rng.integers(0, 6, n_rows).astype(float),
+        }
+    )
+    df["PricePerSqm"] = 2000 + 5 * df["AreaAssigned"] + rng.normal(0, 100, n_rows)
+
+    folds = np.array_split(rng.permutation(n_rows), n_folds)
+    train_idx = [
+        np.sort(np.concatenate(folds[:i] + folds[i + 1 :])) for i in range(n_folds)
+    ]
+    path = tmp_path / "folds.npz"
+    save_fold_indices(
+        path, train_idx, folds, np.arange(0), dataset_digest(df), data_path=None
+    )
+    return FoldSplit(path, df=df)
+
+
+def _search(split):
+    return tuning.successive_halving(
+        "gradient_boosting", split, "Land", n_configs=3, eta=3, min_fraction=1 / 3
+    )
+
+
+def test_search_resumes_from_the_store(tmp_path, monkeypatch):
+    monkeypatch.setattr(config, "TUNING_DIR", str(tmp_path / "tuning"))
+    split = _split(tmp_path)
+    path = tuning.store_path("gradient_boosting", "Land")
+
+    first = _search(split)
+    records = tuning.read_store(path)
+    n_evaluations = len(records)  # 3 configs x 3 folds, then 1 config x 3 folds
+    assert n_evaluations == 12
+
+    # Interrupted after half of the evaluations, in the middle of a write
+    with open(path) as f:
+        lines = f.readlines()
+    with open(path, "w") as f:
+        f.writelines(lines[: n_evaluations // 2])
+        f.write(lines[n_evaluations // 2][:20])
+
+    resumed = _search(split)
+    records = tuning.read_store(path)
+    keys = {(r["config_id"], r["rung"], r["fold"]) for r in records}
+    assert len(records) == len(keys) == n_evaluations
+    assert resumed["best"]["config_id"] == first["best"]["config_id"]
+    assert resumed["best"]["rmse"] == first["best"]["rmse"]
+
+    # Nothing is left to evaluate once the store is complete
+    _search(split)
+    assert len(tuning.read_store(path)) == n_evaluations